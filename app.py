@@ -16,8 +16,9 @@ st.set_page_config(
 
 # Importar modulos core
 from core.styles import apply_styles
-from core.config import PRACTICAS, CATEGORIAS, APP_INFO
+from core.config import PRACTICAS, APP_INFO
 from core.ai_client import init_ai
+from core import registry
 from core.auth import (
     mostrar_login,
     verificar_autenticacion,
@@ -57,9 +58,12 @@ if not verificar_autenticacion():
 
 # ==================== USUARIO AUTENTICADO ====================
 
-# Inicializar IA
+# Inicializar IA (el motor se crea una sola vez por proceso)
 ai_ready = init_ai()
 
+# Importar en segundo plano las practicas mas usadas
+registry.precargar()
+
 # Inicializar estado con query params
 if 'practica_sel' not in st.session_state:
     st.session_state.practica_sel = get_initial_page()
@@ -112,26 +116,11 @@ with st.sidebar:
         cerrar_sesion()
         st.rerun()
 
-
-    # ===== AUTOGESTIÓN Y FOCO =====
-    st.markdown("<p class='cat-title'>Autogestión y Foco</p>", unsafe_allow_html=True)
-    for p in CATEGORIAS["autogestion"]["practicas"]:
-        render_menu_item(p)
-
-    # ===== COORDINACIÓN IMPECABLE =====
-    st.markdown("<p class='cat-title'>Coordinación Impecable</p>", unsafe_allow_html=True)
-    for p in CATEGORIAS["coordinacion"]["practicas"]:
-        render_menu_item(p)
-
-    # ===== DESARROLLO DE OTROS =====
-    st.markdown("<p class='cat-title'>Desarrollo de Otros</p>", unsafe_allow_html=True)
-    for p in CATEGORIAS["desarrollo"]["practicas"]:
-        render_menu_item(p)
-
-    # ===== ESTRATEGIA Y RELACIONES =====
-    st.markdown("<p class='cat-title'>Estrategia y Relaciones</p>", unsafe_allow_html=True)
-    for p in CATEGORIAS["estrategia"]["practicas"]:
-        render_menu_item(p)
+    # ===== PRACTICAS POR CATEGORIA =====
+    for nombre, practicas in registry.menu():
+        st.markdown(f"<p class='cat-title'>{nombre}</p>", unsafe_allow_html=True)
+        for p in practicas:
+            render_menu_item(p)
 
 
 # ==================== CONTENIDO PRINCIPAL ====================
@@ -141,59 +130,14 @@ if not ai_ready:
 
 practica_seleccionada = st.session_state.practica_sel
 
-# Importar y mostrar la practica seleccionada
-if practica_seleccionada == "introduccion":
-    from practicas.introduccion import render
-    render()
-elif practica_seleccionada == "priorizador_tareas":
-    from practicas.priorizador_tareas import render
-    render()
-elif practica_seleccionada == "planificador_reuniones":
-    from practicas.planificador_reuniones import render
-    render()
-elif practica_seleccionada == "pedidos_impecables":
-    from practicas.pedidos_impecables import render
-    render()
-elif practica_seleccionada == "delegacion_situacional":
-    from practicas.delegacion_situacional import render
-    render()
-elif practica_seleccionada == "correos_diplomaticos":
-    from practicas.correos_diplomaticos import render
-    render()
-elif practica_seleccionada == "seguimiento_compromisos":
-    from practicas.seguimiento_compromisos import render
-    render()
-elif practica_seleccionada == "escucha_activa":
-    from practicas.escucha_activa import render
-    render()
-elif practica_seleccionada == "feedback_constructivo":
-    from practicas.feedback_constructivo import render
-    render()
-elif practica_seleccionada == "evaluacion_desempeno":
-    from practicas.evaluacion_desempeno import render
-    render()
-elif practica_seleccionada == "negociador_harvard":
-    from practicas.negociador_harvard import render
-    render()
-elif practica_seleccionada == "presentacion_inspiradora":
-    from practicas.presentacion_inspiradora import render
-    render()
-elif practica_seleccionada == "preguntas_desafiantes":
-    from practicas.preguntas_desafiantes import render
-    render()
-elif practica_seleccionada == "definicion_objetivos":
-    from practicas.definicion_objetivos import render
-    render()
-elif practica_seleccionada == "disculpas_efectivas":
-    from practicas.disculpas_efectivas import render
-    render()
-elif practica_seleccionada == "admin_panel":
+# Mostrar la practica seleccionada (el modulo se importa una vez por proceso)
+if practica_seleccionada in registry.SOLO_ADMIN:
     user_role = st.session_state.get('user_role', {})
-    if user_role.get('tipo') == 'empresa_admin':
-        from practicas.admin_panel import render
-        render()
-    else:
+    if user_role.get('tipo') != 'empresa_admin':
         seleccionar("introduccion")
         st.rerun()
+
+if registry.modulo(practica_seleccionada):
+    registry.render(practica_seleccionada)
 else:
     st.markdown('<div class="custom-warning">Practica no disponible</div>', unsafe_allow_html=True)
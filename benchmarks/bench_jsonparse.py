@@ -0,0 +1,163 @@
+"""
+Micro-benchmark de core.jsonparse.limpiar_json contra las versiones que
+tenian las practicas (json.loads directo y el respaldo con regex de
+escucha_activa).
+
+Uso:
+    python benchmarks/bench_jsonparse.py [--repeticiones N]
+
+Por cada tamano de respuesta y tipo de defecto informa el tiempo medio
+por llamada (microsegundos) y si la respuesta se pudo recuperar. Antes
+verifica el resultado exacto de limpiar_json en casos borde (sale con
+codigo 1 si alguno falla).
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.jsonparse import limpiar_json  # noqa: E402
+
+
+# ==================== IMPLEMENTACIONES ANTERIORES ====================
+
+def limpiar_json_simple(texto):
+    """La de 13 practicas."""
+    try:
+        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
+        return json.loads(texto_limpio)
+    except:  # noqa: E722
+        return None
+
+
+def limpiar_json_regex(texto):
+    """La de escucha_activa."""
+    try:
+        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
+        return json.loads(texto_limpio)
+    except:  # noqa: E722
+        match = re.search(r'(\{.*\}|\[.*\])', texto, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except:  # noqa: E722
+                return None
+        return None
+
+
+IMPLEMENTACIONES = {
+    "simple": limpiar_json_simple,
+    "regex": limpiar_json_regex,
+    "jsonparse": limpiar_json
+}
+
+
+# ==================== CASOS ====================
+
+def respuesta(campos, largo):
+    """Objeto como el de las practicas con `campos` textos de ~largo caracteres."""
+    frase = "Reconoce lo que la otra persona siente antes de proponer algo. "
+    texto = (frase * (largo // len(frase) + 1))[:largo]
+    return {f"campo_{i}": texto for i in range(campos)}
+
+
+def casos(largo):
+    """
+    Returns:
+        dict: caso -> (texto, esperado); esperado None acepta cualquier
+            objeto (ej: respuestas truncadas)
+    """
+    data = respuesta(4, largo)
+    valido = json.dumps(data, ensure_ascii=False, indent=2)
+    con_cerco = dict(data, campo_0="Ejemplo:\n```python\nprint(1)\n```\n" + data["campo_0"])
+    return {
+        "valido": (valido, data),
+        "cercado": (f"```json\n{valido}\n```", data),
+        "con_texto": (f"Aqui tienes el resultado:\n{valido}\nEspero que te sirva.", data),
+        "coma_colgante": (valido[:-2] + ",\n}", data),
+        "salto_sin_escapar": (valido.replace(". ", ".\n", 3), json.loads(valido.replace(". ", ".\\n", 3))),
+        "truncado": (valido[:int(len(valido) * 0.8)], None),
+        # Muchas llaves sin cerrar: peor caso del regex con backtracking
+        "llaves_sueltas": ("{ " * (largo // 8) + valido[:len(valido) // 2], None),
+        # Llaves o corchetes en el texto previo al JSON
+        "llave_en_texto": (f"Nota {{importante}} aqui: {valido}", data),
+        "corchete_en_texto": (f"Ver [1] abajo:\n{valido}", data),
+        # ``` dentro de un string, con cerco y texto alrededor
+        "cerco_en_cadena": (
+            f"Resultado:\n```json\n{json.dumps(con_cerco, ensure_ascii=False)}\n```\nListo.",
+            con_cerco
+        )
+    }
+
+
+ESQUEMA = {"type": "object", "required": ["a"]}
+
+# (texto, esquema, resultado esperado de limpiar_json)
+VERIFICACION = [
+    ('Nota {importante} aqui: {"a": "x"}', None, {"a": "x"}),
+    ('Nota {importante} aqui: {"a": "x"}', ESQUEMA, {"a": "x"}),
+    ('ver [1] abajo {"a":"x"}', None, {"a": "x"}),
+    ('ver [1] abajo {"a":"x"}', ESQUEMA, {"a": "x"}),
+    ('ver [1] abajo', None, [1]),
+    ('ver [1] abajo', ESQUEMA, None),
+    ('{"a": "usa ```python\\nx\\n``` asi"}', ESQUEMA, {"a": "usa ```python\nx\n``` asi"}),
+    ('```json\n{"a": "fin ```"}\n```', ESQUEMA, {"a": "fin ```"}),
+    ('Aqui:\n```json\n{"a": 1,}\n```\nListo', ESQUEMA, {"a": 1}),
+    ('{"b": {"a": 1}', ESQUEMA, None),
+]
+
+
+def verificar():
+    """Retorna la cantidad de casos de VERIFICACION que fallan"""
+    fallos = 0
+    for texto, esquema, esperado in VERIFICACION:
+        obtenido = limpiar_json(texto, esquema)
+        if obtenido != esperado:
+            fallos += 1
+            print(f"FALLA {texto!r} (esquema={bool(esquema)}): {obtenido!r} != {esperado!r}")
+    print(f"verificacion: {len(VERIFICACION) - fallos}/{len(VERIFICACION)}")
+    return fallos
+
+
+def medir(fn, texto, repeticiones):
+    tiempo = min(timeit.repeat(lambda: fn(texto), number=repeticiones, repeat=3))
+    return tiempo / repeticiones * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeticiones", type=int, default=50)
+    parser.add_argument("--largos", type=int, nargs="+", default=[200, 2000, 20000])
+    args = parser.parse_args()
+
+    if verificar():
+        sys.exit(1)
+    print()
+
+    nombres = list(IMPLEMENTACIONES)
+    print(f"{'largo':>6} {'caso':<18}" + "".join(f"{n:>16}" for n in nombres))
+    recuperados = {n: 0 for n in nombres}
+    total = 0
+    for largo in args.largos:
+        for caso, (texto, esperado) in casos(largo).items():
+            total += 1
+            fila = f"{largo:>6} {caso:<18}"
+            for nombre in nombres:
+                fn = IMPLEMENTACIONES[nombre]
+                valor = fn(texto)
+                ok = isinstance(valor, dict) and (esperado is None or valor == esperado)
+                recuperados[nombre] += ok
+                us = medir(fn, texto, args.repeticiones)
+                fila += f"{us:>13.1f}us{'+' if ok else '-'}"
+            print(fila)
+    print()
+    print("recuperados: " + ", ".join(f"{n} {recuperados[n]}/{total}" for n in nombres))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Backends de IA para YoCreo Suite
+- GeminiBackend: google.generativeai (produccion)
+- FakeBackend: respuestas locales deterministas para benchmarks y pruebas
+  de carga sin red ni costo
+
+Ambos entregan modelos con la interfaz de genai.GenerativeModel que usa
+AIEngine: generate_content(prompt, stream=, request_options=) y respuestas
+con text, usage_metadata y candidates[0].finish_reason.
+"""
+
+import datetime
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from google.api_core import exceptions as gexc
+
+logger = logging.getLogger(__name__)
+
+
+def _tokens(texto):
+    """Aproximacion de Gemini: ~4 caracteres por token"""
+    return max(1, math.ceil(len(texto) / 4))
+
+
+class GeminiBackend:
+    """
+    Backend real: configura genai una sola vez por proceso.
+    Las instrucciones de sistema de al menos `context_cache_min_tokens`
+    (minimo que acepta la API) se suben una vez como contexto cacheado;
+    las mas cortas viajan en cada llamada y quedan a cargo del cache
+    implicito de Gemini.
+    """
+
+    nombre = "gemini"
+
+    def __init__(self, api_key, context_cache_min_tokens=1024, context_cache_ttl_seconds=3600):
+        import google.generativeai as genai
+        self._genai = genai
+        self.context_cache_min_tokens = context_cache_min_tokens
+        self.context_cache_ttl_seconds = context_cache_ttl_seconds
+        genai.configure(api_key=api_key)
+
+    def model(self, model_name, config, system_instruction=None):
+        """
+        Construye un GenerativeModel.
+
+        Args:
+            model_name: Nombre del modelo
+            config: dict de GenerationConfig (max_output_tokens, response_schema...)
+            system_instruction: Parte fija del prompt (opcional)
+        """
+        if (system_instruction and self.context_cache_min_tokens
+                and _tokens(system_instruction) >= self.context_cache_min_tokens):
+            return _ModeloConContexto(self, model_name, config, system_instruction)
+        return self._genai.GenerativeModel(
+            model_name,
+            generation_config=self._genai.types.GenerationConfig(**config),
+            system_instruction=system_instruction
+        )
+
+
+class _ModeloConContexto:
+    """
+    GenerativeModel sobre un CachedContent con la instruccion de sistema.
+    Renueva el contexto antes de que expire; si la API lo rechaza se
+    queda con un modelo normal.
+    """
+
+    def __init__(self, backend, model_name, config, system_instruction):
+        self.backend = backend
+        self.model_name = model_name
+        self.config = config
+        self.system_instruction = system_instruction
+        self._lock = threading.Lock()
+        self._model = None
+        self._renovar_en = 0.0
+        self._sin_cache = False
+
+    def _modelo(self):
+        genai = self.backend._genai
+        with self._lock:
+            if self._model is not None and (self._sin_cache or time.monotonic() < self._renovar_en):
+                return self._model
+            generation_config = genai.types.GenerationConfig(**self.config)
+            ttl = self.backend.context_cache_ttl_seconds
+            try:
+                cached = genai.caching.CachedContent.create(
+                    model=self.model_name,
+                    system_instruction=self.system_instruction,
+                    ttl=datetime.timedelta(seconds=ttl)
+                )
+                self._model = genai.GenerativeModel.from_cached_content(
+                    cached, generation_config=generation_config
+                )
+                self._renovar_en = time.monotonic() + ttl * 0.9
+            except Exception as e:
+                logger.warning("No se pudo crear el contexto cacheado de %s: %s", self.model_name, e)
+                self._sin_cache = True
+                self._model = genai.GenerativeModel(
+                    self.model_name,
+                    generation_config=generation_config,
+                    system_instruction=self.system_instruction
+                )
+            return self._model
+
+    def generate_content(self, prompt, **kwargs):
+        return self._modelo().generate_content(prompt, **kwargs)
+
+
+# ==================== BACKEND LOCAL ====================
+
+# Errores que simula el backend local (todos reintentables)
+ERRORES_SIMULADOS = {
+    "ResourceExhausted": gexc.ResourceExhausted,
+    "ServiceUnavailable": gexc.ServiceUnavailable,
+    "InternalServerError": gexc.InternalServerError
+}
+
+FRASES = (
+    "Reconoce lo que la otra persona siente antes de proponer algo.",
+    "Describe los hechos concretos sin juicios ni adjetivos.",
+    "Acuerda un siguiente paso claro, con responsable y fecha.",
+    "Pregunta que necesita la otra persona para comprometerse.",
+    "Cierra confirmando lo acordado en una sola frase."
+)
+
+NOMBRES = ("Camila", "Jorge", "Valentina", "Martin", "Daniela", "Ricardo")
+
+
+def _semilla(*partes):
+    h = hashlib.sha256("\x00".join(str(p) for p in partes).encode("utf-8"))
+    return int.from_bytes(h.digest()[:8], "big")
+
+
+def valor_desde_schema(schema, rng, nombre="campo"):
+    """
+    Genera un valor que cumple el schema (subconjunto usado por las
+    practicas: object, array, string, integer, number, boolean).
+    """
+    tipo = str(schema.get("type", "string")).lower()
+    if tipo == "object":
+        return {
+            campo: valor_desde_schema(sub, rng, campo)
+            for campo, sub in schema.get("properties", {}).items()
+        }
+    if tipo == "array":
+        minimo = schema.get("min_items", schema.get("minItems", 3))
+        return [
+            valor_desde_schema(schema.get("items", {}), rng, nombre)
+            for _ in range(max(1, minimo))
+        ]
+    if tipo == "integer":
+        return rng.randint(1, 10)
+    if tipo == "number":
+        return round(rng.uniform(1, 10), 1)
+    if tipo == "boolean":
+        return rng.random() < 0.5
+    if schema.get("enum"):
+        return rng.choice(schema["enum"])
+    if nombre == "nombre":
+        return rng.choice(NOMBRES)
+    frases = rng.sample(FRASES, rng.randint(2, len(FRASES)))
+    return f"{nombre.replace('_', ' ').capitalize()}: " + " ".join(frases)
+
+
+class _FakeModel:
+    """Modelo local con la interfaz de genai.GenerativeModel."""
+
+    def __init__(self, backend, model_name, config, system_instruction=None):
+        self.backend = backend
+        self.model_name = model_name
+        self.config = config
+        self.system_instruction = system_instruction
+
+    def _respuesta(self, prompt):
+        rng = random.Random(_semilla(
+            self.model_name, self.config.get("response_schema"), self.system_instruction, prompt
+        ))
+        schema = self.config.get("response_schema")
+        if schema:
+            texto = json.dumps(valor_desde_schema(schema, rng), ensure_ascii=False)
+        else:
+            texto = " ".join(rng.sample(FRASES, len(FRASES)))
+
+        finish = "STOP"
+        limite = self.config.get("max_output_tokens")
+        if limite and _tokens(texto) > limite:
+            texto = texto[:limite * 4]
+            finish = "MAX_TOKENS"
+        return texto, finish
+
+    def _fragmento(self, texto, prompt, salida=None, finish=None):
+        chunk = SimpleNamespace(text=texto, usage_metadata=None, candidates=[])
+        if finish:
+            # La instruccion de sistema se reporta como ya cacheada (cache implicito)
+            cacheados = _tokens(self.system_instruction) if self.system_instruction else 0
+            prompt_tokens = _tokens(prompt) + cacheados
+            output_tokens = _tokens(salida)
+            chunk.usage_metadata = SimpleNamespace(
+                prompt_token_count=prompt_tokens,
+                cached_content_token_count=cacheados,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens
+            )
+            chunk.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name=finish))]
+        return chunk
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        timeout = (request_options or {}).get("timeout")
+        latencia, ttft, error = self.backend.sortear()
+        texto, finish = self._respuesta(prompt)
+
+        if not stream:
+            self.backend.esperar(latencia, timeout)
+            if error:
+                raise error
+            return self._fragmento(texto, prompt, texto, finish)
+        return self._stream(prompt, texto, finish, ttft, latencia, timeout, error)
+
+    def _stream(self, prompt, texto, finish, ttft, latencia, timeout, error):
+        self.backend.esperar(ttft, timeout)
+        if error:
+            raise error
+        paso = self.backend.chunk_chars
+        partes = [texto[i:i + paso] for i in range(0, len(texto), paso)] or [""]
+        pausa = max(0.0, latencia - ttft) / len(partes)
+        for i, parte in enumerate(partes):
+            if i:
+                time.sleep(pausa)
+            ultimo = i == len(partes) - 1
+            yield self._fragmento(parte, prompt, texto, finish if ultimo else None)
+
+
+class FakeBackend:
+    """
+    Backend local determinista: mismo prompt y schema, misma respuesta.
+    Las respuestas cumplen el response_schema de cada practica. Latencia
+    log-normal definida por p50/p95, tiempo al primer fragmento, tamano
+    de fragmento del stream y tasa de errores transitorios configurables.
+    """
+
+    nombre = "fake"
+
+    def __init__(self, latency_ms_p50=1200, latency_ms_p95=4000, ttft_ms=400,
+                 chunk_chars=40, error_rate=0.0, errors=("ServiceUnavailable",), seed=0):
+        self.mu = math.log(max(latency_ms_p50, 1) / 1000)
+        # p95 de la log-normal = mediana * exp(1.645 * sigma)
+        self.sigma = max(0.0, math.log(max(latency_ms_p95, latency_ms_p50) / max(latency_ms_p50, 1)) / 1.645)
+        self.ttft = ttft_ms / 1000
+        self.chunk_chars = max(1, chunk_chars)
+        self.error_rate = error_rate
+        self.errors = [ERRORES_SIMULADOS[nombre] for nombre in errors]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def model(self, model_name, config, system_instruction=None):
+        return _FakeModel(self, model_name, config, system_instruction)
+
+    def sortear(self):
+        """Retorna (latencia_s, ttft_s, error o None) de una llamada."""
+        with self._lock:
+            latencia = self._rng.lognormvariate(self.mu, self.sigma)
+            falla = self._rng.random() < self.error_rate
+            error = self._rng.choice(self.errors) if falla and self.errors else None
+        ttft = min(self.ttft, latencia)
+        return latencia, ttft, error("Error simulado por el backend local") if error else None
+
+    @staticmethod
+    def esperar(segundos, timeout=None):
+        if timeout and segundos > timeout:
+            time.sleep(timeout)
+            raise gexc.DeadlineExceeded("Deadline simulado por el backend local")
+        time.sleep(segundos)
+
+
+def crear_backend(nombre, api_key=None, opciones=None):
+    """
+    Crea el backend de IA.
+
+    Args:
+        nombre: 'gemini' o 'fake'
+        api_key: API key de Gemini (solo backend real)
+        opciones: kwargs del backend elegido
+
+    Returns:
+        GeminiBackend o FakeBackend
+    """
+    if nombre == "fake":
+        return FakeBackend(**(opciones or {}))
+    if nombre != "gemini":
+        raise ValueError(f"Backend de IA desconocido: {nombre}")
+    return GeminiBackend(api_key, **(opciones or {}))
@@ -0,0 +1,126 @@
+"""
+Presupuesto de tokens de salida por practica
+Registra el largo real de las respuestas y ajusta max_output_tokens al
+p99 observado mas un margen, para que una respuesta desbocada no
+dispare la latencia.
+"""
+
+import logging
+import math
+import threading
+from collections import deque
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def tokens_generados(uso):
+    """
+    Tokens de salida que consumieron el presupuesto max_output_tokens.
+    En los modelos con razonamiento los tokens de "thinking" no vienen en
+    candidates_token_count pero si en el total, y tambien cuentan.
+    """
+    salida = uso.get("output_tokens", 0)
+    if uso.get("total_tokens"):
+        salida = max(salida, uso["total_tokens"] - uso.get("prompt_tokens", 0))
+    return salida
+
+
+class OutputBudget:
+    """
+    Ventana de largos de salida por practica y presupuesto derivado.
+
+    El presupuesto es p99 * headroom redondeado a `step`, acotado entre
+    `min_tokens` y el maximo configurado. Hasta juntar `min_samples`
+    observaciones se usa el maximo configurado. Una respuesta cortada por
+    MAX_TOKENS se registra como el doble del presupuesto con que se pidio,
+    asi el ajuste sube en vez de quedar atrapado.
+    """
+
+    def __init__(self, default_tokens, headroom=1.3, min_tokens=512, min_samples=30,
+                 window=500, step=256):
+        self.default_tokens = default_tokens
+        self.headroom = headroom
+        self.min_tokens = min_tokens
+        self.min_samples = min_samples
+        self.window = window
+        self.step = step
+        self._lock = threading.Lock()
+        self._muestras = {}
+        self._truncados = {}
+        self._presupuestos = {}
+
+    def _p99(self, muestras):
+        ordenadas = sorted(muestras)
+        return ordenadas[min(len(ordenadas) - 1, math.ceil(0.99 * len(ordenadas)) - 1)]
+
+    def _calcular(self, muestras):
+        if len(muestras) < self.min_samples:
+            return self.default_tokens
+        objetivo = math.ceil(self._p99(muestras) * self.headroom / self.step) * self.step
+        return max(self.min_tokens, min(self.default_tokens, objetivo))
+
+    def record(self, practice_key, uso, max_tokens):
+        """
+        Registra el largo de una respuesta.
+
+        Args:
+            practice_key: Clave de la practica
+            uso: dict de extraer_uso()
+            max_tokens: Presupuesto con que se hizo la llamada
+        """
+        if not practice_key or not uso:
+            return
+        generados = tokens_generados(uso)
+        truncado = uso.get("finish_reason") == "MAX_TOKENS"
+        if truncado:
+            generados = max(generados, max_tokens * 2)
+
+        with self._lock:
+            muestras = self._muestras.get(practice_key)
+            if muestras is None:
+                muestras = self._muestras[practice_key] = deque(maxlen=self.window)
+            muestras.append(generados)
+            if truncado:
+                self._truncados[practice_key] = self._truncados.get(practice_key, 0) + 1
+            anterior = self._presupuestos.get(practice_key, self.default_tokens)
+            nuevo = self._presupuestos[practice_key] = self._calcular(muestras)
+
+        metrics.set_gauge("ai.output_budget", nuevo, practice=practice_key)
+        if nuevo != anterior:
+            logger.info(
+                "Presupuesto de salida de %s: %s -> %s tokens (%s muestras)",
+                practice_key, anterior, nuevo, len(muestras)
+            )
+
+    def budget(self, practice_key):
+        """Presupuesto de max_output_tokens vigente para la practica."""
+        with self._lock:
+            return self._presupuestos.get(practice_key, self.default_tokens)
+
+    def report(self):
+        """
+        Compara el presupuesto configurado con el observado por practica.
+
+        Returns:
+            list: dicts con practice_key, configurado, presupuesto, muestras,
+                truncados, p50, p95, p99 y max observados
+        """
+        with self._lock:
+            filas = []
+            for practica, muestras in sorted(self._muestras.items()):
+                ordenadas = sorted(muestras)
+                n = len(ordenadas)
+                filas.append({
+                    "practice_key": practica,
+                    "configurado": self.default_tokens,
+                    "presupuesto": self._presupuestos.get(practica, self.default_tokens),
+                    "muestras": n,
+                    "truncados": self._truncados.get(practica, 0),
+                    "p50": ordenadas[(n - 1) // 2],
+                    "p95": ordenadas[min(n - 1, math.ceil(0.95 * n) - 1)],
+                    "p99": self._p99(ordenadas),
+                    "max": ordenadas[-1]
+                })
+        return filas
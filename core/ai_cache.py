@@ -0,0 +1,243 @@
+"""
+Cache de respuestas de IA para YoCreo Suite
+- Nivel 1: LRU en memoria con presupuesto de bytes
+- Nivel 2 (opcional): SQLite en disco con TTL
+- Single-flight: coalescencia de llamadas identicas en vuelo
+"""
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_prompt(prompt):
+    """Colapsa espacios y saltos de linea para que prompts equivalentes compartan clave."""
+    return " ".join(str(prompt).split())
+
+
+def clave_cache(model, max_tokens, prompt, schema=None, system_instruction=None):
+    """
+    Calcula la clave de cache de una generacion.
+
+    Args:
+        model: Nombre del modelo
+        max_tokens: Tokens maximos de salida
+        prompt: Texto del prompt
+        schema: Schema de respuesta serializado (opcional)
+        system_instruction: Instruccion de sistema (opcional)
+
+    Returns:
+        str: Hash sha256 hexadecimal
+    """
+    h = hashlib.sha256()
+    h.update(f"{model}\x00{max_tokens}\x00{schema or ''}\x00".encode("utf-8"))
+    if system_instruction:
+        h.update(normalizar_prompt(system_instruction).encode("utf-8"))
+        h.update(b"\x00")
+    h.update(normalizar_prompt(prompt).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """Cache de dos niveles para respuestas de texto de la IA."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, disk_path=None, ttl_seconds=86400):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._lru = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "sets": 0
+        }
+        self._db = None
+        if disk_path:
+            self._db = self._abrir_db(disk_path)
+
+    # ==================== DISCO ====================
+
+    def _abrir_db(self, path):
+        """Abre (o crea) la base SQLite del nivel en disco."""
+        try:
+            carpeta = os.path.dirname(os.path.abspath(path))
+            os.makedirs(carpeta, exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_created ON ai_cache(created_at)")
+            return db
+        except Exception as e:
+            logger.warning("No se pudo abrir el cache en disco (%s): %s", path, e)
+            return None
+
+    def _leer_disco(self, key):
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT value, created_at FROM ai_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception as e:
+            logger.warning("Error leyendo cache en disco: %s", e)
+            return None
+        if row is None:
+            return None
+        value, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            self._borrar_disco(key)
+            return None
+        return value
+
+    def _escribir_disco(self, key, value):
+        if self._db is None:
+            return
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO ai_cache (key, value, created_at) VALUES (?, ?, ?)",
+                (key, value, time.time())
+            )
+        except Exception as e:
+            logger.warning("Error escribiendo cache en disco: %s", e)
+
+    def _borrar_disco(self, key):
+        try:
+            self._db.execute("DELETE FROM ai_cache WHERE key = ?", (key,))
+        except Exception as e:
+            logger.warning("Error borrando del cache en disco: %s", e)
+
+    def purgar_expirados(self):
+        """Elimina del disco las entradas con TTL vencido. Retorna cuantas borro."""
+        if self._db is None:
+            return 0
+        try:
+            limite = time.time() - self.ttl_seconds
+            cur = self._db.execute("DELETE FROM ai_cache WHERE created_at < ?", (limite,))
+            return cur.rowcount
+        except Exception as e:
+            logger.warning("Error purgando cache en disco: %s", e)
+            return 0
+
+    # ==================== MEMORIA ====================
+
+    def _guardar_memoria(self, key, value):
+        """Inserta en el LRU y expulsa entradas antiguas hasta cumplir el presupuesto."""
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        anterior = self._lru.pop(key, None)
+        if anterior is not None:
+            self._bytes -= len(anterior.encode("utf-8"))
+        self._lru[key] = value
+        self._bytes += size
+        while self._bytes > self.max_bytes and self._lru:
+            _, expulsado = self._lru.popitem(last=False)
+            self._bytes -= len(expulsado.encode("utf-8"))
+            self._stats["evictions"] += 1
+
+    # ==================== API ====================
+
+    def get(self, key):
+        """Retorna el texto cacheado o None."""
+        with self._lock:
+            value = self._lru.get(key)
+            if value is not None:
+                self._lru.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+
+            value = self._leer_disco(key)
+            if value is not None:
+                self._guardar_memoria(key, value)
+                self._stats["disk_hits"] += 1
+                return value
+
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        """Guarda una respuesta en ambos niveles."""
+        if not value:
+            return
+        with self._lock:
+            self._guardar_memoria(key, value)
+            self._escribir_disco(key, value)
+            self._stats["sets"] += 1
+
+    def invalidate(self, key):
+        """Elimina una entrada de ambos niveles."""
+        with self._lock:
+            value = self._lru.pop(key, None)
+            if value is not None:
+                self._bytes -= len(value.encode("utf-8"))
+            if self._db is not None:
+                self._borrar_disco(key)
+
+    def clear(self):
+        """Vacia el nivel en memoria (el disco se limpia por TTL)."""
+        with self._lock:
+            self._lru.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Retorna contadores de hits, misses y evictions mas el uso de memoria."""
+        with self._lock:
+            data = dict(self._stats)
+            data["entries"] = len(self._lru)
+            data["bytes"] = self._bytes
+            data["max_bytes"] = self.max_bytes
+            data["disk"] = self._db is not None
+            return data
+
+
+class SingleFlight:
+    """
+    Coalesce llamadas identicas en vuelo: el primer llamador (lider)
+    ejecuta la llamada y los demas esperan el mismo Future.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.coalesced = 0
+
+    def join(self, key):
+        """
+        Se une a la llamada en vuelo para `key` o la inicia.
+
+        Returns:
+            tuple: (Future, es_lider)
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def leave(self, key, future):
+        """El lider retira su llamada (el Future ya debe estar resuelto)."""
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+
+    def stats(self):
+        with self._lock:
+            return {"inflight": len(self._calls), "coalesced": self.coalesced}
@@ -3,16 +3,736 @@ Cliente de IA para YoCreo Suite
 Protocolo: gemini-2.5-flash
 """
 
+import json
+import logging
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import CancelledError, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
 import streamlit as st
-import google.generativeai as genai
 from .config import AI_CONFIG
+from .ai_backends import crear_backend
+from .ai_budget import OutputBudget
+from .ai_cache import ResponseCache, SingleFlight, clave_cache
+from .ai_governor import Governor
+from .ai_jobs import Job, JobManager
+from .ai_resilience import (
+    CancelToken, Cancelado, CircuitBreaker, DeadlineExcedido, RetryPolicy, es_reintentable
+)
+from .ai_usage import UsageAccounting, extraer_uso
+from .database import registrar_metricas_ia
+from .jsonparse import ParserIncremental, limpiar_json
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+# Configuracion de una generacion: define el modelo a construir y la clave de cache
+GenerationSpec = namedtuple("GenerationSpec", ["max_tokens", "schema", "system_instruction"])
+
+
+def _textos(response, uso=None):
+    """Itera los textos no vacios de un stream de Gemini. Si se entrega
+    `uso`, lo actualiza con usage_metadata/finish_reason de los fragmentos"""
+    for chunk in response:
+        if uso is not None:
+            uso.update(extraer_uso(chunk))
+        try:
+            texto = chunk.text
+        except ValueError:
+            # Fragmento sin partes de texto (ej: solo finish_reason)
+            continue
+        if texto:
+            yield texto
+
+
+class AIEngine:
+    """
+    Motor de IA compartido por todo el proceso.
+    El backend (Gemini o el local) se configura una sola vez y se
+    reutilizan los modelos ya construidos por (modelo, configuracion).
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.model_name = AI_CONFIG["model"]
+        self.cache = ResponseCache(
+            max_bytes=AI_CONFIG.get("cache_max_bytes", 32 * 1024 * 1024),
+            disk_path=AI_CONFIG.get("cache_path"),
+            ttl_seconds=AI_CONFIG.get("cache_ttl_seconds", 86400)
+        )
+        self.inflight = SingleFlight()
+        self.governor = Governor(**AI_CONFIG.get("governor", {}))
+        self.retry_policy = RetryPolicy(**AI_CONFIG.get("retry", {}))
+        self.fallback_model = AI_CONFIG.get("fallback_model")
+        self.breaker = CircuitBreaker(**AI_CONFIG.get("circuit_breaker", {}))
+        self.usage = UsageAccounting(
+            sink=registrar_metricas_ia,
+            flush_seconds=AI_CONFIG.get("usage_flush_seconds", 60)
+        )
+        presupuesto = dict(AI_CONFIG.get("output_budget", {}))
+        self.budgets = None
+        if presupuesto.pop("enabled", False):
+            self.budgets = OutputBudget(AI_CONFIG.get("max_tokens", 8192), **presupuesto)
+        self._models = {}
+        self._lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(
+            max_workers=AI_CONFIG.get("max_workers", 16),
+            thread_name_prefix="yocreo-ai"
+        )
+        # Pool aparte para las llamadas con hedge: sus tareas no encolan
+        # otras, asi no compiten con generate_many por los mismos hilos
+        self._hedge_pool = ThreadPoolExecutor(
+            max_workers=AI_CONFIG.get("governor", {}).get("max_inflight", 24) * 2,
+            thread_name_prefix="yocreo-ai-hedge"
+        )
+        # Generaciones en vivo: el hilo del script solo espera la cola y
+        # puede abandonar la llamada (Cancelar, rerun) sin quedar bloqueado
+        self.live_pool = ThreadPoolExecutor(
+            max_workers=AI_CONFIG.get("max_live_streams", 32),
+            thread_name_prefix="yocreo-ai-live"
+        )
+
+    def spec(self, max_tokens=None, response_schema=None, system_instruction=None):
+        """
+        Normaliza las opciones de una generacion.
+
+        Args:
+            max_tokens: Tokens maximos (default AI_CONFIG)
+            response_schema: Schema JSON de la respuesta (activa modo JSON)
+            system_instruction: Parte fija del prompt (registro core.prompts)
+
+        Returns:
+            GenerationSpec: hashable, con el schema serializado
+        """
+        schema = json.dumps(response_schema, sort_keys=True) if response_schema else None
+        return GenerationSpec(
+            max_tokens or AI_CONFIG.get("max_tokens", 8192), schema, system_instruction or None
+        )
+
+    def get_model(self, spec, model_name=None):
+        """Retorna el GenerativeModel configurado para (modelo, spec)"""
+        key = (model_name or self.model_name, spec)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    config = {"max_output_tokens": spec.max_tokens}
+                    if spec.schema:
+                        config["response_mime_type"] = "application/json"
+                        config["response_schema"] = json.loads(spec.schema)
+                    model = self.backend.model(key[0], config, spec.system_instruction)
+                    self._models[key] = model
+        return model
+
+    def cache_key(self, prompt, spec):
+        return clave_cache(
+            self.model_name, spec.max_tokens, prompt, spec.schema, spec.system_instruction
+        )
+
+    def _cachear(self, key, text, spec):
+        """
+        Guarda la respuesta en el cache. Con schema solo si se puede
+        interpretar: una respuesta rota no se reutiliza y las practicas no
+        tienen que invalidarla.
+        """
+        if spec.schema and limpiar_json(text, json.loads(spec.schema)) is None:
+            metrics.incr("ai.cache.rejected")
+            return
+        self.cache.set(key, text)
+
+    def _presupuesto(self, spec, max_tokens, practice_key):
+        """
+        Spec de la llamada con el presupuesto ajustado de la practica.
+        Un max_tokens explicito del llamador se respeta tal cual. La clave
+        de cache sigue usando el spec original.
+        """
+        if max_tokens or self.budgets is None or not practice_key:
+            return spec
+        return spec._replace(max_tokens=self.budgets.budget(practice_key))
+
+    def token(self, practice_key=None, deadline=None, cancel=None):
+        """
+        CancelToken de una llamada con el deadline de la practica.
+
+        Args:
+            practice_key: Practica (deadline por defecto en AI_CONFIG["deadlines"])
+            deadline: Segundos; reemplaza al de la practica (0: sin deadline)
+            cancel: CancelToken del llamador; se acota con el deadline
+        """
+        if deadline is None:
+            deadlines = AI_CONFIG.get("deadlines", {})
+            deadline = deadlines.get(practice_key, deadlines.get("default"))
+        token = cancel or CancelToken()
+        token.limitar(deadline)
+        return token
+
+    def _interrumpido(self, e, practice_key):
+        """Cuenta por separado los deadlines vencidos y las cancelaciones"""
+        practica = practice_key or "sin_practica"
+        if isinstance(e, DeadlineExcedido):
+            metrics.incr("ai.timeouts", practice=practica)
+            logger.warning("Deadline vencido en %s: %s", practica, e)
+        elif isinstance(e, Cancelado):
+            metrics.incr("ai.cancellations", practice=practica)
+
+    # ==================== RESILIENCIA ====================
+
+    def _modelo_activo(self):
+        """Modelo principal, o el de respaldo si el circuito esta abierto"""
+        if self.fallback_model and not self.breaker.allow():
+            metrics.incr("ai.fallback", model=self.fallback_model)
+            return self.fallback_model
+        return self.model_name
+
+    def _registrar_resultado(self, model_name, error=None):
+        """Alimenta el circuit breaker con el resultado de un intento del modelo principal"""
+        if model_name != self.model_name:
+            return
+        if error is not None and es_reintentable(error):
+            self.breaker.record_failure()
+        else:
+            # Un error no transitorio (ej: prompt invalido) no indica degradacion
+            self.breaker.record_success()
+
+    def _timeout(self, token):
+        """Deadline del intento: el de la politica, sin pasar lo que le queda al token"""
+        timeout = self.retry_policy.attempt_timeout
+        restante = token.restante() if token is not None else None
+        if restante is not None:
+            timeout = min(timeout, max(restante, 0.1)) if timeout else max(restante, 0.1)
+        return timeout
+
+    def _invocar(self, model_name, prompt, spec, stream=False, timeout=None):
+        """
+        Una llamada a Gemini con el deadline por intento indicado (default:
+        el de la politica). Retorna (texto, uso), o la respuesta iterable
+        si stream=True.
+        """
+        timeout = timeout or self.retry_policy.attempt_timeout
+        request_options = {"timeout": timeout} if timeout else None
+        model = self.get_model(spec, model_name)
+        if stream:
+            return model.generate_content(prompt, stream=True, request_options=request_options)
+        inicio = time.perf_counter()
+        response = model.generate_content(prompt, request_options=request_options)
+        text = response.text
+        metrics.observe("ai.attempt_ms", (time.perf_counter() - inicio) * 1000, model=model_name)
+        return text, extraer_uso(response)
+
+    def _umbral_hedge(self, model_name):
+        """Milisegundos tras los cuales se lanza una segunda llamada (p95 observado)"""
+        policy = self.retry_policy
+        if not policy.hedge:
+            return None
+        snapshot = metrics.quantile("ai.attempt_ms", policy.hedge_quantile, model=model_name)
+        muestras = metrics.count("ai.attempt_ms", model=model_name)
+        if snapshot is None or muestras < policy.hedge_min_samples:
+            return None
+        return snapshot
+
+    def _intento(self, model_name, prompt, spec, token=None):
+        """
+        Un intento, con una llamada de cobertura (hedge) si supera el p95.
+        Con `token` la espera se hace por tramos: al cancelar o vencer el
+        deadline se abandona la llamada (termina sola por su timeout).
+        """
+        umbral = self._umbral_hedge(model_name)
+        timeout = self._timeout(token)
+        if umbral is None and token is None:
+            return self._invocar(model_name, prompt, spec, timeout=timeout)
+
+        primera = self._hedge_pool.submit(self._invocar, model_name, prompt, spec, False, timeout)
+        segunda = None
+        hedge_en = None if umbral is None else time.monotonic() + umbral / 1000
+        pendientes = {primera}
+        error = None
+        try:
+            while pendientes:
+                espera = None
+                if token is not None:
+                    token.check()
+                    espera = 0.1
+                if hedge_en is not None and segunda is None:
+                    falta = max(0.0, hedge_en - time.monotonic())
+                    espera = falta if espera is None else min(espera, falta)
+                listos, pendientes = wait(pendientes, timeout=espera, return_when=FIRST_COMPLETED)
+                for future in listos:
+                    try:
+                        resultado = future.result()
+                    except Exception as e:
+                        error = e
+                        continue
+                    if future is segunda:
+                        metrics.incr("ai.hedges.won", model=model_name)
+                    return resultado
+                if (not listos and segunda is None and hedge_en is not None
+                        and time.monotonic() >= hedge_en):
+                    hedge_en = None
+                    # La cobertura ocupa un lugar en vuelo: sin lugar libre no se lanza
+                    if not self.governor.try_acquire():
+                        metrics.incr("ai.hedges.skipped", model=model_name)
+                        continue
+                    metrics.incr("ai.hedges", model=model_name)
+                    segunda = self._hedge_pool.submit(
+                        self._invocar, model_name, prompt, spec, False, self._timeout(token)
+                    )
+                    # Tambien corre si se cancela antes de empezar
+                    segunda.add_done_callback(lambda _: self.governor.release())
+                    pendientes.add(segunda)
+            raise error
+        finally:
+            for otro in pendientes:
+                otro.cancel()
+
+    @staticmethod
+    def _esperar(future, token=None):
+        """future.result() que, con token, se abandona al cancelar o vencer el deadline"""
+        while token is not None:
+            token.check()
+            try:
+                return future.result(timeout=0.1)
+            except FutureTimeout:
+                continue
+        return future.result()
+
+    def _esperar_reintento(self, intento, token, e):
+        """Backoff antes de reintentar; con token la espera es interrumpible"""
+        espera = self.retry_policy.backoff(intento)
+        if token is None:
+            time.sleep(espera)
+            return
+        if token.vencido:
+            raise DeadlineExcedido(str(e)) from e
+        token.sleep(espera)
+
+    def _fallo_intento(self, model_name, intento, token, e):
+        """Decide si un error de intento se reintenta; si no, lo relanza"""
+        if isinstance(e, (Cancelado, DeadlineExcedido)):
+            raise e
+        self._registrar_resultado(model_name, e)
+        if token is not None and token.vencido:
+            # El ultimo timeout lo fijo el deadline total, no la politica
+            raise DeadlineExcedido(
+                f"La IA no respondio dentro de {token.deadline:g} segundos. Intenta de nuevo."
+            ) from e
+        if not es_reintentable(e) or intento == self.retry_policy.max_attempts - 1:
+            raise e
+        metrics.incr("ai.retries", model=model_name)
+        logger.info("Reintentando llamada a %s tras error: %s", model_name, e)
+        self._esperar_reintento(intento, token, e)
+
+    def _llamar(self, prompt, spec, token=None):
+        """
+        Llamada completa con reintentos (backoff exponencial con jitter)
+        y respaldo al modelo liviano cuando el principal esta degradado.
+        Con `token` se detiene al cancelar o vencer el deadline total.
+
+        Returns:
+            tuple: (texto, modelo usado, uso)
+        """
+        policy = self.retry_policy
+        for intento in range(policy.max_attempts):
+            if token is not None:
+                token.check()
+            model_name = self._modelo_activo()
+            try:
+                text, uso = self._intento(model_name, prompt, spec, token)
+            except Exception as e:
+                self._fallo_intento(model_name, intento, token, e)
+                continue
+            self._registrar_resultado(model_name)
+            return text, model_name, uso
+
+    def _abrir_stream(self, prompt, spec, token=None):
+        """
+        Abre un stream con la misma politica de reintentos. Solo se
+        reintenta antes del primer fragmento: despues ya se mostro texto.
+
+        Returns:
+            tuple: (iterador de textos, primer texto, modelo usado, inicio,
+                uso) donde `uso` se completa a medida que se consume el stream
+        """
+        policy = self.retry_policy
+        for intento in range(policy.max_attempts):
+            if token is not None:
+                token.check()
+            model_name = self._modelo_activo()
+            inicio = time.perf_counter()
+            uso = {}
+            try:
+                respuesta = self._invocar(
+                    model_name, prompt, spec, stream=True, timeout=self._timeout(token)
+                )
+                textos = _textos(respuesta, uso)
+                if token is None:
+                    primero = next(textos, "")
+                else:
+                    # El primer fragmento puede tardar: se espera por tramos
+                    primero = self._esperar(self._hedge_pool.submit(next, textos, ""), token)
+            except Exception as e:
+                self._fallo_intento(model_name, intento, token, e)
+                continue
+            self._registrar_resultado(model_name)
+            return textos, primero, model_name, inicio, uso
+
+    # ==================== GENERACION ====================
+
+    def _esperar_vuelo(self, key, token=None):
+        """
+        Coalescencia: si ya hay una llamada identica en vuelo, espera su
+        resultado. Retorna (texto, None) si lo obtuvo, o (None, future)
+        cuando este llamador pasa a ser el lider y debe llamar a la IA.
+        """
+        while True:
+            future, lider = self.inflight.join(key)
+            if lider:
+                return None, future
+            # Puede lanzar el mismo error que recibio el lider
+            text = self._esperar(future, token)
+            if text is not None:
+                metrics.incr("ai.coalesced")
+                return text, None
+            # El lider abandono (ej: stream interrumpido): reintentar como lider
+
+    def generate(self, prompt, max_tokens=None, use_cache=True, identity=None, on_wait=None,
+                 practice_key=None, response_schema=None, system_instruction=None,
+                 deadline=None, cancel=None):
+        """
+        Genera una respuesta completa. Lanza excepcion si la llamada falla
+        despues de agotar los reintentos. Llamadas identicas simultaneas
+        comparten una sola llamada a la IA.
+
+        Args:
+            identity: (email, organization_id) para el gobernador de cuota
+            on_wait: Callback(posicion) mientras se espera turno
+            practice_key: Practica que origina la llamada (contabilidad)
+            response_schema: Schema JSON; la respuesta sera JSON valido
+            system_instruction: Parte fija del prompt (instruccion de sistema)
+            deadline: Segundos para la llamada completa (default por practica)
+            cancel: CancelToken para abandonar la llamada
+
+        Returns:
+            str: Texto de respuesta
+
+        Raises:
+            DeadlineExcedido, Cancelado: la llamada se abandono
+        """
+        token = self.token(practice_key, deadline, cancel)
+        try:
+            return self._generate(
+                prompt, max_tokens, use_cache, identity, on_wait, practice_key,
+                response_schema, system_instruction, token
+            )
+        except (Cancelado, DeadlineExcedido) as e:
+            self._interrumpido(e, practice_key)
+            raise
+
+    def _generate(self, prompt, max_tokens, use_cache, identity, on_wait, practice_key,
+                  response_schema, system_instruction, token):
+        org = (identity or (None, None))[1]
+        spec = self.spec(max_tokens, response_schema, system_instruction)
+        key = self.cache_key(prompt, spec)
+        llamada = self._presupuesto(spec, max_tokens, practice_key)
+        if not use_cache:
+            return self._generar(prompt, llamada, identity, on_wait, practice_key, spec, token)[0]
+
+        cached = self.cache.get(key)
+        if cached is not None:
+            self.usage.record(practice_key, {}, 0, self.model_name, org, source="cache")
+            return cached
+
+        text, future = self._esperar_vuelo(key, token)
+        if future is None:
+            self.usage.record(practice_key, {}, 0, self.model_name, org, source="coalesced")
+            return text
+        try:
+            text, model_name = self._generar(
+                prompt, llamada, identity, on_wait, practice_key, spec, token
+            )
+            future.set_result(text)
+        except (Cancelado, DeadlineExcedido):
+            # Abandono propio: los que esperaban haran su propia llamada
+            future.set_result(None)
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self.inflight.leave(key, future)
+
+        # Las respuestas del modelo de respaldo no se cachean
+        if model_name == self.model_name:
+            self._cachear(key, text, spec)
+        return text
+
+    def _generar(self, prompt, spec, identity, on_wait, practice_key, completo=None, token=None):
+        """
+        Llamada a la IA con turno del gobernador. Retorna (texto, modelo).
+        Si la respuesta se corto por un presupuesto ajustado menor que el de
+        `completo`, se repite una vez con el presupuesto completo.
+        """
+        user, org = identity or (None, None)
+        self.governor.acquire(user, org, on_wait, token)
+        try:
+            inicio = time.perf_counter()
+            text, model_name, uso = self._llamar(prompt, spec, token)
+            latencia = (time.perf_counter() - inicio) * 1000
+        finally:
+            self.governor.release()
+        metrics.observe("ai.latency_ms", latencia)
+        self.usage.record(practice_key, uso, latencia, model_name, org)
+        self._registrar_largo(practice_key, uso, spec)
+
+        if (uso.get("finish_reason") == "MAX_TOKENS" and completo is not None
+                and spec.max_tokens < completo.max_tokens):
+            metrics.incr("ai.output_budget.retry", practice=practice_key or "sin_practica")
+            return self._generar(prompt, completo, identity, on_wait, practice_key, token=token)
+        return text, model_name
+
+    def _registrar_largo(self, practice_key, uso, spec):
+        if self.budgets is not None:
+            self.budgets.record(practice_key, uso, spec.max_tokens)
+
+    def stream(self, prompt, max_tokens=None, use_cache=True, identity=None, on_wait=None,
+               practice_key=None, response_schema=None, system_instruction=None,
+               deadline=None, cancel=None):
+        """
+        Genera una respuesta en streaming. Registra el tiempo hasta el
+        primer fragmento (ai.ttft_ms). Lanza excepcion si la llamada falla.
+        El turno del gobernador se mantiene hasta terminar el stream. Si
+        ya hay una llamada identica en vuelo se espera su texto completo.
+
+        Args:
+            identity: (email, organization_id) para el gobernador de cuota
+            on_wait: Callback(posicion) mientras se espera turno
+            practice_key: Practica que origina la llamada (contabilidad)
+            response_schema: Schema JSON; la respuesta sera JSON valido
+            system_instruction: Parte fija del prompt (instruccion de sistema)
+            deadline: Segundos para la llamada completa (default por practica)
+            cancel: CancelToken; se consulta tambien entre fragmentos
+
+        Yields:
+            str: Fragmentos de texto a medida que llegan
+        """
+        token = self.token(practice_key, deadline, cancel)
+        try:
+            yield from self._stream(
+                prompt, max_tokens, use_cache, identity, on_wait, practice_key,
+                response_schema, system_instruction, token
+            )
+        except (Cancelado, DeadlineExcedido) as e:
+            self._interrumpido(e, practice_key)
+            raise
+
+    def _stream(self, prompt, max_tokens, use_cache, identity, on_wait, practice_key,
+                response_schema, system_instruction, token):
+        user, org = identity or (None, None)
+        spec = self.spec(max_tokens, response_schema, system_instruction)
+        key = self.cache_key(prompt, spec)
+        llamada = self._presupuesto(spec, max_tokens, practice_key)
+        future = None
+        if use_cache:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.usage.record(practice_key, {}, 0, self.model_name, org, source="cache")
+                yield cached
+                return
+            text, future = self._esperar_vuelo(key, token)
+            if future is None:
+                self.usage.record(practice_key, {}, 0, self.model_name, org, source="coalesced")
+                yield text
+                return
+
+        partes = []
+        completo = False
+        try:
+            self.governor.acquire(user, org, on_wait, token)
+            try:
+                textos, primero, model_name, inicio, uso = self._abrir_stream(prompt, llamada, token)
+                if primero:
+                    metrics.observe("ai.ttft_ms", (time.perf_counter() - inicio) * 1000)
+                    partes.append(primero)
+                    yield primero
+                for texto in textos:
+                    token.check()
+                    partes.append(texto)
+                    yield texto
+                latencia = (time.perf_counter() - inicio) * 1000
+                metrics.observe("ai.latency_ms", latencia)
+                self.usage.record(practice_key, uso, latencia, model_name, org)
+                self._registrar_largo(practice_key, uso, llamada)
+                completo = True
+            finally:
+                self.governor.release()
+        except Exception as e:
+            if future is not None and not isinstance(e, (Cancelado, DeadlineExcedido)):
+                future.set_exception(e)
+            raise
+        finally:
+            if future is not None:
+                if not future.done():
+                    # Stream abandonado: los que esperaban haran su propia llamada
+                    future.set_result("".join(partes) if completo else None)
+                self.inflight.leave(key, future)
+
+        if use_cache and partes and model_name == self.model_name:
+            self._cachear(key, "".join(partes), spec)
+
+    def generate_many(self, prompts, max_tokens=None, use_cache=True, max_concurrency=None,
+                      cancel_event=None, on_progress=None, return_exceptions=False,
+                      identity=None, practice_key=None, response_schema=None,
+                      system_instruction=None, deadline=None, on_result=None):
+        """
+        Genera una respuesta por prompt en el pool compartido, con como
+        maximo max_concurrency llamadas en vuelo. Conserva el orden de
+        entrada y un error en un prompt no interrumpe el resto.
+
+        Args:
+            prompts: Lista de prompts
+            max_tokens: Tokens maximos (opcional)
+            use_cache: Reutilizar respuestas previas
+            max_concurrency: Llamadas simultaneas (default AI_CONFIG)
+            cancel_event: threading.Event; si se activa no se inician mas
+                llamadas y se abandonan las que estan en vuelo
+            on_progress: Callback (completadas, total) invocado mientras se espera
+            return_exceptions: Devolver la excepcion en lugar de None
+            identity: (email, organization_id) para el gobernador de cuota
+            practice_key: Practica que origina las llamadas (contabilidad)
+            response_schema: Schema JSON comun a todas las respuestas
+            system_instruction: Instruccion de sistema comun a todas las llamadas
+            deadline: Segundos por llamada (default por practica)
+            on_result: Callback (indice, resultado) apenas termina cada prompt,
+                desde el hilo que espera (no desde el pool)
+
+        Returns:
+            list: Textos de respuesta (None o excepcion donde hubo error)
+        """
+        prompts = list(prompts)
+        total = len(prompts)
+        limite = max(1, max_concurrency or AI_CONFIG.get("max_concurrency", 4))
+        cancel_event = cancel_event or threading.Event()
+        resultados = [None] * total
+
+        def tarea(prompt):
+            if cancel_event.is_set():
+                raise CancelledError()
+            return self.generate(
+                prompt, max_tokens, use_cache, identity,
+                practice_key=practice_key,
+                response_schema=response_schema,
+                system_instruction=system_instruction,
+                deadline=deadline,
+                cancel=CancelToken(event=cancel_event)
+            )
+
+        en_vuelo = {}
+        siguiente = 0
+        completadas = 0
+        try:
+            while completadas < total:
+                while siguiente < total and len(en_vuelo) < limite and not cancel_event.is_set():
+                    en_vuelo[self.pool.submit(tarea, prompts[siguiente])] = siguiente
+                    siguiente += 1
+                if not en_vuelo:
+                    break
+                listos, _ = wait(en_vuelo, timeout=0.25, return_when=FIRST_COMPLETED)
+                for future in listos:
+                    i = en_vuelo.pop(future)
+                    completadas += 1
+                    try:
+                        resultados[i] = future.result()
+                    except (CancelledError, Cancelado) as e:
+                        resultados[i] = e if return_exceptions else None
+                    except Exception as e:
+                        logger.warning("generate_many: fallo el prompt %s: %s", i, e)
+                        metrics.incr("ai.generate_many.errors")
+                        resultados[i] = e if return_exceptions else None
+                    if on_result:
+                        on_result(i, resultados[i])
+                if on_progress:
+                    on_progress(completadas, total)
+        finally:
+            # Si el llamador se interrumpe (rerun, fin de sesion) no se
+            # inician mas llamadas y se descartan las pendientes
+            cancel_event.set()
+            for future in en_vuelo:
+                future.cancel()
+
+        if return_exceptions:
+            for i in range(siguiente, total):
+                resultados[i] = CancelledError()
+        return resultados
+
+    def invalidate(self, prompt, max_tokens=None, response_schema=None, system_instruction=None):
+        """Descarta la respuesta cacheada de un prompt"""
+        spec = self.spec(max_tokens, response_schema, system_instruction)
+        self.cache.invalidate(self.cache_key(prompt, spec))
+
+
+@st.cache_resource(show_spinner=False)
+def get_engine():
+    """Obtiene el motor de IA del proceso (se crea una sola vez)"""
+    nombre = AI_CONFIG.get("backend") or st.secrets.get("AI_BACKEND", "gemini")
+    if nombre == "fake":
+        logger.warning("Usando el backend de IA local: las respuestas son simuladas")
+        return AIEngine(crear_backend("fake", opciones=AI_CONFIG.get("fake_backend")))
+    return AIEngine(crear_backend(
+        nombre,
+        api_key=st.secrets["GOOGLE_API_KEY"],
+        opciones=AI_CONFIG.get("context_cache")
+    ))
+
+
+@st.cache_resource(show_spinner=False)
+def get_job_manager():
+    """Obtiene el registro de trabajos en segundo plano del proceso"""
+    return JobManager(**AI_CONFIG.get("jobs", {}))
+
+
+def identidad_actual():
+    """Retorna (email, organization_id) del usuario de la sesion actual"""
+    user = st.session_state.get('user') or {}
+    user_role = st.session_state.get('user_role') or {}
+    return user.get('email'), user_role.get('organization_id')
+
+
+def _aviso_fila(placeholder):
+    """Callback del gobernador: muestra la posicion en la fila de espera"""
+    def on_wait(posicion):
+        placeholder.markdown(
+            f'<div class="custom-info">Hay alta demanda en este momento. '
+            f'Tu solicitud esta en la fila (posicion {posicion}).</div>',
+            unsafe_allow_html=True
+        )
+    return on_wait
+
+
+class ErrorMostrado(Exception):
+    """Fallo de la generacion cuyo aviso ya se mostro en la pagina."""
+
+
+def _mostrar_error(e):
+    if isinstance(e, DeadlineExcedido):
+        st.markdown(f'<div class="custom-warning">{e}</div>', unsafe_allow_html=True)
+        return
+    if isinstance(e, Cancelado):
+        st.markdown('<div class="custom-info">Generacion cancelada.</div>', unsafe_allow_html=True)
+        return
+    st.markdown(f'''
+        <div class="custom-error">
+            Error al generar respuesta: {e}
+        </div>
+    ''', unsafe_allow_html=True)
 
 
 def init_ai():
     """Inicializa el cliente de IA con la API key de secrets"""
     try:
-        api_key = st.secrets["GOOGLE_API_KEY"]
-        genai.configure(api_key=api_key)
+        get_engine()
         return True
     except Exception as e:
         st.markdown(f'''
@@ -24,32 +744,280 @@ def init_ai():
         return False
 
 
-def generate_response(prompt, max_tokens=None):
+def generate_response(prompt, max_tokens=None, use_cache=True, practice_key=None,
+                      response_schema=None, system_instruction=None, deadline=None):
     """
     Genera una respuesta usando gemini-2.5-flash
 
     Args:
         prompt: El texto del prompt
         max_tokens: Tokens maximos (opcional)
+        use_cache: Reutilizar respuestas previas al mismo prompt (usar False
+            cuando se espera una salida distinta en cada llamada)
+        practice_key: Practica que origina la llamada (contabilidad de tokens)
+        response_schema: Schema JSON de la respuesta (modo JSON nativo)
+        system_instruction: Parte fija del prompt (registro core.prompts)
+        deadline: Segundos para la llamada completa (default por practica)
 
     Returns:
         str: Texto de respuesta o None si hay error
     """
+    aviso = st.empty()
     try:
-        tokens = max_tokens or AI_CONFIG.get("max_tokens", 8192)
-        generation_config = genai.types.GenerationConfig(
-            max_output_tokens=tokens
+        return get_engine().generate(
+            prompt, max_tokens, use_cache,
+            identity=identidad_actual(),
+            on_wait=_aviso_fila(aviso),
+            practice_key=practice_key,
+            response_schema=response_schema,
+            system_instruction=system_instruction,
+            deadline=deadline
         )
-        model = genai.GenerativeModel(AI_CONFIG["model"])
-        response = model.generate_content(prompt, generation_config=generation_config)
-        return response.text
     except Exception as e:
-        st.markdown(f'''
-            <div class="custom-error">
-                Error al generar respuesta: {e}
-            </div>
-        ''', unsafe_allow_html=True)
+        _mostrar_error(e)
         return None
+    finally:
+        aviso.empty()
+
+
+def generate_response_stream(prompt, max_tokens=None, use_cache=True, on_wait=None,
+                             practice_key=None, response_schema=None, system_instruction=None,
+                             deadline=None, cancel=None):
+    """
+    Genera una respuesta en streaming usando gemini-2.5-flash.
+    Registra el tiempo hasta el primer fragmento (ai.ttft_ms).
+
+    Args:
+        prompt: El texto del prompt
+        max_tokens: Tokens maximos (opcional)
+        use_cache: Reutilizar respuestas previas al mismo prompt
+        on_wait: Callback(posicion) mientras se espera turno en la fila
+        practice_key: Practica que origina la llamada (contabilidad de tokens)
+        response_schema: Schema JSON de la respuesta (modo JSON nativo)
+        system_instruction: Parte fija del prompt (registro core.prompts)
+        deadline: Segundos para la llamada completa (default por practica)
+        cancel: CancelToken para abandonar la llamada
+
+    Yields:
+        str: Fragmentos de texto a medida que llegan
+    """
+    try:
+        yield from get_engine().stream(
+            prompt, max_tokens, use_cache,
+            identity=identidad_actual(),
+            on_wait=on_wait,
+            practice_key=practice_key,
+            response_schema=response_schema,
+            system_instruction=system_instruction,
+            deadline=deadline,
+            cancel=cancel
+        )
+    except Exception as e:
+        _mostrar_error(e)
+
+
+def _texto_seccion(valor):
+    """Texto de un campo para la vista previa por secciones"""
+    if isinstance(valor, list):
+        return "\n".join(
+            "- " + (", ".join(str(v) for v in item.values()) if isinstance(item, dict) else str(item))
+            for item in valor
+        )
+    if isinstance(valor, dict):
+        return "\n".join(f"- {clave}: {v}" for clave, v in valor.items())
+    return "" if valor is None else str(valor)
+
+
+def generate_response_live(prompt, max_tokens=None, use_cache=True, practice_key=None,
+                           response_schema=None, system_instruction=None, deadline=None,
+                           secciones=None, lanzar=False):
+    """
+    Genera en streaming mostrando el texto a medida que llega, con un
+    boton Cancelar. La vista previa se borra al terminar para que la
+    practica muestre el resultado ya formateado.
+
+    Con `secciones` la respuesta JSON se interpreta mientras llega: cada
+    campo se muestra con su titulo apenas se completa y el que se esta
+    recibiendo se va escribiendo debajo.
+
+    La llamada corre en un hilo del motor y el script solo espera la
+    cola de fragmentos: Cancelar (o cualquier rerun) interrumpe la espera
+    en el siguiente redibujo y el token detiene la llamada.
+
+    Args:
+        prompt: El texto del prompt
+        max_tokens: Tokens maximos (opcional)
+        use_cache: Reutilizar respuestas previas al mismo prompt
+        practice_key: Practica que origina la llamada (contabilidad de tokens)
+        response_schema: Schema JSON de la respuesta (modo JSON nativo)
+        system_instruction: Parte fija del prompt (registro core.prompts)
+        deadline: Segundos para la llamada completa (default por practica)
+        secciones: dict {campo: titulo} para la vista previa por secciones
+        lanzar: Tras mostrar el error, lanzar ErrorMostrado en vez de
+            retornar None (el llamador sabe que no debe avisar de nuevo)
+
+    Returns:
+        str: Texto completo de respuesta o None si hay error
+    """
+    engine = get_engine()
+    identity = identidad_actual()
+    token = engine.token(practice_key, deadline)
+    cola = queue.Queue()
+
+    def producir():
+        try:
+            for texto in engine.stream(
+                prompt, max_tokens, use_cache,
+                identity=identity,
+                on_wait=lambda posicion: cola.put(("fila", posicion)),
+                practice_key=practice_key,
+                response_schema=response_schema,
+                system_instruction=system_instruction,
+                cancel=token
+            ):
+                cola.put(("texto", texto))
+            cola.put(("fin", None))
+        except Exception as e:
+            cola.put(("error", e))
+
+    placeholder = st.empty()
+    vista = st.empty()
+    control = st.empty()
+    aviso_fila = _aviso_fila(placeholder)
+    partes = []
+    posicion = None
+    ultimo_render = 0.0
+
+    parser = ParserIncremental() if secciones else None
+    # Un hueco por seccion en el orden de la practica: el modelo puede
+    # entregar los campos en otro orden (ej: alfabetico)
+    huecos = {}
+    if parser is not None:
+        caja = vista.container()
+        huecos = {campo: caja.empty() for campo in secciones}
+
+    def seccion(campo, texto):
+        if campo in huecos:
+            huecos[campo].markdown(f"**{secciones[campo]}**\n\n{texto}")
+
+    def dibujar():
+        if parser is not None and parser.parcial is not None:
+            seccion(*parser.parcial)
+        elif partes and parser is None:
+            placeholder.code("".join(partes), language=None, wrap_lines=True)
+        elif posicion is not None and not partes:
+            aviso_fila(posicion)
+        else:
+            placeholder.empty()
+
+    futuro = engine.live_pool.submit(producir)
+    try:
+        control.button("Cancelar", key=f"ai_cancelar_{id(token)}")
+        while True:
+            try:
+                tipo, valor = cola.get(timeout=0.25)
+            except queue.Empty:
+                if not futuro.running() and not futuro.done():
+                    # Sin hilo libre todavia: el deadline corre igual
+                    try:
+                        token.check()
+                    except DeadlineExcedido as e:
+                        engine._interrumpido(e, practice_key)
+                        raise
+                # Cada redibujo es el punto donde Streamlit interrumpe el
+                # script si se pulso Cancelar o hubo otro rerun
+                dibujar()
+                continue
+            if tipo == "fin":
+                break
+            if tipo == "error":
+                raise valor
+            if tipo == "fila":
+                posicion = valor
+                dibujar()
+                continue
+            partes.append(valor)
+            if parser is not None:
+                if posicion is not None and len(partes) == 1:
+                    placeholder.empty()
+                # Cada campo se dibuja una sola vez, al completarse
+                for campo, completo in parser.feed(valor):
+                    seccion(campo, _texto_seccion(completo))
+            # Limitar redibujos para no saturar el websocket
+            ahora = time.perf_counter()
+            if ahora - ultimo_render >= 0.05:
+                dibujar()
+                ultimo_render = ahora
+    except Exception as e:
+        _mostrar_error(e)
+        if lanzar:
+            raise ErrorMostrado(str(e)) from e
+        return None
+    finally:
+        # Libera el hilo (y el turno) aunque el script se interrumpa
+        token.cancel()
+        futuro.cancel()
+        control.empty()
+        placeholder.empty()
+        vista.empty()
+    return "".join(partes) or None
+
+
+def generate_many(prompts, max_tokens=None, max_concurrency=None, use_cache=True,
+                  show_progress=True, return_exceptions=False, practice_key=None,
+                  response_schema=None, system_instruction=None, deadline=None,
+                  on_result=None):
+    """
+    Genera varios prompts en paralelo con concurrencia acotada.
+    El tiempo total se acerca al de la llamada mas lenta y no a la suma.
+    Si la pagina se vuelve a ejecutar o la sesion termina mientras se
+    espera, las llamadas pendientes se cancelan.
+
+    Args:
+        prompts: Lista de prompts
+        max_tokens: Tokens maximos (opcional)
+        max_concurrency: Llamadas simultaneas (default AI_CONFIG)
+        use_cache: Reutilizar respuestas previas
+        show_progress: Mostrar barra de progreso
+        return_exceptions: Devolver la excepcion en lugar de None
+        practice_key: Practica que origina las llamadas (contabilidad de tokens)
+        response_schema: Schema JSON comun a todas las respuestas
+        system_instruction: Instruccion de sistema comun a todas las llamadas
+        deadline: Segundos por llamada (default por practica)
+        on_result: Callback (indice, texto) apenas termina cada prompt; corre
+            en el hilo del script, asi puede dibujar en la pagina
+
+    Returns:
+        list: Textos de respuesta en el orden de entrada (None donde hubo error)
+    """
+    engine = get_engine()
+    barra = st.progress(0.0) if show_progress else st.empty()
+
+    def progreso(completadas, total):
+        # Cada actualizacion es tambien el punto donde Streamlit interrumpe
+        # el script si hubo rerun o cierre de sesion
+        if show_progress:
+            barra.progress(completadas / total, text=f"{completadas} de {total} listos")
+        else:
+            barra.empty()
+
+    try:
+        return engine.generate_many(
+            prompts,
+            max_tokens=max_tokens,
+            use_cache=use_cache,
+            max_concurrency=max_concurrency,
+            on_progress=progreso,
+            return_exceptions=return_exceptions,
+            identity=identidad_actual(),
+            practice_key=practice_key,
+            response_schema=response_schema,
+            system_instruction=system_instruction,
+            deadline=deadline,
+            on_result=on_result
+        )
+    finally:
+        barra.empty()
 
 
 def generate_structured_response(prompt, separador="|||"):
@@ -69,3 +1037,174 @@ def generate_structured_response(prompt, separador="|||"):
         clean_response = response.replace("*", "")
         return clean_response.split(separador)
     return []
+
+
+def get_usage_stats():
+    """Retorna las metricas del proceso (tokens y latencia por practica incluidos)"""
+    return metrics.snapshot()
+
+
+def get_governor_stats():
+    """Retorna el estado del gobernador (llamadas en vuelo, filas de espera)"""
+    return get_engine().governor.stats()
+
+
+def get_cache_stats():
+    """Retorna los contadores del cache de respuestas (hits, misses, evictions...)
+    y de las llamadas coalescidas (single-flight)"""
+    engine = get_engine()
+    stats = engine.cache.stats()
+    stats["singleflight"] = engine.inflight.stats()
+    return stats
+
+
+def get_output_budget_report():
+    """
+    Compara por practica el max_output_tokens configurado con el largo
+    observado (p50/p95/p99/max) y el presupuesto ajustado vigente.
+    """
+    engine = get_engine()
+    return engine.budgets.report() if engine.budgets is not None else []
+
+
+def get_context_cache_report():
+    """
+    Tokens de entrada servidos desde el cache de contexto y latencia
+    promedio con y sin cache, por practica.
+    """
+    return get_engine().usage.context_cache_report()
+
+
+def invalidate_response(prompt, max_tokens=None, response_schema=None, system_instruction=None):
+    """Descarta la respuesta cacheada de un prompt (ej: cuando no se pudo interpretar)"""
+    get_engine().invalidate(prompt, max_tokens, response_schema, system_instruction)
+
+
+def esquema_objeto(campos, requeridos=None):
+    """
+    Construye un response_schema de tipo objeto.
+
+    Args:
+        campos: dict {nombre: descripcion} para campos de texto, o
+            {nombre: schema} para otros tipos
+        requeridos: Campos obligatorios (default: todos)
+
+    Returns:
+        dict: Schema JSON para response_schema
+    """
+    propiedades = {
+        nombre: {"type": "string", "description": valor} if isinstance(valor, str) else valor
+        for nombre, valor in campos.items()
+    }
+    return {
+        "type": "object",
+        "properties": propiedades,
+        "required": list(requeridos if requeridos is not None else propiedades)
+    }
+
+
+# ==================== TRABAJOS EN SEGUNDO PLANO ====================
+
+def submit_generation(prompt, practice_key, parse=None, max_tokens=None, use_cache=True,
+                      response_schema=None, system_instruction=None, deadline=None):
+    """
+    Lanza una generacion en segundo plano: sobrevive a reruns y a cambios
+    de practica. Guardar el id en st.session_state y seguirlo con render_job.
+
+    Args:
+        prompt: Texto del prompt
+        practice_key: Practica que origina la llamada
+        parse: Funcion(texto) -> datos, corre en el worker; si retorna None
+            se invalida la respuesta cacheada
+        max_tokens, use_cache, response_schema, system_instruction, deadline:
+            como en generate_response. Cancelar el trabajo abandona la llamada
+
+    Returns:
+        str: id del trabajo
+    """
+    engine = get_engine()
+    identity = identidad_actual()
+
+    def trabajo(cancel_event):
+        if cancel_event.is_set():
+            return None
+        text = engine.generate(
+            prompt, max_tokens, use_cache, identity,
+            practice_key=practice_key,
+            response_schema=response_schema,
+            system_instruction=system_instruction,
+            deadline=deadline,
+            cancel=CancelToken(event=cancel_event)
+        )
+        if parse is None:
+            return text
+        data = parse(text)
+        if data is None:
+            engine.invalidate(prompt, max_tokens, response_schema, system_instruction)
+        return data
+
+    return get_job_manager().submit(trabajo, owner=identity[0], practice_key=practice_key)
+
+
+@st.fragment(run_every=1.0)
+def _esperar_job(job_id, owner):
+    """Consulta el trabajo cada segundo y refresca la pagina cuando termina"""
+    job = get_job_manager().get(job_id, owner)
+    if job is None or job.listo:
+        st.rerun()
+
+
+def render_job(state_key, mensaje="Generando..."):
+    """
+    Sigue el trabajo cuyo id esta en st.session_state[state_key].
+    Mientras corre muestra el estado y un boton Cancelar; al terminar
+    lo retira del registro y de la sesion.
+
+    Returns:
+        Job: el trabajo terminado (estado listo, error o cancelado), o None
+            si no hay trabajo o aun esta corriendo
+    """
+    job_id = st.session_state.get(state_key)
+    if not job_id:
+        return None
+
+    manager = get_job_manager()
+    owner = identidad_actual()[0]
+    job = manager.get(job_id, owner)
+    if job is None:
+        # Expiro sin que nadie lo recogiera, o el proceso se reinicio
+        del st.session_state[state_key]
+        st.markdown(
+            '<div class="custom-warning">El resultado anterior ya no esta disponible. Genera de nuevo.</div>',
+            unsafe_allow_html=True
+        )
+        return None
+
+    if job.listo:
+        manager.collect(job_id, owner)
+        del st.session_state[state_key]
+        if job.estado == Job.ERROR:
+            _mostrar_error(job.error)
+        elif job.estado == Job.CANCELADO:
+            st.markdown('<div class="custom-info">Generacion cancelada.</div>', unsafe_allow_html=True)
+        return job
+
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        st.markdown(
+            f'<div class="custom-info">{mensaje} Puedes seguir navegando: '
+            f'el resultado te esperara aqui.</div>',
+            unsafe_allow_html=True
+        )
+    with col2:
+        if st.button("Cancelar", key=f"{state_key}_cancelar", use_container_width=True):
+            manager.cancel(job_id, owner)
+            del st.session_state[state_key]
+            st.rerun()
+    _esperar_job(job_id, owner)
+    return None
+
+
+def get_job_stats():
+    """Retorna la cantidad de trabajos en segundo plano por estado"""
+    return get_job_manager().stats()
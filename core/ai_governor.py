@@ -0,0 +1,261 @@
+"""
+Gobernador de concurrencia para las llamadas a Gemini
+- Tope global de llamadas en vuelo
+- Token buckets por usuario (email) y por organizacion
+- Fila justa: round-robin entre organizaciones/usuarios
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+from .metrics import metrics
+
+
+class ColaSaturada(Exception):
+    """La solicitud espero en la fila mas del maximo permitido."""
+
+
+class TokenBucket:
+    """Bucket con recarga continua de `rate` tokens por segundo y capacidad `burst`."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _recargar(self, ahora):
+        self.tokens = min(self.burst, self.tokens + (ahora - self.updated) * self.rate)
+        self.updated = ahora
+
+    def disponible(self, ahora):
+        self._recargar(ahora)
+        return self.tokens >= 1
+
+    def consumir(self, ahora):
+        self._recargar(ahora)
+        self.tokens -= 1
+
+    def espera(self, ahora):
+        """Segundos hasta que haya un token disponible."""
+        self._recargar(ahora)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class _Ticket:
+    __slots__ = ("user", "org", "tenant", "granted", "enqueued_at")
+
+    def __init__(self, user, org):
+        self.user = user or "anonimo"
+        self.org = org
+        self.tenant = f"org:{org}" if org else f"user:{self.user}"
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+
+
+class Governor:
+    """
+    Controla el acceso a Gemini para todo el proceso.
+    Cada organizacion (o usuario individual) tiene su propia fila y los
+    turnos se reparten en round-robin, de modo que una organizacion con
+    muchos asientos no acapara la cuota del resto.
+    """
+
+    def __init__(self, max_inflight=24, user_rate_per_min=60, user_burst=20,
+                 org_rate_per_min=300, org_burst=60, max_wait_seconds=120):
+        self.max_inflight = max_inflight
+        self.user_rate = user_rate_per_min / 60.0
+        self.user_burst = user_burst
+        self.org_rate = org_rate_per_min / 60.0
+        self.org_burst = org_burst
+        self.max_wait_seconds = max_wait_seconds
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._filas = OrderedDict()
+        self._buckets_user = {}
+        self._buckets_org = {}
+
+    # ==================== INTERNOS (con lock) ====================
+
+    def _bucket_user(self, user):
+        bucket = self._buckets_user.get(user)
+        if bucket is None:
+            bucket = self._buckets_user[user] = TokenBucket(self.user_rate, self.user_burst)
+        return bucket
+
+    def _bucket_org(self, org):
+        if not org:
+            return None
+        bucket = self._buckets_org.get(org)
+        if bucket is None:
+            bucket = self._buckets_org[org] = TokenBucket(self.org_rate, self.org_burst)
+        return bucket
+
+    def _puede_pasar(self, ticket, ahora):
+        if not self._bucket_user(ticket.user).disponible(ahora):
+            return False
+        bucket_org = self._bucket_org(ticket.org)
+        return bucket_org is None or bucket_org.disponible(ahora)
+
+    def _profundidad(self):
+        return sum(len(fila) for fila in self._filas.values())
+
+    def _despachar(self):
+        """Asigna turnos libres en round-robin entre filas."""
+        ahora = time.monotonic()
+        asignado = False
+        while self._inflight < self.max_inflight and self._filas:
+            elegido = None
+            for tenant, fila in self._filas.items():
+                if self._puede_pasar(fila[0], ahora):
+                    elegido = tenant
+                    break
+            if elegido is None:
+                break
+
+            fila = self._filas.pop(elegido)
+            ticket = fila.popleft()
+            if fila:
+                # La fila vuelve al final: el siguiente turno es de otro
+                self._filas[elegido] = fila
+
+            self._bucket_user(ticket.user).consumir(ahora)
+            bucket_org = self._bucket_org(ticket.org)
+            if bucket_org is not None:
+                bucket_org.consumir(ahora)
+            ticket.granted = True
+            self._inflight += 1
+            asignado = True
+            metrics.observe("ai.queue.wait_ms", (ahora - ticket.enqueued_at) * 1000)
+
+        metrics.set_gauge("ai.queue.depth", self._profundidad())
+        metrics.set_gauge("ai.inflight", self._inflight)
+        if asignado:
+            self._cond.notify_all()
+
+    def _proxima_recarga(self):
+        """
+        Segundos hasta que algun ticket bloqueado por rate limit pueda pasar.
+        None si ninguno espera recarga (solo los frena el tope en vuelo:
+        release() los despierta).
+        """
+        ahora = time.monotonic()
+        esperas = []
+        for fila in self._filas.values():
+            ticket = fila[0]
+            espera = self._bucket_user(ticket.user).espera(ahora)
+            bucket_org = self._bucket_org(ticket.org)
+            if bucket_org is not None:
+                espera = max(espera, bucket_org.espera(ahora))
+            if espera > 0:
+                esperas.append(espera)
+        return min(esperas) if esperas else None
+
+    def _posicion(self, ticket):
+        """Turnos estimados antes de este ticket con reparto round-robin."""
+        fila = self._filas.get(ticket.tenant)
+        if not fila or ticket not in fila:
+            return 0
+        indice = fila.index(ticket)
+        otros = sum(
+            min(len(f), indice + 1)
+            for tenant, f in self._filas.items() if tenant != ticket.tenant
+        )
+        return otros + indice + 1
+
+    def _retirar(self, ticket):
+        fila = self._filas.get(ticket.tenant)
+        if fila and ticket in fila:
+            fila.remove(ticket)
+            if not fila:
+                del self._filas[ticket.tenant]
+
+    # ==================== API ====================
+
+    def acquire(self, user=None, org=None, on_wait=None, cancel=None):
+        """
+        Espera un turno para llamar a Gemini.
+
+        Args:
+            user: Email del usuario
+            org: organization_id (opcional)
+            on_wait: Callback(posicion) invocado mientras se espera en la fila
+            cancel: CancelToken (opcional); deja la fila si se cancela o vence
+
+        Raises:
+            ColaSaturada: si la espera supera max_wait_seconds
+            Cancelado, DeadlineExcedido: segun `cancel`
+        """
+        ticket = _Ticket(user, org)
+        with self._cond:
+            self._filas.setdefault(ticket.tenant, deque()).append(ticket)
+            self._despachar()
+
+        try:
+            while True:
+                with self._cond:
+                    if ticket.granted:
+                        return
+                    esperado = time.monotonic() - ticket.enqueued_at
+                    if esperado > self.max_wait_seconds:
+                        self._retirar(ticket)
+                        metrics.incr("ai.queue.rejected")
+                        raise ColaSaturada(
+                            "Hay mucha demanda en este momento. Intenta de nuevo en unos minutos."
+                        )
+                    recarga = self._proxima_recarga()
+                    timeout = 0.5 if recarga is None else min(0.5, max(recarga, 0.01))
+                    self._cond.wait(timeout)
+                    self._despachar()
+                    if ticket.granted:
+                        return
+                    posicion = self._posicion(ticket)
+                if cancel is not None:
+                    cancel.check()
+                if on_wait:
+                    on_wait(posicion)
+        except BaseException:
+            # Interrupcion del llamador: liberar el lugar o el turno ya asignado
+            with self._cond:
+                if ticket.granted:
+                    self._inflight -= 1
+                else:
+                    self._retirar(ticket)
+                self._despachar()
+            raise
+
+    def try_acquire(self):
+        """
+        Toma un lugar en vuelo sin esperar ni consumir cuota (ej: la llamada
+        de cobertura de un intento lento). Solo si hay lugar libre y nadie
+        espera en la fila.
+
+        Returns:
+            bool: True si se obtuvo; liberarlo con release()
+        """
+        with self._cond:
+            if self._inflight >= self.max_inflight or self._filas:
+                return False
+            self._inflight += 1
+            metrics.set_gauge("ai.inflight", self._inflight)
+            return True
+
+    def release(self):
+        """Libera un turno obtenido con acquire()."""
+        with self._cond:
+            self._inflight -= 1
+            self._despachar()
+            self._cond.notify_all()
+
+    def stats(self):
+        """Estado actual: llamadas en vuelo y profundidad de cada fila."""
+        with self._cond:
+            return {
+                "inflight": self._inflight,
+                "max_inflight": self.max_inflight,
+                "queue_depth": self._profundidad(),
+                "filas": {tenant: len(fila) for tenant, fila in self._filas.items()}
+            }
@@ -0,0 +1,172 @@
+"""
+Trabajos de generacion en segundo plano
+Corren en un pool propio, fuera del hilo del script de Streamlit: un rerun
+o un cambio de practica no descarta la llamada a la IA. La sesion guarda
+solo el id del trabajo y recoge el resultado en un rerun posterior.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """Estado de un trabajo. `cancel_event` se entrega a la funcion del trabajo."""
+
+    PENDIENTE = "pendiente"
+    EN_CURSO = "en_curso"
+    LISTO = "listo"
+    ERROR = "error"
+    CANCELADO = "cancelado"
+
+    TERMINADOS = (LISTO, ERROR, CANCELADO)
+
+    def __init__(self, owner, practice_key):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.practice_key = practice_key
+        self.estado = self.PENDIENTE
+        self.resultado = None
+        self.error = None
+        self.creado = time.time()
+        self.terminado = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    @property
+    def listo(self):
+        return self.estado in self.TERMINADOS
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "practice_key": self.practice_key,
+            "estado": self.estado,
+            "error": str(self.error) if self.error else None,
+            "creado": self.creado,
+            "terminado": self.terminado
+        }
+
+
+class JobManager:
+    """
+    Registro de trabajos del proceso.
+    Los trabajos terminados que nadie recoge se descartan tras `ttl_seconds`.
+    """
+
+    def __init__(self, max_workers=4, ttl_seconds=900):
+        self.ttl_seconds = ttl_seconds
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="yocreo-jobs")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, fn, *args, owner=None, practice_key=None, **kwargs):
+        """
+        Lanza `fn(cancel_event, *args, **kwargs)` en segundo plano.
+
+        Args:
+            owner: Email del usuario (solo el puede consultar el trabajo)
+            practice_key: Practica que lo origina
+
+        Returns:
+            str: id del trabajo
+        """
+        self.purge()
+        job = Job(owner, practice_key)
+        with self._lock:
+            self._jobs[job.id] = job
+        job.future = self._pool.submit(self._correr, job, fn, args, kwargs)
+        metrics.incr("ai.jobs", estado="lanzado", practice=practice_key or "sin_practica")
+        self._actualizar_gauge()
+        return job.id
+
+    def _correr(self, job, fn, args, kwargs):
+        if job.cancel_event.is_set():
+            return
+        job.estado = Job.EN_CURSO
+        try:
+            resultado = fn(job.cancel_event, *args, **kwargs)
+        except Exception as e:
+            logger.warning("Trabajo %s (%s) fallo: %s", job.id, job.practice_key, e)
+            job.error = e
+            estado = Job.ERROR
+        else:
+            job.resultado = resultado
+            estado = Job.LISTO
+        if job.cancel_event.is_set():
+            # Cancelado mientras corria: el resultado se descarta
+            estado = Job.CANCELADO
+            job.resultado = None
+        job.estado = estado
+        job.terminado = time.time()
+        metrics.incr("ai.jobs", estado=estado, practice=job.practice_key or "sin_practica")
+        self._actualizar_gauge()
+
+    def get(self, job_id, owner=None):
+        """Retorna el trabajo o None si no existe, expiro o es de otro usuario."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def collect(self, job_id, owner=None):
+        """Retira y retorna el trabajo si ya termino; None si sigue corriendo."""
+        job = self.get(job_id, owner)
+        if job is None or not job.listo:
+            return None
+        with self._lock:
+            self._jobs.pop(job_id, None)
+        self._actualizar_gauge()
+        return job
+
+    def cancel(self, job_id, owner=None):
+        """
+        Cancela un trabajo. Si aun no empezaba no se ejecuta; si esta
+        corriendo, su funcion ve cancel_event y el resultado se descarta.
+        """
+        job = self.get(job_id, owner)
+        if job is None or job.listo:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.estado = Job.CANCELADO
+            job.terminado = time.time()
+            metrics.incr("ai.jobs", estado=Job.CANCELADO, practice=job.practice_key or "sin_practica")
+        return True
+
+    def purge(self):
+        """Descarta los trabajos terminados hace mas de ttl_seconds."""
+        limite = time.time() - self.ttl_seconds
+        with self._lock:
+            vencidos = [
+                job_id for job_id, job in self._jobs.items()
+                if job.listo and job.terminado is not None and job.terminado < limite
+            ]
+            for job_id in vencidos:
+                del self._jobs[job_id]
+        if vencidos:
+            metrics.incr("ai.jobs.expired", len(vencidos))
+            self._actualizar_gauge()
+        return len(vencidos)
+
+    def _actualizar_gauge(self):
+        with self._lock:
+            activos = sum(1 for job in self._jobs.values() if not job.listo)
+            total = len(self._jobs)
+        metrics.set_gauge("ai.jobs.active", activos)
+        metrics.set_gauge("ai.jobs.stored", total)
+
+    def stats(self):
+        """Cantidad de trabajos por estado."""
+        with self._lock:
+            conteo = {}
+            for job in self._jobs.values():
+                conteo[job.estado] = conteo.get(job.estado, 0) + 1
+        return conteo
@@ -0,0 +1,229 @@
+"""
+Pool de generaciones precalculadas
+Un hilo en segundo plano mantiene el pool sobre un minimo (low_water)
+para que tomar un elemento sea instantaneo, y genera mas cuando un
+usuario ya vio todo lo que hay. Los elementos se deduplican
+por una clave de texto y cada usuario nunca recibe dos veces el mismo.
+Opcionalmente el pool y lo ya visto por cada usuario se guardan en SQLite.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .ai_cache import normalizar_prompt
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def huella(texto):
+    """Id estable de un elemento: hash del texto normalizado (sin mayusculas ni espacios extra)"""
+    return hashlib.sha256(normalizar_prompt(texto).lower().encode("utf-8")).hexdigest()[:32]
+
+
+class GenerationPool:
+    """
+    Pool de elementos (dicts) generados con `generar()`.
+
+    Args:
+        nombre: Nombre del pool (tabla/metricas)
+        generar: Funcion sin argumentos que retorna una lista de elementos
+        clave: Funcion(elemento) -> texto sobre el que se deduplica
+        low_water: Bajo este tamano el hilo vuelve a generar
+        target: Tamano al que se rellena
+        max_recent: Huellas recientes recordadas para no repetir contenido
+        max_size: Tope del pool; sobre el se descartan los mas antiguos
+            (default: 3 * target)
+        disk_path: Ruta SQLite (opcional)
+    """
+
+    def __init__(self, nombre, generar, clave, low_water=5, target=15,
+                 max_recent=5000, max_size=None, disk_path=None):
+        self.nombre = nombre
+        self.generar = generar
+        self.clave = clave
+        self.low_water = low_water
+        self.target = max(target, low_water + 1)
+        self.max_recent = max_recent
+        self.max_size = max(max_size or 3 * self.target, self.target)
+        self._cond = threading.Condition()
+        # Un usuario no encontro nada nuevo: rellenar aunque haya low_water
+        self._pedido = False
+        self._items = OrderedDict()
+        self._recientes = OrderedDict()
+        self._vistos = {}
+        self._db = self._abrir_db(disk_path) if disk_path else None
+        self._cargar_disco()
+        self._hilo = threading.Thread(target=self._bucle, name=f"yocreo-pool-{nombre}", daemon=True)
+        self._hilo.start()
+
+    # ==================== DISCO ====================
+
+    def _abrir_db(self, path):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pool_items ("
+                " pool TEXT NOT NULL, id TEXT NOT NULL, data TEXT NOT NULL,"
+                " created_at REAL NOT NULL, PRIMARY KEY (pool, id))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS pool_seen ("
+                " pool TEXT NOT NULL, user TEXT NOT NULL, id TEXT NOT NULL,"
+                " seen_at REAL NOT NULL, PRIMARY KEY (pool, user, id))"
+            )
+            return db
+        except Exception as e:
+            logger.warning("No se pudo abrir el pool en disco (%s): %s", path, e)
+            return None
+
+    def _sql(self, query, params=()):
+        if self._db is None:
+            return []
+        try:
+            return self._db.execute(query, params).fetchall()
+        except Exception as e:
+            logger.warning("Error en el pool %s en disco: %s", self.nombre, e)
+            return []
+
+    def _cargar_disco(self):
+        filas = self._sql(
+            "SELECT id, data FROM pool_items WHERE pool = ? ORDER BY created_at", (self.nombre,)
+        )
+        for item_id, data in filas:
+            self._items[item_id] = json.loads(data)
+            self._recientes[item_id] = True
+
+    def _vistos_de(self, user):
+        """Huellas ya entregadas al usuario (con lock tomado)."""
+        vistos = self._vistos.get(user)
+        if vistos is None:
+            filas = self._sql(
+                "SELECT id FROM pool_seen WHERE pool = ? AND user = ?", (self.nombre, user)
+            )
+            vistos = self._vistos[user] = {fila[0] for fila in filas}
+        return vistos
+
+    # ==================== API ====================
+
+    def add(self, items):
+        """Agrega elementos nuevos; descarta los repetidos. Retorna cuantos agrego."""
+        agregados = 0
+        with self._cond:
+            for item in items:
+                texto = self.clave(item)
+                if not texto:
+                    continue
+                item_id = huella(texto)
+                if item_id in self._recientes:
+                    metrics.incr("ai.pool.duplicates", pool=self.nombre)
+                    continue
+                self._items[item_id] = item
+                self._recientes[item_id] = True
+                while len(self._recientes) > self.max_recent:
+                    self._recientes.popitem(last=False)
+                self._sql(
+                    "INSERT OR REPLACE INTO pool_items (pool, id, data, created_at) VALUES (?, ?, ?, ?)",
+                    (self.nombre, item_id, json.dumps(item, ensure_ascii=False), time.time())
+                )
+                agregados += 1
+            if agregados:
+                self._pedido = False
+            while len(self._items) > self.max_size:
+                # Los mas antiguos son los que mas usuarios ya vieron
+                viejo, _ = self._items.popitem(last=False)
+                self._sql("DELETE FROM pool_items WHERE pool = ? AND id = ?", (self.nombre, viejo))
+                metrics.incr("ai.pool.evicted", pool=self.nombre)
+            metrics.set_gauge("ai.pool.size", len(self._items), pool=self.nombre)
+        return agregados
+
+    def pop(self, user=None):
+        """
+        Entrega al instante un elemento que el usuario no haya visto.
+
+        Returns:
+            dict o None si el pool no tiene nada nuevo para el usuario
+        """
+        user = user or "anonimo"
+        with self._cond:
+            vistos = self._vistos_de(user)
+            elegido = next((item_id for item_id in self._items if item_id not in vistos), None)
+            if elegido is None:
+                metrics.incr("ai.pool.misses", pool=self.nombre)
+                self._pedido = True
+                self._cond.notify_all()
+                return None
+            item = self._items.pop(elegido)
+            self._marcar(user, elegido)
+            self._sql("DELETE FROM pool_items WHERE pool = ? AND id = ?", (self.nombre, elegido))
+            metrics.incr("ai.pool.hits", pool=self.nombre)
+            metrics.set_gauge("ai.pool.size", len(self._items), pool=self.nombre)
+            if len(self._items) < self.low_water:
+                self._cond.notify_all()
+        return item
+
+    def _marcar(self, user, item_id):
+        """Registra una huella como vista por el usuario (con lock tomado)."""
+        self._vistos_de(user).add(item_id)
+        self._sql(
+            "INSERT OR IGNORE INTO pool_seen (pool, user, id, seen_at) VALUES (?, ?, ?, ?)",
+            (self.nombre, user, item_id, time.time())
+        )
+
+    def marcar_visto(self, user, item):
+        """Registra que el usuario ya recibio el elemento (ej: generado fuera del pool)."""
+        with self._cond:
+            self._marcar(user or "anonimo", huella(self.clave(item) or ""))
+
+    def ya_visto(self, user, item):
+        with self._cond:
+            return huella(self.clave(item) or "") in self._vistos_de(user or "anonimo")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "pool": self.nombre,
+                "size": len(self._items),
+                "low_water": self.low_water,
+                "target": self.target,
+                "users": len(self._vistos),
+                "disk": self._db is not None
+            }
+
+    # ==================== RELLENO ====================
+
+    def _bucle(self):
+        """
+        Hilo de relleno: duerme hasta bajar de low_water (o hasta que un
+        usuario no encuentre nada nuevo) y rellena hasta target. Los
+        errores y las tandas sin nada nuevo esperan con backoff exponencial.
+        """
+        espera = 1.0
+        while True:
+            with self._cond:
+                while len(self._items) >= self.low_water and not self._pedido:
+                    self._cond.wait()
+            while True:
+                with self._cond:
+                    if len(self._items) >= self.target and not self._pedido:
+                        break
+                agregados = 0
+                try:
+                    agregados = self.add(self.generar() or [])
+                    metrics.incr("ai.pool.generated", agregados, pool=self.nombre)
+                except Exception as e:
+                    logger.warning("Error rellenando el pool %s: %s", self.nombre, e)
+                    metrics.incr("ai.pool.errors", pool=self.nombre)
+                if agregados:
+                    espera = 1.0
+                    continue
+                time.sleep(espera)
+                espera = min(espera * 2, 60.0)
@@ -0,0 +1,177 @@
+"""
+Politicas de resiliencia para las llamadas a Gemini
+- Reintentos con backoff exponencial y jitter
+- Deadline por intento y deadline total por llamada
+- Cancelacion cooperativa (CancelToken)
+- Circuit breaker para pasar al modelo de respaldo
+"""
+
+import random
+import threading
+import time
+
+from google.api_core import exceptions as gexc
+
+# Errores transitorios: vale la pena reintentar
+ERRORES_REINTENTABLES = (
+    gexc.ResourceExhausted,
+    gexc.TooManyRequests,
+    gexc.ServiceUnavailable,
+    gexc.InternalServerError,
+    gexc.BadGateway,
+    gexc.GatewayTimeout,
+    gexc.DeadlineExceeded,
+    gexc.Aborted,
+    gexc.Unknown,
+    ConnectionError,
+    TimeoutError
+)
+
+
+class Cancelado(Exception):
+    """El usuario (o la sesion) cancelo la generacion."""
+
+
+class DeadlineExcedido(Exception):
+    """La llamada supero su deadline total. No se reintenta."""
+
+
+def es_reintentable(error):
+    """Indica si un error de la IA es transitorio."""
+    return isinstance(error, ERRORES_REINTENTABLES)
+
+
+class RetryPolicy:
+    """Parametros de reintento, deadline por intento y hedging."""
+
+    def __init__(self, max_attempts=3, base_delay=0.5, max_delay=8.0,
+                 attempt_timeout=60.0, hedge=False, hedge_quantile=0.95,
+                 hedge_min_samples=20):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.attempt_timeout = attempt_timeout
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+
+    def backoff(self, intento):
+        """Espera antes del reintento `intento` (0-based): full jitter."""
+        tope = min(self.max_delay, self.base_delay * (2 ** intento))
+        return random.uniform(0, tope)
+
+
+class CircuitBreaker:
+    """
+    Abre el circuito tras `failure_threshold` fallos consecutivos y lo
+    mantiene abierto `reset_seconds`; luego deja pasar una llamada de
+    prueba (semi-abierto) para decidir si cerrarlo.
+    """
+
+    CERRADO = "cerrado"
+    ABIERTO = "abierto"
+    SEMI_ABIERTO = "semi_abierto"
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._fallos = 0
+        self._estado = self.CERRADO
+        self._abierto_desde = 0.0
+        self._prueba_en_curso = False
+
+    def allow(self):
+        """Indica si se puede usar el recurso protegido."""
+        with self._lock:
+            if self._estado == self.CERRADO:
+                return True
+            if self._estado == self.ABIERTO:
+                if time.monotonic() - self._abierto_desde < self.reset_seconds:
+                    return False
+                self._estado = self.SEMI_ABIERTO
+                self._prueba_en_curso = False
+            if self._prueba_en_curso:
+                return False
+            self._prueba_en_curso = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._fallos = 0
+            self._estado = self.CERRADO
+            self._prueba_en_curso = False
+
+    def record_failure(self):
+        with self._lock:
+            self._fallos += 1
+            if self._estado == self.SEMI_ABIERTO or self._fallos >= self.failure_threshold:
+                self._estado = self.ABIERTO
+                self._abierto_desde = time.monotonic()
+                self._prueba_en_curso = False
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado
+
+
+class CancelToken:
+    """
+    Cancelacion cooperativa con deadline opcional. Quien espera a la IA
+    consulta check() entre pasos (turno, reintento, fragmento) y se
+    detiene lanzando Cancelado o DeadlineExcedido.
+
+    Args:
+        deadline: Segundos desde ahora (None: sin limite)
+        event: threading.Event existente (ej: el cancel_event de un trabajo)
+    """
+
+    def __init__(self, deadline=None, event=None):
+        self._event = event or threading.Event()
+        self.deadline = None
+        self._expira = None
+        self.limitar(deadline)
+
+    def limitar(self, segundos):
+        """Acota el deadline a `segundos` desde ahora; nunca lo extiende."""
+        if not segundos:
+            return
+        expira = time.monotonic() + segundos
+        if self._expira is None or expira < self._expira:
+            self._expira = expira
+            self.deadline = segundos
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelado(self):
+        return self._event.is_set()
+
+    @property
+    def vencido(self):
+        return self._expira is not None and time.monotonic() >= self._expira
+
+    def restante(self):
+        """Segundos que quedan (None si no hay deadline)."""
+        if self._expira is None:
+            return None
+        return max(0.0, self._expira - time.monotonic())
+
+    def check(self):
+        """Lanza Cancelado o DeadlineExcedido si corresponde."""
+        if self._event.is_set():
+            raise Cancelado("Generacion cancelada.")
+        if self.vencido:
+            raise DeadlineExcedido(
+                f"La IA no respondio dentro de {self.deadline:g} segundos. Intenta de nuevo."
+            )
+
+    def sleep(self, segundos):
+        """Espera `segundos` o hasta la cancelacion/deadline, lo que ocurra primero."""
+        restante = self.restante()
+        if restante is not None:
+            segundos = min(segundos, restante)
+        self._event.wait(max(0.0, segundos))
+        self.check()
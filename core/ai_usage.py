@@ -0,0 +1,181 @@
+"""
+Contabilidad de tokens y latencia por practica
+A partir de usage_metadata de Gemini; se agrega en memoria y se envia
+periodicamente a Supabase junto a los eventos de uso.
+"""
+
+import logging
+import threading
+import time
+
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+def extraer_uso(response):
+    """
+    Lee usage_metadata y finish_reason de una respuesta (o del ultimo
+    fragmento de un stream) de Gemini.
+
+    Returns:
+        dict: prompt_tokens, cached_tokens, output_tokens, total_tokens, finish_reason
+    """
+    uso = {}
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata:
+        uso["prompt_tokens"] = getattr(metadata, "prompt_token_count", 0) or 0
+        # Parte de prompt_tokens servida desde el cache de contexto
+        uso["cached_tokens"] = getattr(metadata, "cached_content_token_count", 0) or 0
+        uso["output_tokens"] = getattr(metadata, "candidates_token_count", 0) or 0
+        uso["total_tokens"] = getattr(metadata, "total_token_count", 0) or 0
+    try:
+        candidato = response.candidates[0]
+        reason = candidato.finish_reason
+        if reason:
+            uso["finish_reason"] = getattr(reason, "name", str(reason))
+    except (AttributeError, IndexError, TypeError):
+        pass
+    return uso
+
+
+class UsageAccounting:
+    """
+    Agrega llamadas por (practica, organizacion, modelo) y las envia a
+    `sink(filas)` cada `flush_seconds` desde un hilo en segundo plano.
+    """
+
+    def __init__(self, sink=None, flush_seconds=60):
+        self.sink = sink
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pendientes = {}
+        self._contexto = {}
+        self._hilo = None
+
+    def record(self, practice_key, uso, latency_ms, model, organization_id=None, source="api"):
+        """
+        Registra una llamada.
+
+        Args:
+            practice_key: Clave de la practica (o None)
+            uso: dict de extraer_uso()
+            latency_ms: Latencia total de la llamada
+            model: Modelo que respondio
+            organization_id: Organizacion del usuario (opcional)
+            source: 'api', 'cache' o 'coalesced'
+        """
+        practica = practice_key or "sin_practica"
+        metrics.incr("ai.calls", practice=practica, source=source)
+        if source != "api":
+            return
+
+        prompt_tokens = uso.get("prompt_tokens", 0)
+        cached_tokens = uso.get("cached_tokens", 0)
+        output_tokens = uso.get("output_tokens", 0)
+        total_tokens = uso.get("total_tokens", 0) or prompt_tokens + output_tokens
+        finish_reason = uso.get("finish_reason", "UNKNOWN")
+
+        metrics.observe("ai.tokens.prompt", prompt_tokens, buckets=TOKEN_BUCKETS, practice=practica)
+        metrics.observe("ai.tokens.output", output_tokens, buckets=TOKEN_BUCKETS, practice=practica)
+        metrics.observe("ai.tokens.total", total_tokens, buckets=TOKEN_BUCKETS, practice=practica)
+        metrics.observe("ai.practice.latency_ms", latency_ms, practice=practica)
+        metrics.observe("ai.tokens.cached", cached_tokens, buckets=TOKEN_BUCKETS, practice=practica)
+        metrics.observe(
+            "ai.context_cache.latency_ms", latency_ms,
+            practice=practica, cache="hit" if cached_tokens else "miss"
+        )
+        metrics.incr("ai.finish_reason", practice=practica, reason=finish_reason)
+
+        key = (practica, organization_id, model)
+        with self._lock:
+            fila = self._pendientes.get(key)
+            if fila is None:
+                fila = self._pendientes[key] = {
+                    "practice_key": practica,
+                    "organization_id": organization_id,
+                    "model": model,
+                    "calls": 0,
+                    "prompt_tokens": 0,
+                    "cached_tokens": 0,
+                    "output_tokens": 0,
+                    "total_tokens": 0,
+                    "latency_ms_sum": 0.0,
+                    "latency_ms_max": 0.0,
+                    "truncated": 0
+                }
+            fila["calls"] += 1
+            fila["prompt_tokens"] += prompt_tokens
+            fila["cached_tokens"] += cached_tokens
+            fila["output_tokens"] += output_tokens
+            fila["total_tokens"] += total_tokens
+            fila["latency_ms_sum"] += latency_ms
+            fila["latency_ms_max"] = max(fila["latency_ms_max"], latency_ms)
+            if finish_reason == "MAX_TOKENS":
+                fila["truncated"] += 1
+
+            contexto = self._contexto.get(practica)
+            if contexto is None:
+                contexto = self._contexto[practica] = {
+                    "calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                    "hit_calls": 0, "hit_ms": 0.0, "miss_calls": 0, "miss_ms": 0.0
+                }
+            contexto["calls"] += 1
+            contexto["prompt_tokens"] += prompt_tokens
+            contexto["cached_tokens"] += cached_tokens
+            tipo = "hit" if cached_tokens else "miss"
+            contexto[f"{tipo}_calls"] += 1
+            contexto[f"{tipo}_ms"] += latency_ms
+        self._asegurar_hilo()
+
+    def context_cache_report(self):
+        """
+        Ahorro del cache de contexto por practica desde el inicio del proceso.
+
+        Returns:
+            list: dicts con practice_key, calls, prompt_tokens, cached_tokens,
+                cached_ratio y latencia promedio con/sin cache (ms)
+        """
+        with self._lock:
+            filas = []
+            for practica, c in sorted(self._contexto.items()):
+                filas.append({
+                    "practice_key": practica,
+                    "calls": c["calls"],
+                    "prompt_tokens": c["prompt_tokens"],
+                    "cached_tokens": c["cached_tokens"],
+                    "cached_ratio": round(c["cached_tokens"] / c["prompt_tokens"], 3) if c["prompt_tokens"] else 0.0,
+                    "latency_ms_hit": round(c["hit_ms"] / c["hit_calls"], 1) if c["hit_calls"] else None,
+                    "latency_ms_miss": round(c["miss_ms"] / c["miss_calls"], 1) if c["miss_calls"] else None
+                })
+        return filas
+
+    def flush(self):
+        """Envia los agregados pendientes al sink. Retorna cuantas filas envio."""
+        with self._lock:
+            filas = list(self._pendientes.values())
+            self._pendientes = {}
+        if not filas or self.sink is None:
+            return 0
+        try:
+            self.sink(filas)
+        except Exception as e:
+            logger.warning("Error enviando metricas de IA: %s", e)
+            return 0
+        return len(filas)
+
+    def _asegurar_hilo(self):
+        if self.sink is None or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="yocreo-ai-usage", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
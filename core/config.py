@@ -3,6 +3,8 @@ Configuracion global de YoCreo Suite
 Protocolo Estandar v2.0
 """
 
+import os
+
 # Colores corporativos estrictos
 COLORS = {
     "naranja": "#FF6B4E",      # Boton accion
@@ -14,8 +16,136 @@ COLORS = {
 
 # Configuracion de IA
 AI_CONFIG = {
+    # 'gemini' (API real) o 'fake' (respuestas locales, sin red); tambien AI_BACKEND en secrets
+    "backend": os.environ.get("AI_BACKEND"),
+    "fake_backend": {
+        "latency_ms_p50": 1200,
+        "latency_ms_p95": 4000,
+        "ttft_ms": 400,
+        "chunk_chars": 40,
+        "error_rate": 0.02,
+        "errors": ("ResourceExhausted", "ServiceUnavailable"),
+        "seed": 0
+    },
+    # Instrucciones de sistema >= min_tokens se suben como contexto cacheado
+    "context_cache": {"context_cache_min_tokens": 1024, "context_cache_ttl_seconds": 3600},
     "model": "gemini-2.5-flash",
-    "max_tokens": 8192
+    "max_tokens": 8192,
+    # Cache de respuestas (LRU en memoria + SQLite opcional en disco)
+    "cache_max_bytes": 32 * 1024 * 1024,
+    "cache_path": os.environ.get("AI_CACHE_PATH"),
+    "cache_ttl_seconds": 24 * 3600,
+    # Pool compartido para generaciones concurrentes
+    "max_workers": 16,
+    "max_concurrency": 4,
+    # Gobernador de cuota: tope global y limites por usuario/organizacion
+    "governor": {
+        "max_inflight": 24,
+        "user_rate_per_min": 60,
+        "user_burst": 20,
+        "org_rate_per_min": 300,
+        "org_burst": 60,
+        "max_wait_seconds": 120
+    },
+    # Reintentos, deadline por intento y hedging (segunda llamada tras el p95)
+    "retry": {
+        "max_attempts": 3,
+        "base_delay": 0.5,
+        "max_delay": 8.0,
+        "attempt_timeout": 60.0,
+        "hedge": True,
+        "hedge_quantile": 0.95,
+        "hedge_min_samples": 20
+    },
+    # Modelo liviano cuando el principal esta degradado (circuit breaker)
+    "fallback_model": "gemini-2.5-flash-lite",
+    "circuit_breaker": {
+        "failure_threshold": 5,
+        "reset_seconds": 30.0
+    },
+    # Deadline total por llamada (segundos, incluye fila, reintentos y stream)
+    "deadlines": {
+        "default": 90,
+        "escucha_activa": 45,
+        "correos_diplomaticos": 60,
+        "seguimiento_compromisos": 60,
+        "disculpas_efectivas": 60,
+        "negociador_harvard": 120,
+        "priorizador_tareas": 120
+    },
+    # Generaciones en vivo simultaneas del proceso (cada una ocupa un hilo)
+    "max_live_streams": 32,
+    # Cada cuantos segundos se envian a Supabase los agregados de tokens/latencia
+    "usage_flush_seconds": 60,
+    # Generaciones en segundo plano; las no recogidas se descartan tras ttl_seconds
+    "jobs": {"max_workers": 8, "ttl_seconds": 900},
+    # Personajes de escucha_activa pregenerados (disk_path opcional: SQLite)
+    "persona_pool": {
+        "low_water": 5,
+        "target": 15,
+        "batch": 3,
+        "disk_path": os.environ.get("PERSONA_POOL_PATH")
+    },
+    # max_output_tokens por practica = p99 observado * headroom
+    "output_budget": {"enabled": True, "headroom": 1.3, "min_tokens": 512, "min_samples": 30, "window": 500}
+}
+
+# Practicas que se importan en segundo plano tras el login: primero las
+# mas visitadas del proceso, luego esta lista
+PRECARGA = {
+    "enabled": True,
+    "cantidad": 6,
+    "practicas": [
+        "priorizador_tareas",
+        "feedback_constructivo",
+        "escucha_activa",
+        "correos_diplomaticos",
+        "delegacion_situacional",
+        "negociador_harvard"
+    ]
+}
+
+# Historial de resultados por usuario: SQLite local y copia opcional en
+# Supabase (tabla practice_history) para recuperarlo en otra instancia
+HISTORIAL = {
+    "enabled": True,
+    "path": os.environ.get("HISTORY_PATH", "data/historial.db"),
+    # Copia en Supabase (practice_history): sus politicas RLS exigen el JWT
+    # del usuario, por eso queda apagada con el cliente de anon key
+    "sync_supabase": False,
+    "flush_seconds": 30,
+    "por_pagina": 5,
+    "max_por_practica": 200,
+    # Tareas clasificadas del priorizador que se recuerdan por usuario y rol
+    "max_tareas": 5000,
+    # Entradas identicas a un resultado guardado hace menos de
+    # reutilizar_segundos lo reabren sin llamar a la IA
+    "reutilizar": True,
+    "reutilizar_segundos": 3600
+}
+
+# Modo por lote (planillas CSV/XLSX): filas por archivo y llamadas a la IA
+# simultaneas por usuario (el gobernador de cuota sigue aplicando)
+LOTES = {
+    "max_filas": 500,
+    "max_concurrency": 6,
+    # Modo equipo (una fila por colaborador): todas a la vez si es posible
+    "equipo_max_filas": 30,
+    "equipo_max_concurrency": 15
+}
+
+# Listas grandes en priorizador_tareas: sobre `umbral` tareas (ya sin
+# duplicados) se clasifican por bloques en paralelo y se unen localmente
+PRIORIZADOR = {
+    "umbral": 40,
+    "tareas_por_bloque": 40,
+    "max_concurrency": 6,
+    "max_tareas": 2000,
+    # Reusar el cuadrante guardado de las tareas que no cambiaron: solo las
+    # nuevas o editadas van a la IA
+    "incremental": True,
+    # Pasado este plazo una tarea guardada se vuelve a clasificar
+    "max_edad_dias": 30
 }
 
 # Informacion de la app
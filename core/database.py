@@ -111,3 +111,55 @@ def registrar_uso_practica(email: str, practice_key: str, organization_id: str =
     except Exception as e:
         # No interrumpir el flujo si falla el registro
         logger.warning("Error registrando uso de práctica: %s", e)
+
+
+def registrar_metricas_ia(filas: list):
+    """
+    Registra en Supabase los agregados de tokens y latencia de la IA.
+
+    Args:
+        filas: Lista de dicts con practice_key, organization_id, model,
+            calls, prompt_tokens, output_tokens, total_tokens,
+            latency_ms_sum, latency_ms_max y truncated
+    """
+    try:
+        client = get_supabase()
+        client.table('ai_usage_metrics').insert(filas).execute()
+    except Exception as e:
+        # No interrumpir el flujo si falla el registro
+        logger.warning("Error registrando metricas de IA: %s", e)
+
+
+def guardar_historial(filas: list):
+    """
+    Copia en Supabase resultados del historial local (upsert por id).
+    Tabla practice_history: migrations/005_practice_history.sql
+
+    Args:
+        filas: Lista de dicts con id, email, practice_key, input_hash,
+            titulo, resultado, entradas, data y created_at
+
+    Raises:
+        Exception: si falla; quien sincroniza deja las filas pendientes
+    """
+    client = get_supabase()
+    client.table('practice_history').upsert(filas, on_conflict='id').execute()
+
+
+def obtener_historial(email: str, limite: int = 200) -> list:
+    """
+    Resultados del historial del usuario guardados en Supabase, del mas
+    reciente al mas antiguo.
+
+    Raises:
+        Exception: si falla; quien hidrata vuelve a intentarlo mas tarde
+    """
+    client = get_supabase()
+    response = (
+        client.table('practice_history').select('*')
+        .eq('email', email.lower())
+        .order('created_at', desc=True)
+        .limit(limite)
+        .execute()
+    )
+    return response.data or []
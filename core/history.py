@@ -0,0 +1,550 @@
+"""
+Historial de resultados por usuario
+Cada resultado generado se guarda en SQLite indexado por (email,
+practice_key, created_at) y por el hash de sus entradas, asi reabrir un
+resultado anterior (o repetir las mismas entradas) no llama a la IA.
+Un hilo copia lo nuevo a Supabase y, en una instancia nueva, el historial
+del usuario se recupera desde alli la primera vez que se consulta.
+Tambien guarda el cuadrante de cada tarea ya clasificada en el priorizador
+(por hash de la tarea), para no volver a enviar lo que no cambio.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import streamlit as st
+
+from .ai_cache import normalizar_prompt
+from .config import HISTORIAL
+from .database import guardar_historial, obtener_historial
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_COLUMNAS = "id, practice_key, input_hash, titulo, resultado, entradas, data, created_at"
+
+
+def hash_entradas(entradas):
+    """Hash estable de las entradas de una practica (ignora espacios extra)"""
+    normalizadas = {
+        clave: normalizar_prompt(valor) if isinstance(valor, str) else valor
+        for clave, valor in (entradas or {}).items()
+    }
+    texto = json.dumps(normalizadas, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:32]
+
+
+def recortar(texto, largo=60):
+    """Texto en una linea de a lo mas `largo` caracteres"""
+    texto = " ".join(texto.split())
+    return texto if len(texto) <= largo else texto[:largo - 3] + "..."
+
+
+def resumen(entradas, largo=60):
+    """Titulo por defecto de una entrada: el primer texto no vacio, recortado"""
+    for valor in (entradas or {}).values():
+        if isinstance(valor, str) and valor.strip():
+            return recortar(valor, largo)
+    return "Sin titulo"
+
+
+def _fila(row):
+    item_id, practica, input_hash, titulo, resultado, entradas, data, created_at = row
+    return {
+        "id": item_id,
+        "practice_key": practica,
+        "input_hash": input_hash,
+        "titulo": titulo,
+        "resultado": resultado,
+        "entradas": json.loads(entradas) if entradas else {},
+        "data": json.loads(data) if data else None,
+        "created_at": created_at
+    }
+
+
+class HistoryStore:
+    """
+    Historial persistente de resultados.
+
+    Args:
+        path: Ruta SQLite (None: solo en memoria)
+        sink: Funcion(filas) que copia filas nuevas afuera (ej: Supabase)
+        fuente: Funcion(email, limite) -> filas guardadas afuera
+        flush_seconds: Cada cuanto se envian las filas pendientes al sink
+        max_por_practica: Resultados que se conservan por usuario y practica
+        max_tareas: Tareas clasificadas que se conservan por usuario y rol
+    """
+
+    def __init__(self, path=None, sink=None, fuente=None, flush_seconds=30, max_por_practica=200,
+                 max_tareas=5000):
+        self.sink = sink
+        self.fuente = fuente
+        self.flush_seconds = flush_seconds
+        self.max_por_practica = max_por_practica
+        self.max_tareas = max_tareas
+        self._lock = threading.Lock()
+        self._hidratados = set()
+        # email -> momento del ultimo intento fallido de hidratar
+        self._fallos_hidratar = {}
+        self._hilo = None
+        self._db = self._abrir_db(path)
+
+    # ==================== DISCO ====================
+
+    def _abrir_db(self, path):
+        try:
+            if path:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            db = sqlite3.connect(path or ":memory:", check_same_thread=False, isolation_level=None)
+        except Exception as e:
+            logger.warning("No se pudo abrir el historial en disco (%s): %s", path, e)
+            db = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        if path:
+            db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            " id TEXT PRIMARY KEY, email TEXT NOT NULL, practice_key TEXT NOT NULL,"
+            " input_hash TEXT NOT NULL, titulo TEXT, resultado TEXT NOT NULL,"
+            " entradas TEXT, data TEXT, created_at REAL NOT NULL,"
+            " synced INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Listado paginado por practica y del usuario completo
+        db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_history_user"
+            " ON history(email, practice_key, created_at DESC, id DESC)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_history_email ON history(email, created_at DESC, id DESC)")
+        # Mismas entradas -> mismo resultado
+        db.execute("CREATE INDEX IF NOT EXISTS idx_history_input ON history(email, practice_key, input_hash, created_at DESC)")
+        # Pendientes de copiar a Supabase
+        db.execute("CREATE INDEX IF NOT EXISTS idx_history_pending ON history(synced) WHERE synced = 0")
+        # Backlog del priorizador: solo local, si se pierde se vuelve a clasificar
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS task_backlog ("
+            " email TEXT NOT NULL, contexto TEXT NOT NULL, task_hash TEXT NOT NULL,"
+            " cuadrante TEXT NOT NULL, seen_at REAL NOT NULL,"
+            " classified_at REAL NOT NULL DEFAULT 0,"
+            " PRIMARY KEY (email, contexto, task_hash)) WITHOUT ROWID"
+        )
+        # Backlogs creados antes de classified_at: sus filas quedan vencidas
+        try:
+            db.execute("ALTER TABLE task_backlog ADD COLUMN classified_at REAL NOT NULL DEFAULT 0")
+        except sqlite3.OperationalError:
+            pass
+        return db
+
+    def _sql(self, query, params=()):
+        try:
+            with self._lock:
+                return self._db.execute(query, params).fetchall()
+        except Exception as e:
+            logger.warning("Error en el historial: %s", e)
+            return []
+
+    # ==================== API ====================
+
+    def guardar(self, email, practice_key, entradas, resultado, data=None, titulo=None):
+        """
+        Guarda un resultado. Si las mismas entradas ya dieron el mismo
+        resultado solo se actualiza la fecha.
+
+        Returns:
+            str: id del resultado, o None si no hay usuario
+        """
+        if not email or not resultado:
+            return None
+        email = email.lower()
+        input_hash = hash_entradas(entradas)
+        ahora = time.time()
+        previo = self._sql(
+            "SELECT id, resultado FROM history WHERE email = ? AND practice_key = ? AND input_hash = ?"
+            " ORDER BY created_at DESC LIMIT 1",
+            (email, practice_key, input_hash)
+        )
+        if previo and previo[0][1] == resultado:
+            item_id = previo[0][0]
+            self._sql("UPDATE history SET created_at = ?, synced = 0 WHERE id = ?", (ahora, item_id))
+        else:
+            item_id = uuid.uuid4().hex
+            self._sql(
+                "INSERT INTO history (id, email, practice_key, input_hash, titulo, resultado,"
+                " entradas, data, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    item_id, email, practice_key, input_hash,
+                    recortar(titulo) if titulo else resumen(entradas), resultado,
+                    json.dumps(entradas or {}, ensure_ascii=False, default=str),
+                    json.dumps(data, ensure_ascii=False, default=str) if data is not None else None,
+                    ahora
+                )
+            )
+            self._recortar(email, practice_key)
+        metrics.incr("history.saved", practice=practice_key)
+        self._asegurar_hilo()
+        return item_id
+
+    def _recortar(self, email, practice_key):
+        """Descarta lo mas antiguo sobre max_por_practica"""
+        self._sql(
+            "DELETE FROM history WHERE email = ? AND practice_key = ? AND id IN ("
+            " SELECT id FROM history WHERE email = ? AND practice_key = ?"
+            " ORDER BY created_at DESC, id DESC LIMIT -1 OFFSET ?)",
+            (email, practice_key, email, practice_key, self.max_por_practica)
+        )
+
+    def buscar(self, email, practice_key, entradas, max_edad=None):
+        """
+        Ultimo resultado guardado para exactamente estas entradas, o None.
+
+        Args:
+            max_edad: Segundos; ignora los resultados mas antiguos (None: todos)
+        """
+        if not email:
+            return None
+        email = email.lower()
+        self._hidratar(email)
+        desde = time.time() - max_edad if max_edad else 0
+        filas = self._sql(
+            f"SELECT {_COLUMNAS} FROM history WHERE email = ? AND practice_key = ? AND input_hash = ?"
+            " AND created_at >= ? ORDER BY created_at DESC LIMIT 1",
+            (email, practice_key, hash_entradas(entradas), desde)
+        )
+        metrics.incr("history.lookups", practice=practice_key, result="hit" if filas else "miss")
+        return _fila(filas[0]) if filas else None
+
+    def listar(self, email, practice_key=None, limite=10, antes=None):
+        """
+        Pagina del historial, del mas reciente al mas antiguo.
+
+        Args:
+            email: Usuario
+            practice_key: Solo esta practica (None: todas)
+            limite: Resultados por pagina
+            antes: Cursor de la pagina anterior (None: la primera)
+
+        Returns:
+            tuple: (lista de resultados, cursor de la pagina siguiente o None)
+        """
+        if not email:
+            return [], None
+        email = email.lower()
+        self._hidratar(email)
+        condiciones = ["email = ?"]
+        params = [email]
+        if practice_key:
+            condiciones.append("practice_key = ?")
+            params.append(practice_key)
+        if antes:
+            # Paginacion por clave: no recorre las paginas ya vistas
+            condiciones.append("(created_at, id) < (?, ?)")
+            params.extend(antes)
+        params.append(limite + 1)
+        filas = self._sql(
+            f"SELECT {_COLUMNAS} FROM history WHERE {' AND '.join(condiciones)}"
+            " ORDER BY created_at DESC, id DESC LIMIT ?",
+            params
+        )
+        items = [_fila(f) for f in filas[:limite]]
+        siguiente = None
+        if len(filas) > limite:
+            siguiente = (items[-1]["created_at"], items[-1]["id"])
+        return items, siguiente
+
+    def obtener(self, email, item_id):
+        """Un resultado del usuario por id, o None"""
+        if not email:
+            return None
+        filas = self._sql(
+            f"SELECT {_COLUMNAS} FROM history WHERE id = ? AND email = ?", (item_id, email.lower())
+        )
+        return _fila(filas[0]) if filas else None
+
+    def contar(self, email, practice_key=None):
+        if not email:
+            return 0
+        if practice_key:
+            filas = self._sql(
+                "SELECT COUNT(*) FROM history WHERE email = ? AND practice_key = ?",
+                (email.lower(), practice_key)
+            )
+        else:
+            filas = self._sql("SELECT COUNT(*) FROM history WHERE email = ?", (email.lower(),))
+        return filas[0][0] if filas else 0
+
+    # ==================== BACKLOG DE TAREAS ====================
+
+    def clasificaciones(self, email, contexto, max_edad=None):
+        """
+        Tareas ya clasificadas del usuario en un contexto (ej: su rol).
+
+        Args:
+            max_edad: Segundos; las clasificadas hace mas tiempo no se devuelven
+
+        Returns:
+            dict: task_hash -> cuadrante
+        """
+        if not email:
+            return {}
+        desde = time.time() - max_edad if max_edad else 0
+        filas = self._sql(
+            "SELECT task_hash, cuadrante FROM task_backlog"
+            " WHERE email = ? AND contexto = ? AND classified_at >= ?",
+            (email.lower(), contexto, desde)
+        )
+        return dict(filas)
+
+    def guardar_clasificaciones(self, email, contexto, clasificadas, vistas=()):
+        """
+        Agrega (o corrige) tareas clasificadas y marca como vistas las de la
+        lista actual; sobre max_tareas se descartan las no vistas hace mas
+        tiempo.
+
+        Args:
+            clasificadas: dict task_hash -> cuadrante
+            vistas: task_hash de todas las tareas de la lista actual
+        """
+        if not email:
+            return
+        email = email.lower()
+        ahora = time.time()
+        try:
+            with self._lock:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT INTO task_backlog (email, contexto, task_hash, cuadrante, seen_at, classified_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (email, contexto, task_hash)"
+                    " DO UPDATE SET cuadrante = excluded.cuadrante, seen_at = excluded.seen_at,"
+                    " classified_at = excluded.classified_at",
+                    [(email, contexto, h, cuadrante, ahora, ahora) for h, cuadrante in clasificadas.items()]
+                )
+                self._db.executemany(
+                    "UPDATE task_backlog SET seen_at = ? WHERE email = ? AND contexto = ? AND task_hash = ?",
+                    [(ahora, email, contexto, h) for h in vistas if h not in clasificadas]
+                )
+                self._db.execute(
+                    "DELETE FROM task_backlog WHERE email = ? AND contexto = ? AND task_hash IN ("
+                    " SELECT task_hash FROM task_backlog WHERE email = ? AND contexto = ?"
+                    " ORDER BY seen_at DESC LIMIT -1 OFFSET ?)",
+                    (email, contexto, email, contexto, self.max_tareas)
+                )
+                self._db.execute("COMMIT")
+        except Exception as e:
+            logger.warning("Error guardando el backlog de tareas: %s", e)
+            try:
+                self._db.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+
+    # ==================== SUPABASE ====================
+
+    def _hidratar(self, email):
+        """
+        Primera consulta del usuario en el proceso: trae lo guardado afuera.
+        Si falla se reintenta en una consulta posterior (tras flush_seconds).
+        """
+        if self.fuente is None or email in self._hidratados:
+            return
+        fallo = self._fallos_hidratar.get(email)
+        if fallo is not None and time.time() - fallo < self.flush_seconds:
+            return
+        try:
+            filas = self.fuente(email, self.max_por_practica)
+        except Exception as e:
+            logger.warning("Error trayendo el historial de %s: %s", email, e)
+            self._fallos_hidratar[email] = time.time()
+            metrics.incr("history.hydrate_errors")
+            return
+        self._hidratados.add(email)
+        self._fallos_hidratar.pop(email, None)
+        for f in filas:
+            entradas, data = f.get("entradas"), f.get("data")
+            self._sql(
+                "INSERT OR IGNORE INTO history (id, email, practice_key, input_hash, titulo,"
+                " resultado, entradas, data, created_at, synced) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)",
+                (
+                    f["id"], email, f["practice_key"], f["input_hash"], f.get("titulo"), f["resultado"],
+                    entradas if isinstance(entradas, str) or entradas is None
+                    else json.dumps(entradas, ensure_ascii=False),
+                    data if isinstance(data, str) or data is None
+                    else json.dumps(data, ensure_ascii=False),
+                    float(f["created_at"])
+                )
+            )
+        if filas:
+            metrics.incr("history.hydrated", len(filas))
+
+    def flush(self, limite=500):
+        """Copia al sink las filas pendientes. Retorna cuantas envio."""
+        if self.sink is None:
+            return 0
+        filas = self._sql(
+            f"SELECT email, {_COLUMNAS} FROM history WHERE synced = 0 LIMIT ?", (limite,)
+        )
+        if not filas:
+            return 0
+        envio = []
+        for email, *resto in filas:
+            item = _fila(resto)
+            item["email"] = email
+            envio.append(item)
+        try:
+            self.sink(envio)
+        except Exception as e:
+            logger.warning("Error copiando el historial: %s", e)
+            return 0
+        ids = [item["id"] for item in envio]
+        self._sql(
+            f"UPDATE history SET synced = 1 WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+        return len(envio)
+
+    def _asegurar_hilo(self):
+        if self.sink is None or (self._hilo is not None and self._hilo.is_alive()):
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._hilo = threading.Thread(target=self._bucle, name="yocreo-historial", daemon=True)
+            self._hilo.start()
+
+    def _bucle(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+
+@st.cache_resource(show_spinner=False)
+def get_history():
+    """Obtiene el historial del proceso (se crea una sola vez)"""
+    sync = HISTORIAL.get("sync_supabase", False)
+    return HistoryStore(
+        path=HISTORIAL.get("path"),
+        sink=guardar_historial if sync else None,
+        fuente=obtener_historial if sync else None,
+        flush_seconds=HISTORIAL.get("flush_seconds", 30),
+        max_por_practica=HISTORIAL.get("max_por_practica", 200),
+        max_tareas=HISTORIAL.get("max_tareas", 5000)
+    )
+
+
+def _email():
+    user = st.session_state.get('user') or {}
+    return user.get('email')
+
+
+# ==================== PRACTICAS ====================
+
+def guardar_resultado(practice_key, entradas, resultado, data=None, titulo=None):
+    """Guarda el resultado en el historial del usuario actual (si hay sesion)"""
+    if not HISTORIAL.get("enabled", True):
+        return None
+    try:
+        return get_history().guardar(_email(), practice_key, entradas, resultado, data=data, titulo=titulo)
+    except Exception as e:
+        # No interrumpir el flujo si falla el historial
+        logger.warning("Error guardando en el historial: %s", e)
+        return None
+
+
+def buscar_resultado(practice_key, entradas):
+    """Resultado reciente (reutilizar_segundos) del usuario actual para las mismas entradas, o None"""
+    if not HISTORIAL.get("enabled", True) or not HISTORIAL.get("reutilizar", True):
+        return None
+    try:
+        return get_history().buscar(
+            _email(), practice_key, entradas, max_edad=HISTORIAL.get("reutilizar_segundos")
+        )
+    except Exception as e:
+        logger.warning("Error buscando en el historial: %s", e)
+        return None
+
+
+def clasificaciones_guardadas(contexto, max_edad=None):
+    """Tareas ya clasificadas por el usuario actual: dict task_hash -> cuadrante"""
+    if not HISTORIAL.get("enabled", True):
+        return {}
+    try:
+        return get_history().clasificaciones(_email(), contexto, max_edad)
+    except Exception as e:
+        logger.warning("Error leyendo el backlog de tareas: %s", e)
+        return {}
+
+
+def guardar_clasificaciones(contexto, clasificadas, vistas=()):
+    """Guarda las tareas recien clasificadas del usuario actual (si hay sesion)"""
+    if not HISTORIAL.get("enabled", True):
+        return
+    try:
+        get_history().guardar_clasificaciones(_email(), contexto, clasificadas, vistas)
+    except Exception as e:
+        logger.warning("Error guardando el backlog de tareas: %s", e)
+
+
+def render_historial(practice_key, state_key, widget_key=None, al_abrir=None, titulo="Historial"):
+    """
+    Expander con los resultados anteriores del usuario en la practica,
+    paginado. "Abrir" copia el resultado a st.session_state[state_key]
+    sin llamar a la IA.
+
+    Args:
+        practice_key: Clave de la practica
+        state_key: Clave de session_state donde la practica muestra el resultado
+        widget_key: Clave del text_area editable (se limpia para que tome el valor)
+        al_abrir: Funcion(item) opcional para restaurar otro estado de la practica
+        titulo: Titulo del expander
+    """
+    email = _email()
+    if not HISTORIAL.get("enabled", True) or not email:
+        return
+    store = get_history()
+    clave_paginas = f"hist_paginas_{practice_key}"
+    paginas = st.session_state.setdefault(clave_paginas, [None])
+    items, siguiente = store.listar(
+        email, practice_key, limite=HISTORIAL.get("por_pagina", 5), antes=paginas[-1]
+    )
+    if not items and len(paginas) == 1:
+        return
+
+    def abrir(item):
+        st.session_state[state_key] = item["resultado"]
+        if widget_key:
+            st.session_state.pop(widget_key, None)
+        if al_abrir is not None:
+            al_abrir(item)
+        metrics.incr("history.reopened", practice=practice_key)
+
+    def mover(paso):
+        if paso > 0:
+            paginas.append(siguiente)
+        elif len(paginas) > 1:
+            paginas.pop()
+
+    with st.expander(titulo):
+        for item in items:
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                fecha = datetime.fromtimestamp(item["created_at"]).strftime("%d/%m/%Y %H:%M")
+                st.write(item["titulo"])
+                st.caption(fecha)
+            with col2:
+                st.button(
+                    "Abrir", key=f"hist_abrir_{item['id']}", on_click=abrir, args=(item,),
+                    use_container_width=True
+                )
+        col1, col2 = st.columns(2)
+        with col1:
+            st.button(
+                "Mas recientes", key=f"hist_prev_{practice_key}", on_click=mover, args=(-1,),
+                disabled=len(paginas) == 1, use_container_width=True
+            )
+        with col2:
+            st.button(
+                "Anteriores", key=f"hist_next_{practice_key}", on_click=mover, args=(1,),
+                disabled=siguiente is None, use_container_width=True
+            )
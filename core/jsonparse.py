@@ -0,0 +1,433 @@
+"""
+Extraccion tolerante de JSON en respuestas de la IA
+Un recorrido con pila de corchetes por candidato: salta texto antes y
+despues del JSON (aunque traiga llaves o corchetes sueltos), quita el
+cerco ```json del inicio y del final, elimina comas colgantes, escapa
+saltos de linea dentro de strings y recupera objetos truncados (ej:
+MAX_TOKENS). Los tramos sin estructura se saltan con expresiones
+regulares y se prueban a lo mas _MAX_CANDIDATOS aperturas, asi el costo
+sigue siendo lineal en el largo de la respuesta.
+"""
+
+import json
+import re
+
+# Cerco de bloque de codigo solo al inicio y al final: un ``` dentro de un
+# string es contenido
+_CERCO_INICIO = re.compile(r"\A```(?:json|JSON)?")
+_CERCO_FIN = re.compile(r"```\Z")
+_APERTURA = re.compile(r"[{\[]")
+# Aperturas que se prueban como inicio del JSON ('{' o '[' en el texto previo)
+_MAX_CANDIDATOS = 8
+# Fuera de strings: lo unico que cambia el estado del recorrido
+_ESTRUCTURA = re.compile(r'[{}\[\]",]')
+# Dentro de strings: fin, escape o caracter de control sin escapar
+_EN_CADENA = re.compile(r'["\\\x00-\x1f]')
+_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+_CIERRE = {"{": "}", "[": "]"}
+
+
+def _cargar(texto):
+    try:
+        valor = json.loads(texto)
+    except ValueError:
+        return None
+    return valor if isinstance(valor, (dict, list)) else None
+
+
+def _cierres(pila):
+    cierres = []
+    while pila is not None:
+        cierre, pila = pila
+        cierres.append(cierre)
+    return "".join(cierres)
+
+
+def _reparar(texto, inicio):
+    """
+    Recorre desde `inicio` (un '{' o '[') reconstruyendo un JSON valido.
+    Retorna (objeto/lista o None, posicion donde termino el recorrido).
+    """
+    partes = []
+    # Pila de cierres pendientes como lista enlazada (cierre, resto): se
+    # puede guardar una copia en O(1) aunque el anidamiento sea profundo
+    pila = None
+    # Ultimo punto donde cortar deja un JSON completo: (len(partes), pila)
+    seguro = None
+    coma = False
+    en_cadena = False
+    pos = inicio
+    n = len(texto)
+
+    while pos < n:
+        m = _ESTRUCTURA.search(texto, pos)
+        fin = m.start() if m else n
+        if fin > pos:
+            tramo = texto[pos:fin]
+            if coma and not tramo.isspace():
+                partes.append(",")
+                coma = False
+            partes.append(tramo)
+        if m is None:
+            break
+        c = m.group()
+        pos = m.end()
+
+        if c == ",":
+            if not coma and pila is not None:
+                seguro = (len(partes), pila)
+            # La coma se emite recien al ver el siguiente valor: si lo
+            # que sigue es un cierre, era una coma colgante
+            coma = True
+            continue
+
+        if c in "}]":
+            coma = False
+            if pila is None:
+                break
+            cierre, pila = pila
+            partes.append(cierre)
+            if pila is None:
+                return _cargar("".join(partes)), pos
+            seguro = (len(partes), pila)
+            continue
+
+        if coma:
+            partes.append(",")
+            coma = False
+
+        if c in "{[":
+            partes.append(c)
+            pila = (_CIERRE[c], pila)
+            seguro = (len(partes), pila)
+            continue
+
+        # String: copiar hasta la comilla de cierre escapando controles
+        partes.append('"')
+        en_cadena = True
+        while True:
+            s = _EN_CADENA.search(texto, pos)
+            if s is None:
+                partes.append(texto[pos:])
+                pos = n
+                break
+            partes.append(texto[pos:s.start()])
+            ch = s.group()
+            pos = s.end()
+            if ch == '"':
+                partes.append('"')
+                en_cadena = False
+                break
+            if ch == "\\":
+                if pos >= n:
+                    # Escape cortado al final: se descarta
+                    break
+                partes.append(texto[pos - 1:pos + 1])
+                pos += 1
+            else:
+                partes.append(_ESCAPES.get(ch, "\\u%04x" % ord(ch)))
+
+    if pila is None:
+        return None, pos
+
+    # Respuesta truncada: cerrar tal cual (conserva el valor a medias) o
+    # volver al ultimo punto completo
+    valor = _cargar("".join(partes) + ('"' if en_cadena else "") + _cierres(pila))
+    if valor is None and seguro is not None:
+        largo, abiertos = seguro
+        valor = _cargar("".join(partes[:largo]) + _cierres(abiertos))
+    return valor, n
+
+
+def _cumple(valor, esquema):
+    """Un valor recuperado solo sirve si es del tipo del esquema y trae los campos requeridos"""
+    if valor is None or not esquema:
+        return valor
+    tipo = str(esquema.get("type", "")).lower()
+    if tipo == "object":
+        if not isinstance(valor, dict):
+            return None
+        if any(campo not in valor for campo in esquema.get("required", ())):
+            return None
+    elif tipo == "array" and not isinstance(valor, list):
+        return None
+    return valor
+
+
+def limpiar_json(texto, esquema=None):
+    """
+    Obtiene el objeto (o lista) JSON de una respuesta de la IA.
+
+    Args:
+        texto: Respuesta cruda; puede venir en un bloque ```json, con texto
+            antes o despues, comas colgantes, saltos de linea sin escapar
+            o cortada
+        esquema: response_schema de la practica (opcional); si se entrega,
+            se descarta lo que no sea de su tipo o no traiga los campos
+            requeridos. Sin esquema se prefiere un objeto a una lista
+
+    Returns:
+        dict o list, o None si no hay JSON recuperable
+    """
+    if not texto:
+        return None
+    limpio = _CERCO_INICIO.sub("", texto.strip())
+    limpio = _CERCO_FIN.sub("", limpio).strip()
+    # Caso comun (modo JSON nativo): la respuesta ya es valida
+    valor = _cargar(limpio)
+    if valor is not None:
+        return _cumple(valor, esquema)
+
+    # Cada '{' o '[' es un posible inicio: el texto previo puede traer
+    # llaves o corchetes sueltos (ej: "Nota {importante}: {...}")
+    respaldo = None
+    fin = 0
+    for intento, apertura in enumerate(_APERTURA.finditer(limpio)):
+        if intento >= _MAX_CANDIDATOS:
+            break
+        if apertura.start() < fin:
+            # Dentro de un JSON que ya se leyo completo: no es la respuesta
+            continue
+        leido, termino = _reparar(limpio, apertura.start())
+        if leido is None:
+            continue
+        fin = termino
+        valor = _cumple(leido, esquema)
+        if valor is None:
+            continue
+        if esquema or isinstance(valor, dict):
+            return valor
+        if respaldo is None:
+            respaldo = valor
+    return respaldo
+
+
+# ==================== PARSER INCREMENTAL ====================
+
+_NO_BLANCO = re.compile(r"\S")
+_INICIO_CLAVE = re.compile(r'[^\s,]')
+_CADENA = re.compile(r'["\\]')
+_COMPUESTO = re.compile(r'[{}\[\]"]')
+_FIN_LITERAL = re.compile(r"[,}]")
+_DECODIFICAR = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+def _unir(partes, sustitutos):
+    """Une el texto decodificado; junta los pares \\uXXXX de emojis y similares"""
+    texto = "".join(partes)
+    if sustitutos:
+        texto = texto.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+    return texto
+
+
+class ParserIncremental:
+    """
+    Parser del objeto JSON de una respuesta en streaming.
+    Cada fragmento se recorre una sola vez (O(n) amortizado en el total
+    del stream): los campos de primer nivel se entregan apenas se cierran
+    y el string que se esta recibiendo queda disponible en `parcial`.
+
+    Uso:
+        parser = ParserIncremental()
+        for fragmento in stream:
+            for campo, valor in parser.feed(fragmento):
+                ...  # seccion completa
+            parser.parcial  # (campo, texto hasta ahora) o None
+    """
+
+    def __init__(self):
+        self.campos = {}
+        self._estado = "inicio"
+        self._pendiente = ""
+        self._clave = None
+        # Texto decodificado del string en curso (clave o valor)
+        self._partes = []
+        # Texto crudo del valor compuesto o literal en curso
+        self._crudo = []
+        self._sustitutos = False
+        self._profundidad = 0
+        self._en_cadena = False
+        self._escape = False
+
+    @property
+    def terminado(self):
+        return self._estado == "fin"
+
+    @property
+    def parcial(self):
+        """(campo, texto recibido) del valor string en curso, o None"""
+        if self._estado != "valor_cadena":
+            return None
+        if len(self._partes) > 1:
+            self._partes = ["".join(self._partes)]
+        return self._clave, _unir(self._partes, self._sustitutos)
+
+    def feed(self, fragmento):
+        """
+        Procesa un fragmento del stream.
+
+        Returns:
+            list: (campo, valor) de los campos que se completaron
+        """
+        texto = self._pendiente + fragmento
+        self._pendiente = ""
+        completos = []
+        pos = 0
+        n = len(texto)
+        while pos < n and self._estado != "fin":
+            estado = self._estado
+            if estado == "inicio":
+                i = texto.find("{", pos)
+                if i < 0:
+                    break
+                pos = i + 1
+                self._estado = "clave"
+
+            elif estado == "clave":
+                m = _INICIO_CLAVE.search(texto, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group() == '"':
+                    self._partes = []
+                    self._estado = "clave_cadena"
+                elif m.group() == "}":
+                    self._estado = "fin"
+
+            elif estado in ("clave_cadena", "valor_cadena"):
+                pos, cerrada = self._leer_cadena(texto, pos)
+                if not cerrada:
+                    break
+                valor = _unir(self._partes, self._sustitutos)
+                self._partes = []
+                self._sustitutos = False
+                if estado == "clave_cadena":
+                    self._clave = valor
+                    self._estado = "dos_puntos"
+                else:
+                    completos.append(self._completar(valor))
+
+            elif estado == "dos_puntos":
+                i = texto.find(":", pos)
+                if i < 0:
+                    break
+                pos = i + 1
+                self._estado = "valor"
+
+            elif estado == "valor":
+                m = _NO_BLANCO.search(texto, pos)
+                if m is None:
+                    break
+                c = m.group()
+                if c == '"':
+                    self._partes = []
+                    self._estado = "valor_cadena"
+                    pos = m.end()
+                elif c in "{[":
+                    self._crudo = [c]
+                    self._profundidad = 1
+                    self._estado = "valor_compuesto"
+                    pos = m.end()
+                else:
+                    self._crudo = []
+                    self._estado = "valor_literal"
+                    pos = m.start()
+
+            elif estado == "valor_compuesto":
+                pos = self._leer_compuesto(texto, pos)
+                if self._profundidad == 0:
+                    crudo = "".join(self._crudo)
+                    self._crudo = []
+                    try:
+                        valor = json.loads(crudo, strict=False)
+                    except ValueError:
+                        valor = limpiar_json(crudo)
+                    completos.append(self._completar(valor))
+
+            else:  # valor_literal
+                m = _FIN_LITERAL.search(texto, pos)
+                if m is None:
+                    self._crudo.append(texto[pos:])
+                    break
+                self._crudo.append(texto[pos:m.start()])
+                pos = m.start()
+                crudo = "".join(self._crudo).strip()
+                self._crudo = []
+                try:
+                    valor = json.loads(crudo)
+                except ValueError:
+                    valor = crudo
+                completos.append(self._completar(valor))
+        return completos
+
+    def _completar(self, valor):
+        self.campos[self._clave] = valor
+        self._estado = "clave"
+        return self._clave, valor
+
+    def _leer_cadena(self, texto, pos):
+        """Decodifica un string desde pos. Retorna (pos, cerrado)."""
+        n = len(texto)
+        while True:
+            m = _CADENA.search(texto, pos)
+            if m is None:
+                self._partes.append(texto[pos:])
+                return n, False
+            self._partes.append(texto[pos:m.start()])
+            if m.group() == '"':
+                return m.end(), True
+            i = m.end()
+            if i >= n or (texto[i] == "u" and i + 5 > n):
+                # Escape cortado entre fragmentos: se completa con el siguiente
+                self._pendiente = texto[m.start():]
+                return n, False
+            c = texto[i]
+            if c == "u":
+                try:
+                    codigo = int(texto[i + 1:i + 5], 16)
+                    self._partes.append(chr(codigo))
+                    self._sustitutos = self._sustitutos or 0xD800 <= codigo <= 0xDFFF
+                except ValueError:
+                    self._partes.append(texto[m.start():i + 5])
+                pos = i + 5
+            else:
+                self._partes.append(_DECODIFICAR.get(c, c))
+                pos = i + 1
+
+    def _leer_compuesto(self, texto, pos):
+        """Copia un objeto/lista anidado hasta cerrar su ultimo corchete."""
+        n = len(texto)
+        while pos < n:
+            if self._en_cadena:
+                if self._escape:
+                    self._crudo.append(texto[pos])
+                    self._escape = False
+                    pos += 1
+                    continue
+                m = _CADENA.search(texto, pos)
+                if m is None:
+                    self._crudo.append(texto[pos:])
+                    return n
+                self._crudo.append(texto[pos:m.end()])
+                pos = m.end()
+                if m.group() == '"':
+                    self._en_cadena = False
+                else:
+                    self._escape = True
+                continue
+            m = _COMPUESTO.search(texto, pos)
+            if m is None:
+                self._crudo.append(texto[pos:])
+                return n
+            self._crudo.append(texto[pos:m.end()])
+            pos = m.end()
+            c = m.group()
+            if c == '"':
+                self._en_cadena = True
+            elif c in "{[":
+                self._profundidad += 1
+            else:
+                self._profundidad -= 1
+                if self._profundidad == 0:
+                    return pos
+        return pos
@@ -0,0 +1,126 @@
+"""
+Metricas en memoria para YoCreo Suite
+Contadores e histogramas thread-safe compartidos por todas las sesiones
+"""
+
+import bisect
+import threading
+
+# Limites de los buckets (ms) usados por defecto en los histogramas de latencia
+BUCKETS_MS = (
+    50, 100, 250, 500, 750, 1000, 1500, 2000, 3000, 5000,
+    7500, 10000, 15000, 20000, 30000, 45000, 60000, 120000
+)
+
+
+class Histogram:
+    """Histograma de buckets fijos con conteo, suma, minimo y maximo."""
+
+    def __init__(self, buckets=BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        """Aproxima el cuantil q (0-1) con el limite superior del bucket."""
+        if not self.count:
+            return None
+        objetivo = q * self.count
+        acumulado = 0
+        for i, n in enumerate(self.counts):
+            acumulado += n
+            if acumulado >= objetivo and n:
+                if i < len(self.buckets):
+                    return min(self.buckets[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "avg": round(self.total / self.count, 3) if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class MetricsRegistry:
+    """Registro de contadores, gauges e histogramas etiquetados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def incr(self, name, value=1, **labels):
+        """Incrementa un contador."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Fija el valor actual de un gauge."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, buckets=BUCKETS_MS, **labels):
+        """Registra una observacion en un histograma."""
+        key = self._key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def quantile(self, name, q, **labels):
+        """Retorna el cuantil q de un histograma o None si no hay datos."""
+        with self._lock:
+            hist = self._histograms.get(self._key(name, labels))
+            return hist.quantile(q) if hist else None
+
+    def count(self, name, **labels):
+        """Retorna la cantidad de observaciones de un histograma."""
+        with self._lock:
+            hist = self._histograms.get(self._key(name, labels))
+            return hist.count if hist else 0
+
+    def snapshot(self):
+        """Retorna una copia de todas las metricas como listas de dicts."""
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._counters.items()
+            ]
+            gauges = [
+                {"name": name, "labels": dict(labels), "value": value}
+                for (name, labels), value in self._gauges.items()
+            ]
+            histograms = [
+                {"name": name, "labels": dict(labels), **hist.snapshot()}
+                for (name, labels), hist in self._histograms.items()
+            ]
+        return {"counters": counters, "gauges": gauges, "histograms": histograms}
+
+
+# Registro global del proceso
+metrics = MetricsRegistry()
@@ -0,0 +1,441 @@
+"""
+Pipeline comun de las practicas
+Las practicas repiten los mismos pasos: validar las entradas, armar el
+prompt, generar, interpretar el JSON, dar formato al resultado y
+exportarlo. PracticePipeline declara esas etapas y agrega a cada una:
+
+- Tiempos por etapa (metrica practice.stage_ms{practice, stage})
+- Cache opcional de la etapa (por hash de su entrada)
+- Politica de errores (reintentos, valor de respaldo o propagar)
+
+Las practicas se migran de a una: basta declarar su pipeline y llamar
+a run() desde el boton de generar.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import streamlit as st
+
+from .ai_client import ErrorMostrado, generate_many, generate_response_live, invalidate_response
+from .analytics import registrar_uso
+from .export import create_pdf_reportlab
+from .history import buscar_resultado, guardar_resultado, hash_entradas
+from .jsonparse import limpiar_json
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Etapas en orden de ejecucion
+VALIDAR = "validate"
+PROMPT = "prompt"
+GENERAR = "generate"
+PARSEAR = "parse"
+FORMATEAR = "format"
+EXPORTAR = "export"
+ETAPAS = (VALIDAR, PROMPT, GENERAR, PARSEAR, FORMATEAR, EXPORTAR)
+# Tiempo total de la generacion en paralelo de run_lote()
+GENERAR_LOTE = "generate_batch"
+
+# Buckets (ms) de las etapas: van de microsegundos (parse) a segundos (generate)
+BUCKETS_ETAPA_MS = (
+    0.1, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000,
+    2500, 5000, 10000, 20000, 45000, 90000
+)
+
+# Resultado de run(): datos interpretados y texto con formato
+Resultado = namedtuple("Resultado", ["data", "texto", "prompt"])
+
+_hooks = []
+
+
+def agregar_hook(fn):
+    """
+    Registra fn(practice_key, etapa, ms, error) que se llama al terminar
+    cada etapa de cualquier pipeline (error es None si salio bien).
+    """
+    _hooks.append(fn)
+
+
+class EntradaInvalida(Exception):
+    """Las entradas no pasaron la validacion; el mensaje es para el usuario."""
+
+
+class FalloEtapa(Exception):
+    """Una etapa fallo o no produjo resultado."""
+
+    def __init__(self, etapa, mensaje="", causa=None):
+        super().__init__(mensaje or f"La etapa {etapa} no produjo resultado")
+        self.etapa = etapa
+        self.causa = causa
+
+
+class Politica:
+    """
+    Politica de errores de una etapa.
+
+    Args:
+        reintentos: Veces que se repite la etapa si falla
+        respaldo: Valor (o funcion(entrada, error)) a usar si sigue fallando;
+            None deja la falla en manos de run()
+        propagar: Relanzar la excepcion original en lugar de fallar en silencio
+    """
+
+    def __init__(self, reintentos=0, respaldo=None, propagar=False):
+        self.reintentos = reintentos
+        self.respaldo = respaldo
+        self.propagar = propagar
+
+
+POLITICA_DEFAULT = Politica()
+
+
+class _CacheEtapa:
+    """LRU pequeno por etapa, indexado por el hash de la entrada."""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    @staticmethod
+    def clave(entrada):
+        texto = json.dumps(entrada, sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+    def get(self, clave):
+        with self._lock:
+            if clave not in self._items:
+                return None
+            self._items.move_to_end(clave)
+            return self._items[clave]
+
+    def set(self, clave, valor):
+        with self._lock:
+            self._items[clave] = valor
+            self._items.move_to_end(clave)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+
+def _sin_validacion(entradas):
+    return None
+
+
+def quitar_markdown(data, marcas=("**", "##")):
+    """Limpieza comun post-parse: quita marcas de Markdown de los campos de texto"""
+    for campo, valor in data.items():
+        if isinstance(valor, str):
+            for marca in marcas:
+                valor = valor.replace(marca, "")
+            data[campo] = valor
+    return data
+
+
+class PracticePipeline:
+    """
+    Pipeline declarativo de una practica.
+
+    Args:
+        practice_key: Clave de la practica (metricas, registrar_uso)
+        prompt: Funcion(entradas) -> prompt de usuario
+        formato: Funcion(data, entradas) -> texto del resultado
+        validar: Funcion(entradas) -> mensaje de error o None
+        schema: response_schema (modo JSON y validacion del parse)
+        system_instruction: Instruccion de sistema de la practica
+        secciones: Titulos de la vista previa por secciones
+        limpiar: Funcion(data) -> data aplicada tras el parse
+        generar: Reemplaza la etapa generate: funcion(prompt) -> texto
+        exportar: Funcion(titulo, secciones) -> bytes (default: PDF)
+        politicas: dict {etapa: Politica}
+        cache: Etapas con cache en memoria (ej: {"format", "export"})
+        mensaje_error: Texto si no se pudo generar el resultado
+        historial: Guardar los resultados en el historial del usuario y
+            reabrir sin llamar a la IA los recientes de entradas ya vistas
+        titulo_historial: Funcion(entradas) -> titulo en el historial
+    """
+
+    def __init__(self, practice_key, prompt, formato, validar=None, schema=None,
+                 system_instruction=None, secciones=None, limpiar=None, generar=None,
+                 exportar=None, politicas=None, cache=(EXPORTAR,),
+                 mensaje_error="No se pudo generar el resultado. Intenta de nuevo.",
+                 historial=True, titulo_historial=None):
+        self.practice_key = practice_key
+        self.historial = historial
+        self.titulo_historial = titulo_historial
+        self.schema = schema
+        self.system_instruction = system_instruction
+        self.secciones = secciones
+        self.mensaje_error = mensaje_error
+        self.politicas = politicas or {}
+        self._caches = {etapa: _CacheEtapa() for etapa in cache}
+        self._etapas = {
+            VALIDAR: validar or _sin_validacion,
+            PROMPT: prompt,
+            GENERAR: generar or self._generar,
+            PARSEAR: self._parsear,
+            FORMATEAR: formato,
+            EXPORTAR: exportar or create_pdf_reportlab
+        }
+        self._limpiar = limpiar
+
+    # ==================== ETAPAS POR DEFECTO ====================
+
+    def _generar(self, prompt):
+        return generate_response_live(
+            prompt,
+            practice_key=self.practice_key,
+            response_schema=self.schema,
+            system_instruction=self.system_instruction,
+            secciones=self.secciones,
+            lanzar=True
+        )
+
+    def _parsear(self, texto):
+        data = limpiar_json(texto, self.schema) if texto else None
+        if data is not None and self._limpiar is not None:
+            data = self._limpiar(data)
+        return data
+
+    def invalidar(self, prompt):
+        """Descarta la respuesta cacheada del prompt (ej: no se pudo interpretar)"""
+        invalidate_response(prompt, response_schema=self.schema, system_instruction=self.system_instruction)
+
+    # ==================== EJECUCION ====================
+
+    def etapa(self, nombre, *args):
+        """
+        Ejecuta una etapa con tiempos, cache y politica de errores.
+
+        Raises:
+            FalloEtapa: si la etapa fallo y la politica no dio respaldo
+        """
+        fn = self._etapas[nombre]
+        politica = self.politicas.get(nombre, POLITICA_DEFAULT)
+        cache = self._caches.get(nombre)
+        clave = cache.clave(args) if cache is not None else None
+        if cache is not None:
+            valor = cache.get(clave)
+            if valor is not None:
+                metrics.incr("practice.stage_cache_hits", practice=self.practice_key, stage=nombre)
+                return valor
+
+        error = None
+        for intento in range(politica.reintentos + 1):
+            inicio = time.perf_counter()
+            try:
+                valor = fn(*args)
+                # validate retorna None cuando todo esta bien
+                error = FalloEtapa(nombre) if valor is None and nombre != VALIDAR else None
+            except EntradaInvalida:
+                raise
+            except Exception as e:
+                if politica.propagar:
+                    self._registrar(nombre, inicio, e)
+                    raise
+                logger.warning("Etapa %s de %s fallo: %s", nombre, self.practice_key, e)
+                error = FalloEtapa(nombre, causa=e)
+            self._registrar(nombre, inicio, error)
+            if error is None:
+                if cache is not None:
+                    cache.set(clave, valor)
+                return valor
+            if intento < politica.reintentos:
+                metrics.incr("practice.stage_retries", practice=self.practice_key, stage=nombre)
+
+        if politica.respaldo is not None:
+            respaldo = politica.respaldo
+            return respaldo(args, error) if callable(respaldo) else respaldo
+        raise error
+
+    def _registrar(self, etapa, inicio, error):
+        ms = (time.perf_counter() - inicio) * 1000
+        metrics.observe(
+            "practice.stage_ms", ms, buckets=BUCKETS_ETAPA_MS,
+            practice=self.practice_key, stage=etapa
+        )
+        if error is not None:
+            metrics.incr("practice.stage_errors", practice=self.practice_key, stage=etapa)
+        for hook in _hooks:
+            try:
+                hook(self.practice_key, etapa, ms, error)
+            except Exception as e:
+                logger.warning("Hook de pipeline fallo: %s", e)
+
+    def procesar(self, entradas, forzar=False):
+        """
+        Corre validate -> prompt -> generate -> parse -> format sin UI.
+        Con forzar=True descarta la respuesta cacheada del prompt y genera
+        una nueva.
+
+        Returns:
+            Resultado
+
+        Raises:
+            EntradaInvalida: con el mensaje de validacion
+            FalloEtapa: si alguna etapa fallo
+        """
+        mensaje = self.etapa(VALIDAR, entradas)
+        if mensaje:
+            raise EntradaInvalida(mensaje)
+        prompt = self.etapa(PROMPT, entradas)
+        if forzar:
+            self.invalidar(prompt)
+        texto = self.etapa(GENERAR, prompt)
+        try:
+            data = self.etapa(PARSEAR, texto)
+        except FalloEtapa:
+            # Respuesta no interpretable: no dejarla en el cache de la IA
+            self.invalidar(prompt)
+            raise
+        return Resultado(data, self.etapa(FORMATEAR, data, entradas), prompt)
+
+    def run(self, entradas, registrar=True, forzar=False):
+        """
+        Corre el pipeline desde la practica: muestra el aviso de
+        validacion o el error en la pagina, guarda el resultado en el
+        historial y registra el uso si sale bien.
+
+        Un resultado reciente del historial con las mismas entradas se
+        reabre sin llamar a la IA (no cuenta como uso). Volver a generar
+        las entradas del resultado que ya se esta viendo pide uno nuevo.
+
+        Args:
+            entradas: dict con las entradas del formulario
+            registrar: Llamar a registrar_uso al terminar bien
+            forzar: Generar de nuevo aunque haya un resultado guardado
+
+        Returns:
+            Resultado o None
+        """
+        clave_ultimo = f"pipeline_ultimo_{self.practice_key}"
+        entrada_hash = hash_entradas(entradas)
+        forzar = forzar or st.session_state.get(clave_ultimo) == entrada_hash
+        guardado = None
+        if self.historial and not forzar:
+            guardado = buscar_resultado(self.practice_key, entradas)
+        if guardado is not None:
+            metrics.incr("practice.history_reused", practice=self.practice_key)
+            st.session_state[clave_ultimo] = entrada_hash
+            return Resultado(guardado["data"], guardado["resultado"], None)
+        try:
+            resultado = self.procesar(entradas, forzar=forzar)
+        except EntradaInvalida as e:
+            st.markdown(f'<div class="custom-warning">{e}</div>', unsafe_allow_html=True)
+            return None
+        except FalloEtapa as e:
+            # La generacion ya mostro su propio aviso: no repetirlo
+            if not isinstance(e.causa, ErrorMostrado):
+                st.markdown(f'<div class="custom-error">{self.mensaje_error}</div>', unsafe_allow_html=True)
+            return None
+        if self.historial:
+            titulo = self.titulo_historial(entradas) if self.titulo_historial else None
+            guardar_resultado(
+                self.practice_key, entradas, resultado.texto, data=resultado.data, titulo=titulo
+            )
+        if registrar:
+            registrar_uso(self.practice_key)
+        st.session_state[clave_ultimo] = entrada_hash
+        return resultado
+
+    def run_lote(self, lista_entradas, max_concurrency=None, al_terminar=None, registrar=True):
+        """
+        Corre el pipeline para muchas entradas: valida y arma los prompts,
+        los genera en paralelo con concurrencia acotada (barra de progreso)
+        e interpreta cada respuesta apenas llega. Los resultados de un lote
+        no van al historial.
+
+        Args:
+            lista_entradas: Lista de dicts con entradas
+            max_concurrency: Llamadas simultaneas (default AI_CONFIG)
+            al_terminar: Callback (indice, Resultado o None, mensaje de error
+                o None) apenas termina cada entrada, en el hilo del script
+            registrar: Llamar a registrar_uso una vez si hubo algun resultado
+
+        Returns:
+            list: (Resultado o None, mensaje de error o None) por entrada
+        """
+        salida = [(None, None)] * len(lista_entradas)
+        prompts, indices = [], []
+
+        def terminar(i, resultado, error):
+            salida[i] = (resultado, error)
+            if al_terminar is not None:
+                al_terminar(i, resultado, error)
+
+        for i, entradas in enumerate(lista_entradas):
+            try:
+                mensaje = self.etapa(VALIDAR, entradas)
+                if mensaje:
+                    terminar(i, None, mensaje)
+                    continue
+                prompts.append(self.etapa(PROMPT, entradas))
+                indices.append(i)
+            except FalloEtapa:
+                terminar(i, None, self.mensaje_error)
+
+        def recibir(j, texto):
+            i = indices[j]
+            if not texto or isinstance(texto, Exception):
+                terminar(i, None, self.mensaje_error)
+                return
+            try:
+                data = self.etapa(PARSEAR, texto)
+                terminar(i, Resultado(data, self.etapa(FORMATEAR, data, lista_entradas[i]), prompts[j]), None)
+            except FalloEtapa:
+                self.invalidar(prompts[j])
+                terminar(i, None, self.mensaje_error)
+
+        if prompts:
+            inicio = time.perf_counter()
+            generate_many(
+                prompts,
+                max_concurrency=max_concurrency,
+                return_exceptions=True,
+                practice_key=self.practice_key,
+                response_schema=self.schema,
+                system_instruction=self.system_instruction,
+                on_result=recibir
+            )
+            self._registrar(GENERAR_LOTE, inicio, None)
+        if registrar and any(resultado for resultado, _ in salida):
+            registrar_uso(self.practice_key)
+        return salida
+
+    def exportar(self, titulo, secciones):
+        """Documento del resultado (PDF por defecto), cacheado por contenido"""
+        return self.etapa(EXPORTAR, titulo, secciones)
+
+
+def reporte_etapas():
+    """
+    Latencia por practica y etapa.
+
+    Returns:
+        list: dicts con practice_key, etapa, llamadas, errores, p50, p95 y avg (ms)
+    """
+    snapshot = metrics.snapshot()
+    errores = {
+        (c["labels"].get("practice"), c["labels"].get("stage")): c["value"]
+        for c in snapshot["counters"] if c["name"] == "practice.stage_errors"
+    }
+    filas = []
+    for h in snapshot["histograms"]:
+        if h["name"] != "practice.stage_ms":
+            continue
+        practica, etapa = h["labels"].get("practice"), h["labels"].get("stage")
+        filas.append({
+            "practice_key": practica,
+            "etapa": etapa,
+            "llamadas": h["count"],
+            "errores": errores.get((practica, etapa), 0),
+            "p50": h["p50"],
+            "p95": h["p95"],
+            "avg": h["avg"]
+        })
+    orden = {etapa: i for i, etapa in enumerate(ETAPAS + (GENERAR_LOTE,))}
+    return sorted(filas, key=lambda f: (f["practice_key"] or "", orden.get(f["etapa"], 99)))
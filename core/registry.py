@@ -0,0 +1,119 @@
+"""
+Registro de practicas
+Mapea cada practica de PRACTICAS a su modulo en practicas/ y lo importa
+la primera vez que se usa (despues queda en cache: despacho O(1)). Tras
+el login un hilo precarga las practicas mas usadas para que el primer
+click no pague el import.
+"""
+
+import importlib
+import logging
+import threading
+import time
+from collections import Counter
+
+from .config import CATEGORIAS, PRACTICAS, PRECARGA
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Practicas visibles solo para algunos roles (no van en el menu por categoria)
+SOLO_ADMIN = {"admin_panel"}
+
+MODULOS = {clave: f"practicas.{clave}" for clave in PRACTICAS}
+
+_lock = threading.Lock()
+# Un lock por practica: importar una no bloquea el despacho de otra
+_locks = {}
+_renders = {}
+_usos = Counter()
+_precargando = False
+
+
+def modulo(clave):
+    """Ruta del modulo de la practica, o None si no esta registrada"""
+    return MODULOS.get(clave)
+
+
+def cargar(clave):
+    """
+    Retorna la funcion render() de la practica, importando su modulo la
+    primera vez.
+
+    Raises:
+        KeyError: si la practica no esta registrada
+    """
+    render = _renders.get(clave)
+    if render is not None:
+        return render
+    ruta = MODULOS[clave]
+    with _lock:
+        lock = _locks.setdefault(clave, threading.Lock())
+    with lock:
+        render = _renders.get(clave)
+        if render is None:
+            inicio = time.perf_counter()
+            render = importlib.import_module(ruta).render
+            metrics.observe("app.practice_import_ms", (time.perf_counter() - inicio) * 1000,
+                            practice=clave)
+            _renders[clave] = render
+    return render
+
+
+def render(clave):
+    """Muestra la practica y cuenta la visita (orden de la precarga)"""
+    vista = cargar(clave)
+    _usos[clave] += 1
+    metrics.incr("app.practice_views", practice=clave)
+    vista()
+
+
+def menu():
+    """
+    Categorias del menu lateral en orden.
+
+    Returns:
+        list: (nombre de la categoria, [practice_key, ...])
+    """
+    return [
+        (categoria["nombre"], [p for p in categoria["practicas"] if p in MODULOS])
+        for clave, categoria in CATEGORIAS.items()
+        if clave != "inicio"
+    ]
+
+
+def mas_usadas(cantidad):
+    """Practicas mas visitadas en el proceso, completadas con las de PRECARGA"""
+    orden = [clave for clave, _ in _usos.most_common()]
+    orden += [clave for clave in PRECARGA.get("practicas", ()) if clave not in orden]
+    return [clave for clave in orden if clave in MODULOS and clave not in SOLO_ADMIN][:cantidad]
+
+
+def _precargar(claves):
+    global _precargando
+    try:
+        for clave in claves:
+            try:
+                cargar(clave)
+            except Exception as e:
+                logger.warning("No se pudo precargar la practica %s: %s", clave, e)
+    finally:
+        _precargando = False
+
+
+def precargar():
+    """
+    Importa en segundo plano las practicas mas usadas que aun no esten
+    cargadas. Llamar despues del login; si ya estan todas no hace nada.
+    """
+    global _precargando
+    if not PRECARGA.get("enabled", True):
+        return
+    pendientes = [c for c in mas_usadas(PRECARGA.get("cantidad", 6)) if c not in _renders]
+    with _lock:
+        if not pendientes or _precargando:
+            return
+        _precargando = True
+    threading.Thread(
+        target=_precargar, args=(pendientes,), name="yocreo-precarga", daemon=True
+    ).start()
@@ -0,0 +1,27 @@
+-- Migración 003: Métricas de tokens y latencia de IA por práctica
+-- Ejecutar en Supabase SQL Editor
+-- Cada fila agrega las llamadas de un intervalo de flush (~60s) por práctica, organización y modelo
+
+CREATE TABLE IF NOT EXISTS ai_usage_metrics (
+  id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+  practice_key TEXT NOT NULL,
+  organization_id UUID REFERENCES organizations(id) ON DELETE SET NULL,
+  model TEXT NOT NULL,
+  calls INTEGER NOT NULL DEFAULT 0,
+  prompt_tokens BIGINT NOT NULL DEFAULT 0,
+  output_tokens BIGINT NOT NULL DEFAULT 0,
+  total_tokens BIGINT NOT NULL DEFAULT 0,
+  latency_ms_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+  latency_ms_max DOUBLE PRECISION NOT NULL DEFAULT 0,
+  truncated INTEGER NOT NULL DEFAULT 0,
+  created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_ai_usage_metrics_practice ON ai_usage_metrics(practice_key, created_at);
+CREATE INDEX IF NOT EXISTS idx_ai_usage_metrics_org ON ai_usage_metrics(organization_id, created_at);
+
+ALTER TABLE ai_usage_metrics ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Allow insert ai usage metrics" ON ai_usage_metrics
+  FOR INSERT
+  WITH CHECK (true);
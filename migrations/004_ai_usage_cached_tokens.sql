@@ -0,0 +1,5 @@
+-- Migración 004: Tokens de entrada servidos desde el cache de contexto de Gemini
+-- Ejecutar en Supabase SQL Editor
+
+ALTER TABLE ai_usage_metrics
+  ADD COLUMN IF NOT EXISTS cached_tokens BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,33 @@
+-- Migración 005: Historial de resultados por usuario (copia del historial local)
+-- Ejecutar en Supabase SQL Editor
+-- La app hace upsert por id desde SQLite y lo lee al abrir una instancia nueva.
+-- created_at es epoch en segundos (float), igual que en el historial local
+
+CREATE TABLE IF NOT EXISTS practice_history (
+  id TEXT PRIMARY KEY,
+  email TEXT NOT NULL,
+  practice_key TEXT NOT NULL,
+  input_hash TEXT NOT NULL,
+  titulo TEXT,
+  resultado TEXT NOT NULL,
+  entradas JSONB,
+  data JSONB,
+  created_at DOUBLE PRECISION NOT NULL,
+  synced_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_practice_history_email ON practice_history(email, created_at DESC);
+
+ALTER TABLE practice_history ENABLE ROW LEVEL SECURITY;
+
+-- Cada usuario solo ve y escribe sus propias filas (email del JWT). La
+-- anon key sola no alcanza: sin JWT del usuario no pasa ninguna politica
+CREATE POLICY "Owner read practice history" ON practice_history
+  FOR SELECT USING (email = lower(auth.jwt()->>'email'));
+
+CREATE POLICY "Owner insert practice history" ON practice_history
+  FOR INSERT WITH CHECK (email = lower(auth.jwt()->>'email'));
+
+CREATE POLICY "Owner update practice history" ON practice_history
+  FOR UPDATE USING (email = lower(auth.jwt()->>'email'))
+  WITH CHECK (email = lower(auth.jwt()->>'email'));
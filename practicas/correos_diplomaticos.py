@@ -4,55 +4,142 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
-from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
+from core.ai_client import esquema_objeto
+from core.export import copy_button_component, render_encabezado
 from core.analytics import registrar_uso
+from core.history import guardar_resultado, render_historial
+from core.pipeline import PracticePipeline, quitar_markdown
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
-
-
-def generar_correos_ai(texto, destinatario, tono):
-    """Genera 3 versiones de un mensaje diplomático."""
-    prompt = f"""Eres un experto en comunicación asertiva y redacción profesional.
-
-MENSAJE ORIGINAL: "{texto}"
-DESTINATARIO: {destinatario}
-TONO DESEADO: {tono}
-
-TU TAREA:
-Genera 3 versiones del correo (Profesional, Directa, Coloquial) transformando el mensaje original en comunicacion asertiva.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. El resultado debe ser un correo completo (Asunto, Cuerpo, Despedida).
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "profesional": "Texto completo version formal...",
-    "directa": "Texto completo version ejecutiva...",
-    "coloquial": "Texto completo version cercana..."
-}}"""
-    response = generate_response(prompt)
-    if response:
-        data = limpiar_json(response)
-        if data:
-            for key in data:
-                data[key] = data[key].replace("**", "").replace("##", "")
-            return data
+SISTEMA = instruccion_sistema("correos_diplomaticos")
+
+ESQUEMA_CORREOS = esquema_objeto({
+    "profesional": "Texto completo de la version formal (Asunto, Cuerpo, Despedida).",
+    "directa": "Texto completo de la version ejecutiva (Asunto, Cuerpo, Despedida).",
+    "coloquial": "Texto completo de la version cercana (Asunto, Cuerpo, Despedida)."
+})
+
+SECCIONES = {
+    "profesional": "VERSION PROFESIONAL",
+    "directa": "VERSION DIRECTA",
+    "coloquial": "VERSION COLOQUIAL"
+}
+
+
+TONOS = ["Neutro", "Cordial", "Urgente", "Empático"]
+
+
+def validar_borrador(entradas):
+    """Mensaje para el usuario si falta el borrador."""
+    if not entradas["texto"]:
+        return "Por favor escribe un borrador primero."
     return None
 
 
+def prompt_correos(entradas):
+    """Prompt con el borrador, el destinatario y el tono."""
+    return f"""MENSAJE ORIGINAL: "{entradas['texto']}"
+DESTINATARIO: {entradas['destinatario']}
+TONO DESEADO: {entradas['tono']}"""
+
+
+def formato_correos(data, entradas):
+    """Texto editable con el original y las 3 versiones."""
+    return f"""ORIGINAL:
+{entradas['texto']}
+
+--- VERSION PROFESIONAL ---
+{data['profesional']}
+
+--- VERSION DIRECTA ---
+{data['directa']}
+
+--- VERSION COLOQUIAL ---
+{data['coloquial']}"""
+
+
+PIPELINE = PracticePipeline(
+    "correos_diplomaticos",
+    prompt=prompt_correos,
+    formato=formato_correos,
+    validar=validar_borrador,
+    schema=ESQUEMA_CORREOS,
+    system_instruction=SISTEMA,
+    secciones=SECCIONES,
+    limpiar=quitar_markdown,
+    mensaje_error="No se pudieron generar las propuestas. Intenta de nuevo.",
+    titulo_historial=lambda entradas: f"{entradas['destinatario']} ({entradas['tono']}): {entradas['texto']}"
+)
+
+
+# ==================== COMPARAR TONOS ====================
+
+def mostrar_versiones(data):
+    """Las 3 versiones de un tono en pestanas."""
+    pestanas = st.tabs(["Profesional", "Directa", "Coloquial"])
+    for pestana, campo in zip(pestanas, SECCIONES):
+        with pestana:
+            st.write(data[campo])
+
+
+def comparar_tonos(texto, destinatario):
+    """
+    Pide todos los tonos en paralelo y muestra cada uno apenas llega.
+    No registra el uso: cuenta solo el tono que el usuario elija.
+
+    Returns:
+        dict: {tono: data o None}
+    """
+    tonos = {}
+    zona = st.empty()
+    slots = []
+    with zona.container():
+        columnas = st.columns(2) + st.columns(2)
+        for columna, tono in zip(columnas, TONOS):
+            with columna:
+                st.markdown(f"**{tono}**")
+                slot = st.empty()
+                slot.markdown('<div class="custom-info">Generando...</div>', unsafe_allow_html=True)
+                slots.append(slot)
+
+    def al_terminar(i, resultado, error):
+        tonos[TONOS[i]] = resultado.data if resultado is not None else None
+        with slots[i].container():
+            if resultado is None:
+                st.markdown(f'<div class="custom-error">{error}</div>', unsafe_allow_html=True)
+            else:
+                mostrar_versiones(resultado.data)
+
+    PIPELINE.run_lote(
+        [{"texto": texto, "destinatario": destinatario, "tono": tono} for tono in TONOS],
+        max_concurrency=len(TONOS),
+        al_terminar=al_terminar,
+        registrar=False
+    )
+    zona.empty()
+    return tonos
+
+
+def elegir_tono(tono):
+    """Callback de "Usar este tono": deja esa version como resultado y cuenta el uso."""
+    comparacion = st.session_state.mail_comparacion
+    entradas = dict(comparacion["entradas"], tono=tono)
+    data = comparacion["tonos"][tono]
+    st.session_state.mail_versions = data
+    st.session_state.mail_original = entradas["texto"]
+    st.session_state.mail_resultado = formato_correos(data, entradas)
+    st.session_state.pop("edit_mail", None)
+    comparacion["elegido"] = tono
+    guardar_resultado(
+        "correos_diplomaticos", entradas, st.session_state.mail_resultado, data=data,
+        titulo=PIPELINE.titulo_historial(entradas)
+    )
+    registrar_uso("correos_diplomaticos")
+
+
 def render():
     """Renderiza la practica Correos Diplomaticos."""
     info = PRACTICAS["correos_diplomaticos"]
@@ -77,11 +164,19 @@ def render():
         st.session_state.mail_versions = None
     if 'mail_original' not in st.session_state:
         st.session_state.mail_original = None
+    if 'mail_comparacion' not in st.session_state:
+        st.session_state.mail_comparacion = None
 
     # ==================== CAJA 2: INPUTS ====================
     with st.container(border=True):
         st.markdown("#### Tu Borrador")
 
+        comparar = st.toggle(
+            "Comparar todos los tonos",
+            key="correos_comparar",
+            help="Genera los 4 tonos a la vez para verlos lado a lado y quedarte con uno."
+        )
+
         col1, col2 = st.columns(2)
         with col1:
             destinatario = st.selectbox(
@@ -92,8 +187,9 @@ def render():
         with col2:
             tono = st.selectbox(
                 "Tono Principal",
-                ["Neutro", "Cordial", "Urgente", "Empático"],
-                key="correos_tono"
+                TONOS,
+                key="correos_tono",
+                disabled=comparar
             )
 
         texto_input = st.text_area(
@@ -103,30 +199,51 @@ def render():
             key="correos_texto"
         )
 
-        if st.button("Generar Propuestas", use_container_width=True):
-            if texto_input:
+        if st.button("Comparar Tonos" if comparar else "Generar Propuestas", use_container_width=True):
+            entradas = {"texto": texto_input, "destinatario": destinatario, "tono": tono}
+            if comparar:
+                mensaje = validar_borrador(entradas)
+                if mensaje:
+                    st.markdown(f'<div class="custom-warning">{mensaje}</div>', unsafe_allow_html=True)
+                else:
+                    st.session_state.mail_comparacion = {
+                        "entradas": {"texto": texto_input, "destinatario": destinatario},
+                        "tonos": comparar_tonos(texto_input, destinatario),
+                        "elegido": None
+                    }
+            else:
                 with st.spinner("Reescribiendo mensajes..."):
-                    data = generar_correos_ai(texto_input, destinatario, tono)
-                    if data:
-                        st.session_state.mail_versions = data
-                        st.session_state.mail_original = texto_input
-                        registrar_uso("correos_diplomaticos")
-                        resultado = f"""ORIGINAL:
-{texto_input}
-
---- VERSION PROFESIONAL ---
-{data['profesional']}
+                    resultado = PIPELINE.run(entradas)
+                if resultado:
+                    st.session_state.mail_versions = resultado.data
+                    st.session_state.mail_original = texto_input
+                    st.session_state.mail_resultado = resultado.texto
 
---- VERSION DIRECTA ---
-{data['directa']}
+    # ==================== COMPARACION DE TONOS ====================
+    comparacion = st.session_state.mail_comparacion
+    if comparar and comparacion:
+        with st.container(border=True):
+            st.markdown("#### Comparacion de Tonos")
+            st.caption("Elige el tono que prefieras para editarlo y descargarlo.")
 
---- VERSION COLOQUIAL ---
-{data['coloquial']}"""
-                        st.session_state.mail_resultado = resultado
-                    else:
-                        st.markdown('<div class="custom-error">No se pudieron generar las propuestas. Intenta de nuevo.</div>', unsafe_allow_html=True)
-            else:
-                st.markdown('<div class="custom-warning">Por favor escribe un borrador primero.</div>', unsafe_allow_html=True)
+            columnas = st.columns(2) + st.columns(2)
+            for columna, tono_i in zip(columnas, TONOS):
+                with columna:
+                    data = comparacion["tonos"].get(tono_i)
+                    elegido = comparacion["elegido"] == tono_i
+                    st.markdown(f"**{tono_i}**" + (" (elegido)" if elegido else ""))
+                    if data is None:
+                        st.markdown('<div class="custom-error">No se pudo generar este tono.</div>', unsafe_allow_html=True)
+                        continue
+                    mostrar_versiones(data)
+                    st.button(
+                        "Usar este tono",
+                        key=f"correos_elegir_{tono_i}",
+                        on_click=elegir_tono,
+                        args=(tono_i,),
+                        disabled=elegido,
+                        use_container_width=True
+                    )
 
     # ==================== CAJA 3: RESULTADOS ====================
     if st.session_state.mail_resultado:
@@ -162,7 +279,7 @@ def render():
                 )
 
             if fmt == "PDF":
-                pdf_data = create_pdf_reportlab(
+                pdf_data = PIPELINE.exportar(
                     "Propuestas de Comunicacion",
                     [("Resultado", st.session_state.mail_resultado)]
                 )
@@ -181,3 +298,9 @@ def render():
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "correos_diplomaticos", "mail_resultado", widget_key="edit_mail",
+        titulo="Propuestas anteriores"
+    )
@@ -4,48 +4,46 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("definicion_objetivos")
+
+ESQUEMA_OBJETIVOS = esquema_objeto({
+    "objetivo_inspirador": "Objetivo principal inspirador.",
+    "res1": "Objetivo especifico 1, medible y concreto.",
+    "res2": "Objetivo especifico 2, medible y concreto.",
+    "res3": "Objetivo especifico 3, medible y concreto.",
+    "plan_accion": "Una primera accion sugerida."
+})
+
+SECCIONES = {
+    "objetivo_inspirador": "OBJETIVO PRINCIPAL",
+    "res1": "OBJETIVO ESPECIFICO 1",
+    "res2": "OBJETIVO ESPECIFICO 2",
+    "res3": "OBJETIVO ESPECIFICO 3",
+    "plan_accion": "PRIMER PASO DE ACCION"
+}
 
 
 def generar_objetivos(deseo, rol):
     """Genera objetivos estructurados a partir de un deseo."""
-    prompt = f"""Actua como un Experto en Planificacion Estrategica.
-El usuario tiene un deseo vago: "{deseo}".
-Su rol es: "{rol}".
-
-Tu tarea es transformar ese deseo en una estructura profesional:
-1. Un OBJETIVO PRINCIPAL inspirador.
-2. Tres OBJETIVOS ESPECIFICOS que sean medibles y concretos.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "objetivo_inspirador": "Texto del objetivo principal...",
-    "res1": "Objetivo Especifico 1...",
-    "res2": "Objetivo Especifico 2...",
-    "res3": "Objetivo Especifico 3...",
-    "plan_accion": "Una primera accion sugerida..."
-}}"""
-    response = generate_response(prompt)
+    prompt = f"""El usuario tiene un deseo vago: "{deseo}".
+Su rol es: "{rol}"."""
+    response = generate_response_live(
+        prompt, practice_key="definicion_objetivos", response_schema=ESQUEMA_OBJETIVOS,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_OBJETIVOS)
+        if data:
+            return data
     return None
 
 
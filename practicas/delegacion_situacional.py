@@ -4,46 +4,41 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("delegacion_situacional")
+
+ESQUEMA_DELEGACION = esquema_objeto({
+    "diagnostico": "Identifica si es E1, E2, E3 o E4 y explica el estilo (Dirigir, Persuadir, Participar o Delegar).",
+    "pasos": "Pasos a seguir, uno por linea con guion (- Paso 1: ...).",
+    "guion": "Guion directo y conversacional para iniciar la delegacion."
+})
+
+SECCIONES = {
+    "diagnostico": "DIAGNOSTICO",
+    "pasos": "PASOS",
+    "guion": "GUION DE CONVERSACION"
+}
 
 
 def generar_estrategia_ai(tarea, nivel, disposicion):
     """Genera estrategia de delegación basada en liderazgo situacional."""
-    prompt = f"""Actua como un Coach experto en Liderazgo Situacional (Hersey & Blanchard).
-TAREA A DELEGAR: {tarea}
+    prompt = f"""TAREA A DELEGAR: {tarea}
 NIVEL DE COMPETENCIA (Hacer): {nivel}
-NIVEL DE COMPROMISO (Querer): {disposicion}
-
-Genera una estrategia de delegacion precisa.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. En la seccion pasos, usa vinetas simples con guion (-).
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "diagnostico": "Identifica si es E1, E2, E3 o E4 y explica el estilo (Dirigir, Persuadir, Participar o Delegar).",
-    "pasos": "- Paso 1: ...\\n- Paso 2: ...\\n- Paso 3: ...",
-    "guion": "Escribe un guión directo y conversacional para iniciar la delegación."
-}}"""
-    response = generate_response(prompt)
+NIVEL DE COMPROMISO (Querer): {disposicion}"""
+    response = generate_response_live(
+        prompt, practice_key="delegacion_situacional", response_schema=ESQUEMA_DELEGACION,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        data = limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_DELEGACION)
         if data:
             for key in data:
                 data[key] = data[key].replace("**", "").replace("[", "").replace("]", "")
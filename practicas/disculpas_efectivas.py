@@ -4,53 +4,73 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
-from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
-from core.analytics import registrar_uso
+from core.ai_client import esquema_objeto
+from core.export import copy_button_component, render_encabezado
+from core.history import render_historial
+from core.pipeline import PracticePipeline, quitar_markdown
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("disculpas_efectivas")
 
+ESQUEMA_DISCULPA = esquema_objeto({
+    "analisis": "Breve explicacion de por que su justificacion invalida la disculpa.",
+    "guion": "El texto exacto para decir, profesional y humilde.",
+    "reparacion": "Una accion concreta sugerida para compensar el dano."
+})
 
-def generar_disculpa_ai(quien, que_paso, excusa):
-    """Genera una disculpa efectiva sin justificaciones."""
-    prompt = f"""Actua como un experto en Resolucion de Conflictos y Coaching.
-El usuario cometio un error con: {quien}.
+SECCIONES = {
+    "analisis": "ANALISIS DEL ERROR",
+    "guion": "GUION DE DISCULPA",
+    "reparacion": "ACCION REPARADORA"
+}
 
-HECHO (Lo que paso): "{que_paso}"
-JUSTIFICACION MENTAL (La excusa que se da): "{excusa}"
 
-TU MISION:
-Redacta una DISCULPA EFECTIVA que elimine el "PERO" y la justificacion.
+def validar_caso(entradas):
+    """Mensaje para el usuario si faltan datos del caso."""
+    if not entradas["quien"] or not entradas["que_paso"]:
+        return "Por favor completa a quien y que paso."
+    return None
 
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. Usa vinetas simples (-) si es necesario listar.
 
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "analisis": "Breve explicacion de por que su justificacion invalida la disculpa.",
-    "guion": "El texto exacto para decir, profesional y humilde.",
-    "reparacion": "Una accion concreta sugerida para compensar el dano."
-}}"""
-    response = generate_response(prompt)
-    if response:
-        data = limpiar_json(response)
-        if data:
-            for key in data:
-                data[key] = data[key].replace("**", "").replace("##", "")
-            return data
-    return None
+def prompt_disculpa(entradas):
+    """Prompt con el error y la excusa, sin justificaciones."""
+    return f"""El usuario cometio un error con: {entradas['quien']}.
+
+HECHO (Lo que paso): "{entradas['que_paso']}"
+JUSTIFICACION MENTAL (La excusa que se da): "{entradas['excusa']}\""""
+
+
+def formato_disculpa(data, entradas):
+    """Texto editable del plan."""
+    return f"""ANALISIS DEL ERROR:
+{data['analisis']}
+
+GUION DE DISCULPA:
+{data['guion']}
+
+ACCION REPARADORA:
+{data['reparacion']}"""
+
+
+PIPELINE = PracticePipeline(
+    "disculpas_efectivas",
+    prompt=prompt_disculpa,
+    formato=formato_disculpa,
+    validar=validar_caso,
+    schema=ESQUEMA_DISCULPA,
+    system_instruction=SISTEMA,
+    secciones=SECCIONES,
+    limpiar=quitar_markdown,
+    mensaje_error="No se pudo generar la disculpa. Intenta de nuevo.",
+    titulo_historial=lambda entradas: f"{entradas['quien']}: {entradas['que_paso']}"
+)
+
+
+def abrir_del_historial(item):
+    st.session_state.rep_quien = item["entradas"].get("quien")
 
 
 def render():
@@ -103,25 +123,11 @@ def render():
         )
 
         if st.button("Disenar Disculpa", use_container_width=True):
-            if quien and que_paso:
-                with st.spinner("Analizando situacion..."):
-                    data = generar_disculpa_ai(quien, que_paso, excusa)
-                    if data:
-                        resultado = f"""ANALISIS DEL ERROR:
-{data['analisis']}
-
-GUION DE DISCULPA:
-{data['guion']}
-
-ACCION REPARADORA:
-{data['reparacion']}"""
-                        st.session_state.rep_resultado = resultado
-                        st.session_state.rep_quien = quien
-                        registrar_uso("disculpas_efectivas")
-                    else:
-                        st.markdown('<div class="custom-error">No se pudo generar la disculpa. Intenta de nuevo.</div>', unsafe_allow_html=True)
-            else:
-                st.markdown('<div class="custom-warning">Por favor completa a quien y que paso.</div>', unsafe_allow_html=True)
+            with st.spinner("Analizando situacion..."):
+                resultado = PIPELINE.run({"quien": quien, "que_paso": que_paso, "excusa": excusa})
+            if resultado:
+                st.session_state.rep_resultado = resultado.texto
+                st.session_state.rep_quien = quien
 
     # ==================== CAJA 3: RESULTADOS ====================
     if st.session_state.rep_resultado:
@@ -157,7 +163,7 @@ ACCION REPARADORA:
                 )
 
             if fmt == "PDF":
-                pdf_data = create_pdf_reportlab(
+                pdf_data = PIPELINE.exportar(
                     f"Plan de Disculpa para {st.session_state.rep_quien}",
                     [("Plan", st.session_state.rep_resultado)]
                 )
@@ -176,3 +182,9 @@ ACCION REPARADORA:
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "disculpas_efectivas", "rep_resultado", widget_key="edit_disc",
+        al_abrir=abrir_del_historial, titulo="Disculpas anteriores"
+    )
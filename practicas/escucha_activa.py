@@ -4,78 +4,165 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
-import re
+import random
 
-from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.config import AI_CONFIG, PRACTICAS
+from core.ai_client import (
+    esquema_objeto, generate_response_live, get_engine, identidad_actual
+)
+from core.ai_pool import GenerationPool
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.history import guardar_resultado, render_historial
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        match = re.search(r'(\{.*\}|\[.*\])', texto, re.DOTALL)
-        if match:
-            try:
-                return json.loads(match.group(0))
-            except:
-                return None
-        return None
+SISTEMA_PERSONAJE = instruccion_sistema("escucha_activa.personaje")
+SISTEMA_EVALUACION = instruccion_sistema("escucha_activa.evaluacion")
 
+ESQUEMA_PERSONAJE = esquema_objeto({
+    "nombre": "Nombre del personaje.",
+    "rol": "Rol o relacion del personaje.",
+    "emocion_dominante": "Emocion dominante.",
+    "texto_monologo": "Monologo de 3-5 frases, natural y emocional."
+})
 
-def generar_personaje():
-    """Crea un personaje frustrado aleatorio con alta variabilidad."""
-    prompt = """Genera un caso de roleplay para practicar escucha activa.
+ESQUEMA_EVALUACION = esquema_objeto({
+    "consejo_detectado": {
+        "type": "boolean",
+        "description": "true si el usuario dio consejos en vez de escuchar."
+    },
+    "puntaje": {"type": "integer", "description": "Numero del 1 al 10."},
+    "feedback_positivo": "Lo que hizo bien.",
+    "feedback_mejora": "Lo que le falto.",
+    "ejemplo_ideal": "Respuesta perfecta de Reflective Listening."
+})
+
+SECCIONES_EVALUACION = {
+    "puntaje": "PUNTAJE",
+    "feedback_positivo": "LO BUENO",
+    "feedback_mejora": "A MEJORAR",
+    "ejemplo_ideal": "RESPUESTA IDEAL"
+}
+
+
+CONTEXTOS = (
+    "laboral", "familiar", "pareja", "salud", "economico",
+    "estudios", "amistad", "vivienda", "crianza", "emprendimiento"
+)
 
-IDIOMA: Espanol latinoamericano (sin vosotros, usa tu/usted).
 
-Inventa un contexto original (laboral, familiar, pareja, salud, economico, etc).
-El personaje debe estar estresado, triste o preocupado.
-Escribe un monologo de 3-5 frases natural y emocional.
+def prompt_personaje():
+    """Prompt con un contexto al azar: mas variedad y menos monologos repetidos."""
+    return f"Genera un caso nuevo. Contexto: {random.choice(CONTEXTOS)}."
 
-Responde SOLO con este JSON (sin texto adicional):
-{"nombre": "Nombre", "rol": "Rol", "emocion_dominante": "Emocion", "texto_monologo": "El monologo aqui..."}"""
-    response = generate_response(prompt)
+
+def personaje_valido(data):
+    return isinstance(data, dict) and bool(data.get("texto_monologo"))
+
+
+def generar_personaje():
+    """Crea un personaje frustrado aleatorio con alta variabilidad."""
+    # Sin cache: cada click debe traer un personaje distinto
+    response = generate_response_live(
+        prompt_personaje(), use_cache=False, practice_key="escucha_activa",
+        response_schema=ESQUEMA_PERSONAJE, system_instruction=SISTEMA_PERSONAJE
+    )
     if response:
-        return limpiar_json(response)
+        return limpiar_json(response, ESQUEMA_PERSONAJE)
+    return None
+
+
+def crear_personajes(engine, cantidad):
+    """Genera un lote de personajes para el pool (corre fuera del script)."""
+    respuestas = engine.generate_many(
+        [prompt_personaje() for _ in range(cantidad)],
+        use_cache=False,
+        return_exceptions=True,
+        identity=("pool:escucha_activa", None),
+        practice_key="escucha_activa",
+        response_schema=ESQUEMA_PERSONAJE,
+        system_instruction=SISTEMA_PERSONAJE
+    )
+    personajes = []
+    for response in respuestas:
+        data = limpiar_json(response, ESQUEMA_PERSONAJE) if isinstance(response, str) else None
+        if personaje_valido(data):
+            personajes.append(data)
+    return personajes
+
+
+@st.cache_resource(show_spinner=False)
+def get_pool_personajes():
+    """Pool de personajes listos, compartido por todas las sesiones del proceso."""
+    config = dict(AI_CONFIG.get("persona_pool", {}))
+    lote = config.pop("batch", 3)
+    engine = get_engine()
+    return GenerationPool(
+        "escucha_activa",
+        generar=lambda: crear_personajes(engine, lote),
+        clave=lambda personaje: personaje.get("texto_monologo"),
+        **config
+    )
+
+
+def traer_personaje():
+    """
+    Entrega al instante un personaje del pool que el usuario no haya visto.
+    Si el pool no tiene ninguno, lo genera en el momento.
+    """
+    pool = get_pool_personajes()
+    email = identidad_actual()[0]
+    personaje = pool.pop(email)
+    if personaje is not None:
+        return personaje
+
+    for _ in range(2):
+        personaje = generar_personaje()
+        if not personaje_valido(personaje):
+            return None
+        if not pool.ya_visto(email, personaje):
+            pool.marcar_visto(email, personaje)
+            return personaje
     return None
 
 
 def evaluar_respuesta(caso_original, respuesta_usuario):
     """Evalua si el usuario escucho o si dio consejos."""
-    prompt = f"""Actua como Supervisor de Coaching. Evalua la respuesta del usuario ante una queja.
-
-CASO ORIGINAL (Dijo el personaje): "{caso_original}"
-RESPUESTA DEL USUARIO (Dijo el coach): "{respuesta_usuario}"
-
-CRITERIOS DE EVALUACION:
-1. PROHIBIDO ACONSEJAR: Si el usuario dice "deberias", "tienes que", "por que no pruebas", "yo en tu lugar", califica con 0 en empatia.
-2. VALIDACION: El usuario reconocio la emocion explicita o implicita?
-3. PARAFRASEO: El usuario resumio los hechos principales sin agregar de su cosecha?
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "consejo_detectado": true/false,
-    "puntaje": (Numero del 1 al 10),
-    "feedback_positivo": "Lo que hizo bien...",
-    "feedback_mejora": "Lo que le falto...",
-    "ejemplo_ideal": "Respuesta perfecta de Reflective Listening"
-}}"""
-    response = generate_response(prompt)
+    prompt = f"""CASO ORIGINAL (Dijo el personaje): "{caso_original}"
+RESPUESTA DEL USUARIO (Dijo el coach): "{respuesta_usuario}\""""
+    response = generate_response_live(
+        prompt, practice_key="escucha_activa", response_schema=ESQUEMA_EVALUACION,
+        system_instruction=SISTEMA_EVALUACION, secciones=SECCIONES_EVALUACION
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_EVALUACION)
+        if data:
+            return data
     return None
 
 
+def texto_evaluacion(ev):
+    """Texto editable de la evaluacion del coach."""
+    return f"""PUNTAJE: {ev.get('puntaje', 0)}/10
+
+LO BUENO:
+{ev.get('feedback_positivo', '')}
+
+A MEJORAR:
+{ev.get('feedback_mejora', '')}
+
+RESPUESTA IDEAL:
+{ev.get('ejemplo_ideal', '')}"""
+
+
+def abrir_del_historial(item):
+    data = item.get("data") or {}
+    st.session_state.escucha_caso = data.get("caso")
+    st.session_state.escucha_evaluacion = data.get("evaluacion")
+
+
 def render():
     """Renderiza la practica Escucha Activa."""
     info = PRACTICAS["escucha_activa"]
@@ -95,13 +182,14 @@ def render():
             - "Yo en tu lugar..."
             """)
 
+    # Arranca (una vez por proceso) el relleno del pool de personajes
+    get_pool_personajes()
+
     # Estado de sesion
     if 'escucha_caso' not in st.session_state:
         st.session_state.escucha_caso = None
     if 'escucha_evaluacion' not in st.session_state:
         st.session_state.escucha_evaluacion = None
-    if 'escucha_historial' not in st.session_state:
-        st.session_state.escucha_historial = []
 
     # ==================== CAJA 2: SIMULADOR ====================
     with st.container(border=True):
@@ -109,7 +197,7 @@ def render():
 
         if st.button("Traer nuevo interlocutor", use_container_width=True):
             with st.spinner("Buscando a alguien que necesita ser escuchado..."):
-                resultado = generar_personaje()
+                resultado = traer_personaje()
                 if resultado:
                     st.session_state.escucha_caso = resultado
                     st.session_state.escucha_evaluacion = None
@@ -148,12 +236,14 @@ def render():
                         st.session_state.escucha_evaluacion = evaluacion
 
                         if evaluacion:
-                            st.session_state.escucha_historial.insert(0, {
-                                "personaje": caso.get('nombre', 'Persona'),
-                                "monologo": monologo[:50] + "...",
-                                "puntaje": evaluacion.get('puntaje', 0)
-                            })
-                            st.session_state.escucha_historial = st.session_state.escucha_historial[:5]
+                            st.session_state.pop("edit_escucha", None)
+                            guardar_resultado(
+                                "escucha_activa",
+                                {"monologo": monologo, "respuesta": respuesta_user},
+                                texto_evaluacion(evaluacion),
+                                data={"caso": caso, "evaluacion": evaluacion},
+                                titulo=f"{caso.get('nombre', 'Persona')} - Puntaje: {evaluacion.get('puntaje', 0)}/10"
+                            )
                             registrar_uso("escucha_activa")
         else:
             st.write("Presiona el boton para comenzar el simulacro.")
@@ -165,25 +255,12 @@ def render():
         with st.container(border=True):
             st.markdown("#### Veredicto del Coach")
 
-            score = ev.get('puntaje', 0)
-
             if ev.get('consejo_detectado'):
                 st.markdown('<div class="custom-error">ALERTA: Intentaste dar un consejo. En la escucha activa pura, primero debemos validar.</div>', unsafe_allow_html=True)
 
-            resultado_texto = f"""PUNTAJE: {score}/10
-
-LO BUENO:
-{ev.get('feedback_positivo', '')}
-
-A MEJORAR:
-{ev.get('feedback_mejora', '')}
-
-RESPUESTA IDEAL:
-{ev.get('ejemplo_ideal', '')}"""
-
             st.session_state.escucha_resultado_texto = st.text_area(
                 "Evaluacion editable:",
-                value=resultado_texto,
+                value=texto_evaluacion(ev),
                 height=300,
                 key="edit_escucha",
                 label_visibility="collapsed"
@@ -192,8 +269,7 @@ RESPUESTA IDEAL:
         copy_button_component(st.session_state.escucha_resultado_texto, key="copy_escucha")
 
     # ==================== HISTORIAL ====================
-    if st.session_state.escucha_historial:
-        with st.expander("Historial de practicas (ultimas 5)"):
-            for i, item in enumerate(st.session_state.escucha_historial):
-                st.write(f"{i+1}. {item['personaje']} - Puntaje: {item['puntaje']}/10")
-                st.caption(f"Caso: {item['monologo']}")
+    render_historial(
+        "escucha_activa", "escucha_resultado_texto", widget_key="edit_escucha",
+        al_abrir=abrir_del_historial, titulo="Historial de practicas"
+    )
@@ -3,54 +3,410 @@ Evaluacion de Desempeno - YoCreo Suite
 Protocolo Estandar v2.0
 """
 
+import io
+import time
+from xml.sax.saxutils import escape
+
+import pandas as pd
 import streamlit as st
-import json
 
-from core.config import PRACTICAS
-from core.ai_client import generate_response
-from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
-from core.analytics import registrar_uso
+from core.config import LOTES, PRACTICAS
+from core.ai_client import esquema_objeto
+from core.export import copy_button_component, render_encabezado
+from core.history import render_historial
+from core.pipeline import PracticePipeline, quitar_markdown
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("evaluacion_desempeno")
 
+ESQUEMA_SESGOS = esquema_objeto({
+    "puntaje": {
+        "type": "integer",
+        "description": "Numero del 1 al 100 indicando nivel de neutralidad actual."
+    },
+    "analisis": "Lista con vinetas (-) de los sesgos especificos encontrados y por que.",
+    "texto_neutral": "La version reescrita completa, profesional y objetiva."
+})
 
-def analizar_sesgos_ai(texto_evaluacion):
-    """Analiza sesgos inconscientes en una evaluacion de desempeno."""
-    prompt = f"""Actua como un Experto en Diversidad e Inclusion. Analiza esta evaluacion de desempeno.
+SECCIONES = {
+    "puntaje": "PUNTAJE DE NEUTRALIDAD",
+    "analisis": "ANALISIS DE SESGOS",
+    "texto_neutral": "VERSION CORREGIDA (Neutral)"
+}
 
-TEXTO: "{texto_evaluacion}"
 
-INSTRUCCIONES:
-1. Detecta sesgos inconscientes (Genero, Recencia, Halo, Subjetividad, Afinidad).
-2. Reescribe el texto eliminando los sesgos, dejandolo neutral y basado en hechos.
+def validar_texto(entradas):
+    """Mensaje para el usuario si el texto es muy corto."""
+    if len(entradas["texto"] or "") < 10:
+        return "Escribe un texto mas completo para analizar (minimo 10 caracteres)."
+    return None
 
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. En la lista de sesgos, usa vinetas simples (-).
 
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "puntaje": "Un numero del 1 al 100 indicando nivel de neutralidad actual.",
-    "analisis": "Lista con vinetas (-) de los sesgos especificos encontrados y por que.",
-    "texto_neutral": "La version reescrita completa, profesional y objetiva."
-}}"""
-    response = generate_response(prompt)
-    if response:
-        data = limpiar_json(response)
-        if data:
-            for key in data:
-                if isinstance(data[key], str):
-                    data[key] = data[key].replace("**", "").replace("##", "").replace("[", "").replace("]", "")
-            return data
-    return None
+def prompt_sesgos(entradas):
+    """Prompt con el borrador de la evaluacion."""
+    return f"""TEXTO: "{entradas['texto']}\""""
+
+
+def limpiar_sesgos(data):
+    return quitar_markdown(data, marcas=("**", "##", "[", "]"))
+
+
+def formato_sesgos(data, entradas):
+    """Texto editable del informe."""
+    return f"""PUNTAJE DE NEUTRALIDAD: {data['puntaje']}/100
+
+ANALISIS DE SESGOS:
+{data['analisis']}
+
+--------------------------------------------------
+
+VERSION CORREGIDA (Neutral):
+{data['texto_neutral']}"""
+
+
+PIPELINE = PracticePipeline(
+    "evaluacion_desempeno",
+    prompt=prompt_sesgos,
+    formato=formato_sesgos,
+    validar=validar_texto,
+    schema=ESQUEMA_SESGOS,
+    system_instruction=SISTEMA,
+    secciones=SECCIONES,
+    limpiar=limpiar_sesgos,
+    mensaje_error="No se pudo analizar el texto. Intenta de nuevo."
+)
+
+
+# ==================== LOTE (CSV/XLSX) ====================
+
+# Sesgos que se cuentan en el analisis de cada evaluacion (sin distinguir mayusculas)
+SESGOS = {
+    "Genero": r"g[eé]nero",
+    "Recencia": r"recencia|reciente",
+    "Halo": r"\bhalo\b",
+    "Subjetividad": r"subjetiv",
+    "Afinidad": r"afinidad|similitud",
+    "Severidad / Indulgencia": r"severidad|indulgencia|lenien",
+    "Tendencia central": r"tendencia central"
+}
+
+# Nombres de columna que se proponen como texto de la evaluacion
+COLUMNAS_TEXTO = ("evaluacion", "texto", "comentario", "comentarios", "review", "feedback")
+
+NIVELES = {
+    "bins": [0, 40, 60, 80, 100],
+    "labels": ["Sesgo alto (0-40)", "Sesgo moderado (41-60)", "Sesgo leve (61-80)", "Neutral (81-100)"]
+}
+
+SIN_COLUMNA = "(ninguna)"
+
+
+def leer_planilla(archivo):
+    """DataFrame de un CSV (separador y codificacion detectados) o XLSX subido."""
+    if archivo.name.lower().endswith(".xlsx"):
+        df = pd.read_excel(archivo, engine="openpyxl")
+    else:
+        try:
+            df = pd.read_csv(archivo, sep=None, engine="python", encoding="utf-8-sig")
+        except UnicodeDecodeError:
+            # CSV exportado desde Excel en Windows
+            archivo.seek(0)
+            df = pd.read_csv(archivo, sep=None, engine="python", encoding="latin-1")
+    df.columns = df.columns.astype(str).str.strip()
+    return df.dropna(how="all")
+
+
+def columna_probable(df):
+    """Columna que probablemente trae el texto: por nombre o la de textos mas largos."""
+    for columna in df.columns:
+        if columna.lower() in COLUMNAS_TEXTO:
+            return columna
+    textos = df.select_dtypes(include="object")
+    if textos.empty:
+        return df.columns[0]
+    return textos.apply(lambda c: c.astype(str).str.len().mean()).idxmax()
+
+
+def sesgos_detectados(analisis):
+    """DataFrame booleano (fila x tipo de sesgo) a partir de la columna analisis."""
+    analisis = analisis.fillna("")
+    return pd.DataFrame({
+        tipo: analisis.str.contains(patron, case=False, regex=True)
+        for tipo, patron in SESGOS.items()
+    })
+
+
+def estadisticas_sesgos(df):
+    """
+    Estadisticas del lote auditado (todo vectorizado con pandas).
+
+    Args:
+        df: DataFrame de auditar_lote()
+
+    Returns:
+        dict: resumen (indicadores), niveles, sesgos (frecuencia por tipo)
+            y grupos (puntaje por grupo, o None)
+    """
+    ok = df[df["puntaje"].notna()]
+    puntaje = ok["puntaje"]
+    resumen = pd.Series({
+        "Evaluaciones": len(df),
+        "Analizadas": len(ok),
+        "Con error": int(df["puntaje"].isna().sum()),
+        "Puntaje promedio": round(puntaje.mean(), 1) if len(ok) else None,
+        "Mediana": puntaje.median() if len(ok) else None,
+        "Desviacion": round(puntaje.std(), 1) if len(ok) > 1 else None,
+        "Minimo": puntaje.min() if len(ok) else None,
+        "% hasta 60": round((puntaje <= 60).mean() * 100, 1) if len(ok) else None
+    }, name="Valor", dtype=object)
+    niveles = (
+        pd.cut(puntaje, include_lowest=True, **NIVELES)
+        .value_counts(sort=False)
+        .rename("Evaluaciones")
+    )
+    matriz = sesgos_detectados(ok["analisis"])
+    sesgos = pd.DataFrame({
+        "Evaluaciones": matriz.sum(),
+        "%": (matriz.mean() * 100).round(1) if len(ok) else 0.0
+    }).sort_values("Evaluaciones", ascending=False)
+    grupos = None
+    if "grupo" in df.columns:
+        grupos = (
+            ok.groupby("grupo")["puntaje"]
+            .agg(Evaluaciones="count", Promedio="mean", Minimo="min")
+            .round(1)
+            .sort_values("Promedio")
+        )
+    return {"resumen": resumen, "niveles": niveles, "sesgos": sesgos, "grupos": grupos}
+
+
+def auditar_lote(df, columna_texto, columna_nombre=None, columna_grupo=None):
+    """
+    Audita todas las filas en paralelo y muestra cada resultado apenas llega.
+
+    Returns:
+        DataFrame: fila, nombre, grupo, texto, puntaje, sesgos, analisis,
+            texto_neutral, informe y error
+    """
+    n = len(df)
+    lote = pd.DataFrame({
+        "fila": range(1, n + 1),
+        "nombre": df[columna_nombre].fillna("").astype(str).values if columna_nombre else "",
+        "texto": df[columna_texto].fillna("").astype(str).str.strip().values
+    })
+    if columna_grupo:
+        lote["grupo"] = df[columna_grupo].fillna("Sin grupo").astype(str).values
+
+    campos = {campo: [None] * n for campo in ("puntaje", "analisis", "texto_neutral", "informe", "error")}
+    estado = ["En fila"] * n
+    tabla = st.empty()
+    ultimo = [0.0]
+
+    def dibujar(forzar=False):
+        # Redibujar la tabla en cada respuesta seria O(n^2) para lotes grandes
+        if forzar or time.monotonic() - ultimo[0] > 0.5:
+            ultimo[0] = time.monotonic()
+            tabla.dataframe(
+                pd.DataFrame({
+                    "Fila": lote["fila"], "Nombre": lote["nombre"],
+                    "Puntaje": campos["puntaje"], "Estado": estado
+                }),
+                hide_index=True, use_container_width=True, height=250
+            )
+
+    def al_terminar(i, resultado, error):
+        if resultado is not None:
+            data = resultado.data
+            campos["puntaje"][i] = data.get("puntaje")
+            campos["analisis"][i] = data.get("analisis", "")
+            campos["texto_neutral"][i] = data.get("texto_neutral", "")
+            campos["informe"][i] = resultado.texto
+            estado[i] = "Listo"
+        else:
+            campos["error"][i] = error
+            estado[i] = "Error"
+        dibujar()
+
+    dibujar(forzar=True)
+    PIPELINE.run_lote(
+        [{"texto": texto} for texto in lote["texto"]],
+        max_concurrency=LOTES.get("max_concurrency"),
+        al_terminar=al_terminar
+    )
+    tabla.empty()
+
+    for campo, valores in campos.items():
+        lote[campo] = valores
+    lote["puntaje"] = pd.to_numeric(lote["puntaje"], errors="coerce")
+    matriz = sesgos_detectados(lote["analisis"])
+    # "Genero, Halo" por fila sin recorrer fila a fila
+    lote["sesgos"] = matriz.dot(matriz.columns + ", ").str.rstrip(", ")
+    return lote
+
+
+def excel_lote(lote, stats):
+    """XLSX con el detalle por evaluacion y las estadisticas del lote."""
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="openpyxl") as writer:
+        lote.drop(columns=["informe"]).to_excel(writer, sheet_name="Evaluaciones", index=False)
+        stats["resumen"].to_frame().to_excel(writer, sheet_name="Resumen")
+        stats["sesgos"].to_excel(writer, sheet_name="Sesgos")
+        stats["niveles"].to_frame().to_excel(writer, sheet_name="Niveles")
+        if stats["grupos"] is not None:
+            stats["grupos"].to_excel(writer, sheet_name="Grupos")
+    return buffer.getvalue()
+
+
+def secciones_pdf_lote(lote, stats):
+    """Secciones del informe combinado: resumen y una por evaluacion.
+
+    Todo el texto sale escapado porque reportlab lo interpreta como markup.
+    """
+    resumen = "\n".join(f"{indicador}: {valor}" for indicador, valor in stats["resumen"].items())
+    sesgos = "\n".join(
+        f"{tipo}: {fila['Evaluaciones']} ({fila['%']}%)" for tipo, fila in stats["sesgos"].iterrows()
+    )
+    secciones = [("Resumen del Lote", resumen), ("Sesgos Detectados", sesgos)]
+    for fila in lote.itertuples():
+        titulo = f"Fila {fila.fila}" + (f" - {fila.nombre}" if fila.nombre else "")
+        secciones.append((titulo, fila.informe or f"Sin resultado: {fila.error}"))
+    return [(escape(titulo), escape(str(contenido))) for titulo, contenido in secciones]
+
+
+def render_lote():
+    """Modo por lote: planilla de evaluaciones -> informe combinado."""
+    if 'sesgos_lote' not in st.session_state:
+        st.session_state.sesgos_lote = None
+
+    max_filas = LOTES.get("max_filas", 500)
+
+    # ==================== CAJA 2: PLANILLA ====================
+    with st.container(border=True):
+        st.markdown("#### Planilla de Evaluaciones")
+        st.caption(f"Una evaluacion por fila, maximo {max_filas} filas.")
+
+        archivo = st.file_uploader(
+            "Sube un archivo CSV o XLSX",
+            type=["csv", "xlsx"],
+            key="eval_archivo"
+        )
+
+        if archivo is not None:
+            try:
+                df = leer_planilla(archivo)
+            except Exception:
+                df = None
+                st.markdown('<div class="custom-error">No se pudo leer el archivo. Revisa que sea un CSV o XLSX valido.</div>', unsafe_allow_html=True)
+
+            if df is not None and df.empty:
+                st.markdown('<div class="custom-warning">El archivo no tiene filas.</div>', unsafe_allow_html=True)
+            elif df is not None:
+                columnas = list(df.columns)
+                opcionales = [SIN_COLUMNA] + columnas
+                col1, col2, col3 = st.columns(3)
+                with col1:
+                    columna_texto = st.selectbox(
+                        "Columna con la evaluacion",
+                        columnas,
+                        index=columnas.index(columna_probable(df)),
+                        key="eval_col_texto"
+                    )
+                with col2:
+                    columna_nombre = st.selectbox("Columna con el nombre", opcionales, key="eval_col_nombre")
+                with col3:
+                    columna_grupo = st.selectbox("Agrupar por (area, equipo)", opcionales, key="eval_col_grupo")
+
+                st.dataframe(df.head(5), hide_index=True, use_container_width=True)
+
+                if st.button(f"Auditar {len(df)} Evaluaciones", use_container_width=True):
+                    if len(df) > max_filas:
+                        st.markdown(f'<div class="custom-warning">El archivo tiene {len(df)} filas. Divide la planilla en partes de hasta {max_filas}.</div>', unsafe_allow_html=True)
+                    else:
+                        st.session_state.sesgos_lote = auditar_lote(
+                            df,
+                            columna_texto,
+                            columna_nombre if columna_nombre != SIN_COLUMNA else None,
+                            columna_grupo if columna_grupo != SIN_COLUMNA else None
+                        )
+
+    lote = st.session_state.sesgos_lote
+    if lote is None:
+        return
+    stats = estadisticas_sesgos(lote)
+    resumen = stats["resumen"]
+
+    # ==================== CAJA 3: RESULTADOS ====================
+    with st.container(border=True):
+        st.markdown("#### Informe del Lote")
+
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Analizadas", f"{resumen['Analizadas']}/{resumen['Evaluaciones']}")
+        col2.metric("Puntaje promedio", resumen["Puntaje promedio"] if resumen["Puntaje promedio"] is not None else "-")
+        col3.metric("% con puntaje <= 60", resumen["% hasta 60"] if resumen["% hasta 60"] is not None else "-")
+        col4.metric("Con error", resumen["Con error"])
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.markdown("Sesgos detectados")
+            st.dataframe(stats["sesgos"], use_container_width=True)
+        with col2:
+            st.markdown("Niveles de neutralidad")
+            st.bar_chart(stats["niveles"])
+
+        if stats["grupos"] is not None:
+            st.markdown("Puntaje por grupo")
+            st.dataframe(stats["grupos"], use_container_width=True)
+
+        st.markdown("Detalle por evaluacion")
+        st.dataframe(
+            lote[[c for c in ("fila", "nombre", "grupo", "puntaje", "sesgos", "analisis", "texto_neutral", "error")
+                  if c in lote.columns]],
+            hide_index=True, use_container_width=True
+        )
+
+    # ==================== CAJA 4: DESCARGA ====================
+    with st.container(border=True):
+        st.markdown("#### Descargar")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            fname = st.text_input(
+                "Nombre del archivo",
+                value="Auditoria_Sesgos_Lote",
+                key="eval_lote_fname"
+            )
+        with col2:
+            fmt = st.selectbox(
+                "Formato",
+                ["Excel (.xlsx)", "PDF", "CSV"],
+                key="eval_lote_formato"
+            )
+
+        if fmt == "PDF":
+            st.download_button(
+                "Descargar PDF",
+                data=PIPELINE.exportar("Auditoria de Sesgos - Informe del Lote", secciones_pdf_lote(lote, stats)),
+                file_name=f"{fname}.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
+        elif fmt == "CSV":
+            st.download_button(
+                "Descargar CSV",
+                data=lote.drop(columns=["informe"]).to_csv(index=False).encode("utf-8-sig"),
+                file_name=f"{fname}.csv",
+                mime="text/csv",
+                use_container_width=True
+            )
+        else:
+            st.download_button(
+                "Descargar Excel",
+                data=excel_lote(lote, stats),
+                file_name=f"{fname}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True
+            )
 
 
 def render():
@@ -71,6 +427,17 @@ def render():
             - Subjetividad: Opiniones en lugar de hechos.
             """)
 
+    modo = st.radio(
+        "Modo",
+        ["Una evaluacion", "Lote (CSV/XLSX)"],
+        horizontal=True,
+        key="eval_modo",
+        label_visibility="collapsed"
+    )
+    if modo == "Lote (CSV/XLSX)":
+        render_lote()
+        return
+
     # Estado de sesion
     if 'sesgos_resultado' not in st.session_state:
         st.session_state.sesgos_resultado = None
@@ -87,25 +454,10 @@ def render():
         )
 
         if st.button("Auditar Texto", use_container_width=True):
-            if texto_input and len(texto_input) >= 10:
-                with st.spinner("Detectando sesgos..."):
-                    data = analizar_sesgos_ai(texto_input)
-                    if data:
-                        resultado = f"""PUNTAJE DE NEUTRALIDAD: {data['puntaje']}/100
-
-ANALISIS DE SESGOS:
-{data['analisis']}
-
---------------------------------------------------
-
-VERSION CORREGIDA (Neutral):
-{data['texto_neutral']}"""
-                        st.session_state.sesgos_resultado = resultado
-                        registrar_uso("evaluacion_desempeno")
-                    else:
-                        st.markdown('<div class="custom-error">No se pudo analizar el texto. Intenta de nuevo.</div>', unsafe_allow_html=True)
-            else:
-                st.markdown('<div class="custom-warning">Escribe un texto mas completo para analizar (minimo 10 caracteres).</div>', unsafe_allow_html=True)
+            with st.spinner("Detectando sesgos..."):
+                resultado = PIPELINE.run({"texto": texto_input})
+            if resultado:
+                st.session_state.sesgos_resultado = resultado.texto
 
     # ==================== CAJA 3: RESULTADOS ====================
     if st.session_state.sesgos_resultado:
@@ -141,7 +493,7 @@ VERSION CORREGIDA (Neutral):
                 )
 
             if fmt == "PDF":
-                pdf_data = create_pdf_reportlab(
+                pdf_data = PIPELINE.exportar(
                     "Auditoria de Sesgos Inconscientes",
                     [("Informe", st.session_state.sesgos_resultado)]
                 )
@@ -160,3 +512,9 @@ VERSION CORREGIDA (Neutral):
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "evaluacion_desempeno", "sesgos_resultado", widget_key="edit_sesgos",
+        titulo="Auditorias anteriores"
+    )
@@ -3,58 +3,274 @@ Feedback Constructivo - YoCreo Suite
 Protocolo Estandar v2.0
 """
 
-import streamlit as st
-import json
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
 
-from core.config import PRACTICAS
-from core.ai_client import generate_response
-from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
-from core.analytics import registrar_uso
+import pandas as pd
+import streamlit as st
 
+from core.config import LOTES, PRACTICAS
+from core.ai_client import esquema_objeto
+from core.export import copy_button_component, render_encabezado
+from core.history import guardar_resultado, render_historial
+from core.pipeline import PracticePipeline, quitar_markdown
+from core.prompts import instruccion_sistema
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
 
+SISTEMA = instruccion_sistema("feedback_constructivo")
 
-def generar_feedback_ai(nombre, rol, queja):
-    """Genera feedback constructivo usando modelo SCI."""
-    prompt = f"""Actua como un Coach experto en Comunicacion No Violenta y el modelo SCI (Situacion, Comportamiento, Impacto).
+ESQUEMA_FEEDBACK = esquema_objeto({
+    "analisis": "Explica brevemente que juicios o carga emocional se detecto y elimino.",
+    "hechos": "Hechos objetivos detectados (lo que grabaria una camara).",
+    "guion": "Guion exacto con la estructura SCI (Situacion, Comportamiento, Impacto) + pregunta final.",
+    "consejo": "Tip breve sobre el tono o momento adecuado para decirlo."
+})
 
-DATOS DEL CASO:
-- Receptor: {nombre}
-- Relacion: {rol}
-- Queja cruda (sin filtro): "{queja}"
+ROLES = [
+    "Soy su Jefe",
+    "Somos Pares (Colegas)",
+    "Es mi Jefe",
+    "Es mi Cliente",
+    "Es mi Proveedor"
+]
 
-TU MISION:
-Transformar esta queja en un feedback profesional y constructivo.
+SECCIONES = {
+    "analisis": "ANALISIS DE JUICIOS",
+    "hechos": "HECHOS OBJETIVOS",
+    "guion": "GUION SCI",
+    "consejo": "CONSEJO"
+}
 
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. El guion debe ser directo para leer.
 
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "analisis": "Explica brevemente que juicios o carga emocional se detecto y elimino.",
-    "hechos": "Lista los hechos objetivos detectados (lo que grabaria una camara).",
-    "guion": "El guion exacto utilizando la estructura SCI (Situacion, Comportamiento, Impacto) + Pregunta final.",
-    "consejo": "Un tip breve sobre el tono o momento adecuado para decirlo."
-}}"""
-    response = generate_response(prompt)
-    if response:
-        data = limpiar_json(response)
-        if data:
-            for key in data:
-                data[key] = data[key].replace("**", "").replace("##", "")
-            return data
+def validar_caso(entradas):
+    """Mensaje para el usuario si faltan datos del caso."""
+    if not entradas["nombre"] or len(entradas["queja"] or "") < 10:
+        return "Ingresa el nombre y describe la situacion (minimo 10 caracteres)."
     return None
 
 
+def prompt_feedback(entradas):
+    """Prompt del modelo SCI con los datos del caso."""
+    return f"""DATOS DEL CASO:
+- Receptor: {entradas['nombre']}
+- Relacion: {entradas['rol']}
+- Queja cruda (sin filtro): "{entradas['queja']}\""""
+
+
+def formato_feedback(data, entradas):
+    """Texto editable del resultado."""
+    return f"""ANALISIS DE JUICIOS:
+{data['analisis']}
+
+HECHOS OBJETIVOS:
+{data['hechos']}
+
+GUION SCI:
+{data['guion']}
+
+CONSEJO:
+{data['consejo']}"""
+
+
+PIPELINE = PracticePipeline(
+    "feedback_constructivo",
+    prompt=prompt_feedback,
+    formato=formato_feedback,
+    validar=validar_caso,
+    schema=ESQUEMA_FEEDBACK,
+    system_instruction=SISTEMA,
+    secciones=SECCIONES,
+    limpiar=quitar_markdown,
+    mensaje_error="No se pudo generar el feedback. Intenta de nuevo.",
+    titulo_historial=lambda entradas: f"{entradas['nombre']}: {entradas['queja']}"
+)
+
+
+def abrir_del_historial(item):
+    st.session_state.fb_nombre = item["entradas"].get("nombre")
+
+
+# ==================== MODO EQUIPO ====================
+
+def nombre_archivo(texto):
+    return re.sub(r"[^\w\-]+", "_", texto).strip("_") or "persona"
+
+
+def generar_equipo(filas):
+    """
+    Genera el feedback de todas las filas a la vez y muestra el estado
+    de cada una apenas termina.
+
+    Returns:
+        list: dicts con nombre, rol, resultado y error (mismo orden que filas)
+    """
+    equipo = [dict(fila, resultado=None, error=None) for fila in filas]
+    estado = st.empty()
+
+    def dibujar():
+        estado.dataframe(
+            pd.DataFrame({
+                "Nombre": [p["nombre"] for p in equipo],
+                "Estado": ["Listo" if p["resultado"] else (p["error"] or "Generando...") for p in equipo]
+            }),
+            hide_index=True, use_container_width=True
+        )
+
+    def al_terminar(i, resultado, error):
+        persona = equipo[i]
+        if resultado is not None:
+            persona["resultado"] = resultado.texto
+            guardar_resultado(
+                "feedback_constructivo", filas[i], resultado.texto, data=resultado.data,
+                titulo=PIPELINE.titulo_historial(filas[i])
+            )
+        else:
+            persona["error"] = error
+        dibujar()
+
+    dibujar()
+    PIPELINE.run_lote(
+        filas,
+        max_concurrency=min(len(filas), LOTES.get("equipo_max_concurrency", 15)),
+        al_terminar=al_terminar
+    )
+    estado.empty()
+    return equipo
+
+
+def zip_equipo(equipo, como_pdf):
+    """ZIP con un archivo (PDF o TXT) por colaborador."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        for i, persona in enumerate(equipo, start=1):
+            if not persona["resultado"]:
+                continue
+            base = f"{i:02d}_Feedback_{nombre_archivo(persona['nombre'])}"
+            if como_pdf:
+                zf.writestr(f"{base}.pdf", PIPELINE.exportar(
+                    f"Feedback Constructivo para {escape(persona['nombre'])}",
+                    [("Resultado", escape(persona["resultado"]))]
+                ))
+            else:
+                zf.writestr(f"{base}.txt", persona["resultado"])
+    return buffer.getvalue()
+
+
+def render_equipo():
+    """Modo equipo: una fila por colaborador, todos generados a la vez."""
+    if 'fb_equipo_tabla' not in st.session_state:
+        st.session_state.fb_equipo_tabla = pd.DataFrame({
+            "nombre": [""] * 3,
+            "rol": [ROLES[0]] * 3,
+            "queja": [""] * 3
+        })
+    if 'fb_equipo' not in st.session_state:
+        st.session_state.fb_equipo = None
+
+    max_filas = LOTES.get("equipo_max_filas", 30)
+
+    # ==================== CAJA 2: TABLA ====================
+    with st.container(border=True):
+        st.markdown("#### Tu Equipo")
+        st.caption(f"Una fila por colaborador, hasta {max_filas}. Agrega filas con el + al final de la tabla.")
+
+        tabla = st.data_editor(
+            st.session_state.fb_equipo_tabla,
+            num_rows="dynamic",
+            column_config={
+                "nombre": st.column_config.TextColumn("Nombre", width="small"),
+                "rol": st.column_config.SelectboxColumn("Tu relacion", options=ROLES, default=ROLES[0]),
+                "queja": st.column_config.TextColumn("Situacion (sin filtros)", width="large")
+            },
+            hide_index=True,
+            use_container_width=True,
+            key="fb_equipo_editor"
+        )
+
+        if st.button("Generar Feedback del Equipo", use_container_width=True):
+            tabla = tabla.fillna("")
+            llenas = tabla[(tabla["nombre"].str.strip() != "") | (tabla["queja"].str.strip() != "")]
+            if llenas.empty:
+                st.markdown('<div class="custom-warning">Completa al menos una fila con nombre y situacion.</div>', unsafe_allow_html=True)
+            elif len(llenas) > max_filas:
+                st.markdown(f'<div class="custom-warning">Puedes generar hasta {max_filas} feedbacks a la vez.</div>', unsafe_allow_html=True)
+            else:
+                filas = [
+                    {"nombre": f.nombre.strip(), "rol": f.rol or ROLES[0], "queja": f.queja.strip()}
+                    for f in llenas.itertuples()
+                ]
+                st.session_state.fb_equipo = generar_equipo(filas)
+                # Los textos editables toman los resultados nuevos
+                for i in range(len(filas)):
+                    st.session_state.pop(f"edit_fb_equipo_{i}", None)
+
+    equipo = st.session_state.fb_equipo
+    if not equipo:
+        return
+
+    # ==================== CAJA 3: RESULTADOS ====================
+    with st.container(border=True):
+        st.markdown("#### Feedback del Equipo")
+
+        for i, persona in enumerate(equipo):
+            with st.expander(persona["nombre"] or f"Fila {i + 1}", expanded=len(equipo) == 1):
+                if persona["resultado"] is None:
+                    st.markdown(f'<div class="custom-error">{persona["error"]}</div>', unsafe_allow_html=True)
+                    continue
+                persona["resultado"] = st.text_area(
+                    "Feedback editable:",
+                    value=persona["resultado"],
+                    height=300,
+                    key=f"edit_fb_equipo_{i}",
+                    label_visibility="collapsed"
+                )
+                copy_button_component(persona["resultado"], key=f"copy_fb_equipo_{i}")
+
+    listos = [p for p in equipo if p["resultado"]]
+    if not listos:
+        return
+
+    # ==================== CAJA 4: DESCARGA ====================
+    with st.container(border=True):
+        st.markdown("#### Descargar")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            fname = st.text_input(
+                "Nombre del archivo",
+                value="Feedback_Equipo",
+                key="fb_equipo_fname"
+            )
+        with col2:
+            fmt = st.selectbox(
+                "Formato",
+                ["PDF combinado", "ZIP (un PDF por persona)", "ZIP (un TXT por persona)"],
+                key="fb_equipo_formato"
+            )
+
+        if fmt == "PDF combinado":
+            st.download_button(
+                "Descargar PDF",
+                data=PIPELINE.exportar(
+                    "Feedback Constructivo del Equipo (Modelo SCI)",
+                    [(escape(p["nombre"]), escape(p["resultado"])) for p in listos]
+                ),
+                file_name=f"{fname}.pdf",
+                mime="application/pdf",
+                use_container_width=True
+            )
+        else:
+            st.download_button(
+                "Descargar ZIP",
+                data=zip_equipo(equipo, como_pdf=fmt.startswith("ZIP (un PDF")),
+                file_name=f"{fname}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
+
+
 def render():
     """Renderiza la practica Feedback Constructivo."""
     info = PRACTICAS["feedback_constructivo"]
@@ -72,6 +288,17 @@ def render():
             - Impacto: Consecuencia en ti o el equipo.
             """)
 
+    modo = st.radio(
+        "Modo",
+        ["Una persona", "Equipo (tabla)"],
+        horizontal=True,
+        key="fb_modo",
+        label_visibility="collapsed"
+    )
+    if modo == "Equipo (tabla)":
+        render_equipo()
+        return
+
     # Estado de sesion
     if 'fb_resultado' not in st.session_state:
         st.session_state.fb_resultado = None
@@ -92,13 +319,7 @@ def render():
         with col2:
             rol_input = st.selectbox(
                 "Tu relacion con ella",
-                [
-                    "Soy su Jefe",
-                    "Somos Pares (Colegas)",
-                    "Es mi Jefe",
-                    "Es mi Cliente",
-                    "Es mi Proveedor"
-                ],
+                ROLES,
                 key="fb_rol"
             )
 
@@ -110,28 +331,11 @@ def render():
         )
 
         if st.button("Generar Feedback", use_container_width=True):
-            if nombre_input and queja_input and len(queja_input) >= 10:
-                with st.spinner("Analizando hechos y filtrando emociones..."):
-                    data = generar_feedback_ai(nombre_input, rol_input, queja_input)
-                    if data:
-                        resultado = f"""ANALISIS DE JUICIOS:
-{data['analisis']}
-
-HECHOS OBJETIVOS:
-{data['hechos']}
-
-GUION SCI:
-{data['guion']}
-
-CONSEJO:
-{data['consejo']}"""
-                        st.session_state.fb_resultado = resultado
-                        st.session_state.fb_nombre = nombre_input
-                        registrar_uso("feedback_constructivo")
-                    else:
-                        st.markdown('<div class="custom-error">No se pudo generar el feedback. Intenta de nuevo.</div>', unsafe_allow_html=True)
-            else:
-                st.markdown('<div class="custom-warning">Ingresa el nombre y describe la situacion (minimo 10 caracteres).</div>', unsafe_allow_html=True)
+            with st.spinner("Analizando hechos y filtrando emociones..."):
+                resultado = PIPELINE.run({"nombre": nombre_input, "rol": rol_input, "queja": queja_input})
+            if resultado:
+                st.session_state.fb_resultado = resultado.texto
+                st.session_state.fb_nombre = nombre_input
 
     # ==================== CAJA 3: RESULTADOS ====================
     if st.session_state.fb_resultado:
@@ -167,7 +371,7 @@ CONSEJO:
                 )
 
             if fmt == "PDF":
-                pdf_data = create_pdf_reportlab(
+                pdf_data = PIPELINE.exportar(
                     "Feedback Constructivo (Modelo SCI)",
                     [("Resultado", st.session_state.fb_resultado)]
                 )
@@ -186,3 +390,9 @@ CONSEJO:
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "feedback_constructivo", "fb_resultado", widget_key="edit_fb",
+        al_abrir=abrir_del_historial, titulo="Feedbacks anteriores"
+    )
@@ -4,57 +4,56 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, render_job, submit_generation
+from core.ai_jobs import Job
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.history import guardar_resultado, render_historial
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
+SISTEMA = instruccion_sistema("negociador_harvard")
+
+ESQUEMA_NEGOCIACION = esquema_objeto({
+    "diagnostico": "Analisis breve del poder y el MAAN.",
+    "estrategia_creativa": "Propuesta de valor y frase de apertura (speech exacto).",
+    "criterios": "Criterios objetivos a utilizar si se ponen duros.",
+    "preguntas": "3 preguntas poderosas para descubrir informacion."
+})
+
+
+def interpretar_negociacion(response):
+    """Convierte la respuesta de la IA en las secciones de la estrategia."""
+    data = limpiar_json(response, ESQUEMA_NEGOCIACION) if response else None
+    if not data:
         return None
+    for key in data:
+        data[key] = data[key].replace("**", "").replace("##", "")
+    return data
 
 
 def generar_negociacion_ai(rol, contraparte, problema, intereses_mios, intereses_ellos, maan):
-    """Genera estrategia de negociacion estilo Harvard."""
-    prompt = f"""Actua como un Experto en Negociacion del 'Harvard Negotiation Project' (Fisher & Ury).
-
-CONTEXTO:
+    """
+    Lanza en segundo plano la estrategia de negociacion estilo Harvard.
+    Retorna el id del trabajo; el resultado se recoge con render_job.
+    """
+    prompt = f"""CONTEXTO:
 - Usuario: {rol}
 - Contraparte: {contraparte}
 - Conflicto: {problema}
 - Intereses Usuario: {intereses_mios}
 - Intereses Contraparte: {intereses_ellos}
-- MAAN (Plan B): {maan}
-
-TAREA: Genera una hoja de ruta estrategica.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. Usa vinetas simples (-) para listas.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "diagnostico": "Analisis breve del poder y el MAAN...",
-    "estrategia_creativa": "Propuesta de valor y frase de apertura (Speech exacto)...",
-    "criterios": "Criterios objetivos a utilizar si se ponen duros...",
-    "preguntas": "3 preguntas poderosas para descubrir informacion..."
-}}"""
-    response = generate_response(prompt)
-    if response:
-        data = limpiar_json(response)
-        if data:
-            for key in data:
-                data[key] = data[key].replace("**", "").replace("##", "")
-            return data
-    return None
+- MAAN (Plan B): {maan}"""
+    return submit_generation(
+        prompt,
+        practice_key="negociador_harvard",
+        parse=interpretar_negociacion,
+        response_schema=ESQUEMA_NEGOCIACION,
+        system_instruction=SISTEMA
+    )
 
 
 def render():
@@ -121,12 +120,28 @@ def render():
             key="harvard_maan"
         )
 
-        if st.button("Generar Estrategia", use_container_width=True):
+        # La generacion corre en segundo plano: si el usuario navega, el
+        # resultado lo espera en harvard_job hasta que vuelva
+        en_curso = bool(st.session_state.get("harvard_job"))
+        if st.button("Generar Estrategia", use_container_width=True, disabled=en_curso):
             if rol and intereses_mios and maan:
-                with st.spinner("Analizando intereses y opciones..."):
-                    data = generar_negociacion_ai(rol, contraparte, problema, intereses_mios, intereses_ellos, maan)
-                    if data:
-                        resultado = f"""DIAGNOSTICO:
+                st.session_state.harvard_job = generar_negociacion_ai(
+                    rol, contraparte, problema, intereses_mios, intereses_ellos, maan
+                )
+                # Las entradas enviadas: el formulario puede cambiar mientras corre
+                st.session_state.harvard_entradas = {
+                    "rol": rol, "contraparte": contraparte, "problema": problema,
+                    "intereses_mios": intereses_mios, "intereses_ellos": intereses_ellos, "maan": maan
+                }
+            else:
+                st.markdown('<div class="custom-warning">Define al menos tu Rol, tus Intereses y tu MAAN.</div>', unsafe_allow_html=True)
+
+        job = render_job("harvard_job", "Analizando intereses y opciones...")
+        entradas = st.session_state.pop("harvard_entradas", None) if job is not None else None
+        if job is not None and job.estado == Job.LISTO:
+            data = job.resultado
+            if data:
+                resultado = f"""DIAGNOSTICO:
 {data['diagnostico']}
 
 ESTRATEGIA:
@@ -137,12 +152,17 @@ CRITERIOS:
 
 PREGUNTAS:
 {data['preguntas']}"""
-                        st.session_state.harvard_resultado = resultado
-                        registrar_uso("negociador_harvard")
-                    else:
-                        st.markdown('<div class="custom-error">No se pudo generar la estrategia. Intenta de nuevo.</div>', unsafe_allow_html=True)
+                st.session_state.harvard_resultado = resultado
+                # El widget editable toma el valor nuevo en vez del anterior
+                st.session_state.pop("edit_harvard", None)
+                if entradas:
+                    guardar_resultado(
+                        "negociador_harvard", entradas, resultado, data=data,
+                        titulo=f"{entradas['contraparte'] or entradas['rol']}: {entradas['problema'] or entradas['maan']}"
+                    )
+                registrar_uso("negociador_harvard")
             else:
-                st.markdown('<div class="custom-warning">Define al menos tu Rol, tus Intereses y tu MAAN.</div>', unsafe_allow_html=True)
+                st.markdown('<div class="custom-error">No se pudo generar la estrategia. Intenta de nuevo.</div>', unsafe_allow_html=True)
 
     # ==================== CAJA 3: RESULTADOS ====================
     if st.session_state.harvard_resultado:
@@ -197,3 +217,9 @@ PREGUNTAS:
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "negociador_harvard", "harvard_resultado", widget_key="edit_harvard",
+        titulo="Estrategias anteriores"
+    )
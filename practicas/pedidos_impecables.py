@@ -4,52 +4,43 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 from datetime import date
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("pedidos_impecables")
+
+ESQUEMA_PEDIDO = esquema_objeto({
+    "carta": "Texto completo de la carta."
+})
+
+SECCIONES = {
+    "carta": "CARTA"
+}
 
 
 def generar_pedido_ai(oyente, accion, condiciones, tiempo, trasfondo):
     """Genera una carta formal con un pedido impecable."""
-    prompt = f"""Actua como un experto en comunicacion corporativa y ontologia del lenguaje.
-Redacta una CARTA FORMAL que constituya un PEDIDO IMPECABLE.
-
-DATOS DEL PEDIDO:
+    prompt = f"""DATOS DEL PEDIDO:
 1. DESTINATARIO: {oyente}
 2. ACCION REQUERIDA: {accion}
 3. CONDICIONES DE SATISFACCION: {condiciones}
 4. FECHA LIMITE: {tiempo}
-5. CONTEXTO/TRASFONDO: {trasfondo}
-
-INSTRUCCIONES:
-- El texto debe ser solo el cuerpo de la carta/mensaje.
-- Debe ser directo, amable pero firme, y muy claro.
-- Justo antes de la despedida, incluye una frase que busque el COMPROMISO del receptor.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "carta": "Texto completo de la carta..."
-}}"""
-    response = generate_response(prompt)
+5. CONTEXTO/TRASFONDO: {trasfondo}"""
+    response = generate_response_live(
+        prompt, practice_key="pedidos_impecables", response_schema=ESQUEMA_PEDIDO,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_PEDIDO)
+        if data:
+            return data
     return None
 
 
@@ -4,7 +4,6 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 from io import BytesIO
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
@@ -12,41 +11,47 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib import colors
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("planificador_reuniones")
+
+ESQUEMA_AGENDA = esquema_objeto({
+    "agenda": {
+        "type": "array",
+        "description": "Bloques de la reunion en orden cronologico.",
+        "items": esquema_objeto({
+            "minutos": "Rango de minutos, ej: 00-05.",
+            "actividad": "Actividad del bloque.",
+            "responsable": "Quien conduce el bloque."
+        })
+    },
+    "consejos": "Consejos para facilitar la reunion."
+})
+
+SECCIONES = {
+    "agenda": "AGENDA",
+    "consejos": "CONSEJOS"
+}
 
 
 def generar_planificacion_ai(tema, objetivo, duracion):
     """Genera agenda de reunion estructurada."""
-    prompt = f"""Actua como un Facilitador Experto. Disena una agenda para una reunion de {duracion} minutos.
-TEMA: {tema}
+    prompt = f"""TEMA: {tema}
 OBJETIVO: {objetivo}
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "agenda": [
-        {{"minutos": "00-05", "actividad": "Inicio y contexto", "responsable": "Lider"}},
-        {{"minutos": "05-15", "actividad": "...", "responsable": "..."}}
-    ],
-    "consejos": "Consejo 1. Consejo 2."
-}}"""
-    response = generate_response(prompt)
+DURACION: {duracion} minutos"""
+    response = generate_response_live(
+        prompt, practice_key="planificador_reuniones", response_schema=ESQUEMA_AGENDA,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_AGENDA)
+        if data:
+            return data
     return None
 
 
@@ -4,60 +4,35 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("preguntas_desafiantes")
+
+ESQUEMA_GROW = esquema_objeto({
+    "guia": "Texto completo de la guia de preguntas con la estructura indicada."
+})
+
+SECCIONES = {
+    "guia": "GUIA DE CONVERSACION"
+}
 
 
 def generar_grow_ai(situacion):
     """Genera preguntas de coaching usando modelo GROW."""
-    prompt = f"""Actua como un Master Coach Ejecutivo experto en el modelo GROW.
-CONTEXTO: Un lider presenta la siguiente situacion con su equipo: "{situacion}".
-
-OBJETIVO: Generar una "Guia de Conversacion" con preguntas poderosas.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
-3. Usa vinetas simples (-) para listar las preguntas.
-4. Usa MAYUSCULAS para los titulos de las etapas (ej: META, REALIDAD).
-
-ESTRUCTURA:
-META
-- Pregunta 1
-- Pregunta 2
-
-REALIDAD
-- Pregunta 1
-- Pregunta 2
-
-OPCIONES
-- Pregunta 1
-- Pregunta 2
-
-VOLUNTAD
-- Pregunta 1
-- Pregunta 2
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "guia": "Texto completo de la guia de preguntas..."
-}}"""
-    response = generate_response(prompt)
+    prompt = f"""CONTEXTO: Un lider presenta la siguiente situacion con su equipo: "{situacion}"."""
+    response = generate_response_live(
+        prompt, practice_key="preguntas_desafiantes", response_schema=ESQUEMA_GROW,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        data = limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_GROW)
         if data:
             data['guia'] = data['guia'].replace("**", "").replace("##", "").replace("__", "")
             return data
@@ -4,53 +4,44 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("presentacion_inspiradora")
 
+ESQUEMA_HISTORIA = esquema_objeto({
+    "gancho": "La frase de apertura.",
+    "acto_1": "Narrativa del problema (El Dragon).",
+    "acto_2": "Narrativa de la solucion (La Espada).",
+    "acto_3": "Narrativa del futuro (El Tesoro).",
+    "metafora": "Una analogia visual breve."
+})
 
-def generar_historia_ai(dato_duro, audiencia):
-    """Genera una narrativa inspiradora usando storytelling."""
-    prompt = f"""Actúa como un Guionista de TED Talks experto en Storytelling.
-
-TU MISION: Transformar un "dato aburrido" en una narrativa emocionante usando la estructura del "VIAJE DEL HEROE".
-
-AUDIENCIA: {audiencia}
-INPUT (Dato crudo): "{dato_duro}"
-
-ESTRUCTURA OBLIGATORIA:
-1. EL GANCHO: Frase inicial.
-2. ACTO 1 (El Dragón): El problema.
-3. ACTO 2 (La Espada): La solución.
-4. ACTO 3 (El Tesoro): El futuro.
+SECCIONES = {
+    "gancho": "GANCHO (Apertura)",
+    "acto_1": "ACTO 1 (El Desafío)",
+    "acto_2": "ACTO 2 (La Estrategia)",
+    "acto_3": "ACTO 3 (El Futuro)",
+    "metafora": "METAFORA VISUAL"
+}
 
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio.
 
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "gancho": "La frase de apertura...",
-    "acto_1": "Narrativa del problema (El Dragon)...",
-    "acto_2": "Narrativa de la solucion (La Espada)...",
-    "acto_3": "Narrativa del futuro (El Tesoro)...",
-    "metafora": "Una analogia visual breve."
-}}"""
-    response = generate_response(prompt)
+def generar_historia_ai(dato_duro, audiencia):
+    """Genera una narrativa inspiradora usando storytelling."""
+    prompt = f"""AUDIENCIA: {audiencia}
+INPUT (Dato crudo): "{dato_duro}\""""
+    response = generate_response_live(
+        prompt, practice_key="presentacion_inspiradora", response_schema=ESQUEMA_HISTORIA,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        data = limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_HISTORIA)
         if data:
             for key in data:
                 data[key] = data[key].replace("**", "").replace("##", "")
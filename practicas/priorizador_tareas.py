@@ -3,54 +3,262 @@ Priorizador de Tareas - YoCreo Suite
 Protocolo Estandar v2.0
 """
 
+import hashlib
+import re
+import unicodedata
+
 import streamlit as st
-import json
 
-from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.config import PRACTICAS, PRIORIZADOR
+from core.ai_client import esquema_objeto, generate_many, generate_response, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.history import (
+    clasificaciones_guardadas, guardar_clasificaciones, guardar_resultado, render_historial
+)
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("priorizador_tareas")
+SISTEMA_BLOQUE = instruccion_sistema("priorizador_tareas.clasificacion")
+SISTEMA_CONSEJO = instruccion_sistema("priorizador_tareas.consejo")
+
+ESQUEMA_EISENHOWER = esquema_objeto({
+    "hacer_ya": "Tareas urgentes e importantes, una por linea con guion (- ).",
+    "planificar": "Tareas importantes no urgentes, una por linea con guion (- ).",
+    "delegar": "Tareas urgentes no importantes, una por linea con guion (- ).",
+    "eliminar": "Tareas ni urgentes ni importantes, una por linea con guion (- ).",
+    "consejo_final": "Consejo breve."
+})
+
+SECCIONES = {
+    "hacer_ya": "1. HACER YA (Urgente + Importante)",
+    "planificar": "2. PLANIFICAR (No urgente + Importante)",
+    "delegar": "3. DELEGAR (Urgente + No importante)",
+    "eliminar": "4. ELIMINAR (No urgente + No importante)",
+    "consejo_final": "CONSEJO ESTRATEGICO"
+}
+
+
+CUADRANTES = ("hacer_ya", "planificar", "delegar", "eliminar")
+
+ESQUEMA_BLOQUE = esquema_objeto({
+    cuadrante: {
+        "type": "array",
+        "items": {"type": "integer"},
+        "description": f"Numeros de las tareas del bloque que van en {cuadrante}."
+    }
+    for cuadrante in CUADRANTES
+})
+
+ESQUEMA_CONSEJO = esquema_objeto({
+    "consejo_final": "Consejo estrategico breve."
+})
+
+# Vinetas, numeracion o casillas al inicio de cada linea pegada
+_VINETA = re.compile(r"^\s*(?:[-*\u2022\u00b7\u2013]|\d+[.)]|\[[ xX]?\])\s*")
+_PUNTUACION = re.compile(r"[^\w\s]")
+
+
+def clave_tarea(tarea):
+    """Clave para detectar duplicados: sin mayusculas, tildes ni puntuacion."""
+    texto = unicodedata.normalize("NFKD", tarea.casefold())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(_PUNTUACION.sub(" ", texto).split())
 
 
-def priorizar_tareas(lista_tareas, rol):
-    """Usa IA para clasificar tareas en la Matriz Eisenhower."""
-    prompt = f"""Actua como un Experto en Productividad.
-Rol del usuario: "{rol}".
+def hash_tarea(tarea):
+    """Hash de la tarea en el backlog: tareas con la misma clave comparten cuadrante"""
+    return hashlib.sha256(clave_tarea(tarea).encode("utf-8")).hexdigest()[:16]
+
+
+def normalizar_tareas(texto):
+    """
+    Separa la lista pegada en tareas (una por linea), sin vinetas ni
+    lineas vacias, y quita las repetidas conservando la primera.
+
+    Returns:
+        tuple: (tareas en el orden original, cantidad de repetidas omitidas)
+    """
+    vistas = set()
+    tareas = []
+    repetidas = 0
+    for linea in texto.splitlines():
+        tarea = " ".join(_VINETA.sub("", linea).split())
+        clave = clave_tarea(tarea)
+        if not clave:
+            continue
+        if clave in vistas:
+            repetidas += 1
+        else:
+            vistas.add(clave)
+            tareas.append(tarea)
+    return tareas, repetidas
+
+
+def vinetas(tareas):
+    return "\n".join(f"- {tarea}" for tarea in tareas) if tareas else "(Sin tareas)"
+
+
+def priorizar_directo(tareas, rol):
+    """Lista corta: una sola llamada clasifica y da el consejo."""
+    prompt = f"""Rol del usuario: "{rol}".
 Lista de tareas:
-"{lista_tareas}"
-
-Tu tarea:
-1. Clasificar las tareas en la Matriz Eisenhower.
-2. Debes devolver las tareas como una lista con vinetas (usando "- ").
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *, ni encabezados #).
-2. Texto plano limpio.
-
-RESPONDE SOLO JSON:
-{{
-    "hacer_ya": "- Tarea 1\\n- Tarea 2...",
-    "planificar": "- Tarea A\\n- Tarea B...",
-    "delegar": "- Tarea X\\n- Tarea Y...",
-    "eliminar": "- Tarea Z...",
-    "consejo_final": "Consejo breve..."
-}}"""
-
-    response = generate_response(prompt)
+"{vinetas(tareas)}\""""
+
+    response = generate_response_live(
+        prompt, practice_key="priorizador_tareas", response_schema=ESQUEMA_EISENHOWER,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_EISENHOWER)
+        if data:
+            return data
     return None
 
 
+def prompt_bloque(bloque, rol):
+    numeradas = "\n".join(f"{i}. {tarea}" for i, tarea in enumerate(bloque, start=1))
+    return f"""Rol del usuario: "{rol}".
+Bloque de tareas:
+{numeradas}"""
+
+
+def clasificar_bloques(tareas, rol):
+    """
+    Clasifica las tareas por bloques en paralelo. Cada bloque responde
+    solo numeros, asi la salida no crece con el largo de las tareas.
+
+    Returns:
+        list: cuadrante de cada tarea (None si no se pudo clasificar)
+    """
+    n = PRIORIZADOR.get("tareas_por_bloque", 40)
+    inicios = range(0, len(tareas), n)
+    prompts = [prompt_bloque(tareas[inicio:inicio + n], rol) for inicio in inicios]
+    respuestas = generate_many(
+        prompts,
+        max_concurrency=PRIORIZADOR.get("max_concurrency"),
+        # Clave propia: el presupuesto de tokens de salida de estos bloques
+        # (solo numeros) no debe achicar el de la llamada completa
+        practice_key="priorizador_tareas.bloques",
+        response_schema=ESQUEMA_BLOQUE,
+        system_instruction=SISTEMA_BLOQUE
+    )
+
+    cuadrantes = [None] * len(tareas)
+    for inicio, respuesta in zip(inicios, respuestas):
+        data = limpiar_json(respuesta, ESQUEMA_BLOQUE) if respuesta else None
+        if data is None:
+            continue
+        largo = min(n, len(tareas) - inicio)
+        # Si un numero viene en dos cuadrantes gana el mas prioritario
+        for cuadrante in reversed(CUADRANTES):
+            for numero in data.get(cuadrante) or ():
+                if isinstance(numero, int) and 1 <= numero <= largo:
+                    cuadrantes[inicio + numero - 1] = cuadrante
+    return cuadrantes
+
+
+def consejo_matriz(matriz, rol):
+    """Llamada corta final: consejo a partir del resumen de la matriz."""
+    resumen = "\n".join(
+        f"{cuadrante}: {len(matriz[cuadrante])} tareas. Ej: {'; '.join(matriz[cuadrante][:8]) or '-'}"
+        for cuadrante in CUADRANTES
+    )
+    prompt = f"""Rol del usuario: "{rol}".
+Resumen de la matriz:
+{resumen}"""
+    response = generate_response(
+        prompt, practice_key="priorizador_tareas.consejo", response_schema=ESQUEMA_CONSEJO,
+        system_instruction=SISTEMA_CONSEJO
+    )
+    data = limpiar_json(response, ESQUEMA_CONSEJO) if response else None
+    if data:
+        return data["consejo_final"].replace("**", "").replace("##", "")
+    return "Empieza por HACER YA, agenda hoy un bloque para PLANIFICAR y delega o elimina el resto."
+
+
+def cuadrantes_directos(tareas, data):
+    """Cuadrante de cada tarea segun las listas de la respuesta directa (por clave)"""
+    por_clave = {}
+    for cuadrante in CUADRANTES:
+        for linea in str(data.get(cuadrante) or "").splitlines():
+            clave = clave_tarea(_VINETA.sub("", linea))
+            if clave:
+                por_clave.setdefault(clave, cuadrante)
+    return [por_clave.get(clave_tarea(tarea)) for tarea in tareas]
+
+
+def armar_matriz(tareas, cuadrantes, rol):
+    """
+    Une la matriz en el orden original de las tareas y pide solo el
+    consejo. Las tareas sin cuadrante van a `sin_clasificar`.
+    """
+    if not any(cuadrantes):
+        return None
+    matriz = {cuadrante: [] for cuadrante in CUADRANTES}
+    sin_clasificar = []
+    for tarea, cuadrante in zip(tareas, cuadrantes):
+        (matriz[cuadrante] if cuadrante else sin_clasificar).append(tarea)
+
+    data = {cuadrante: vinetas(matriz[cuadrante]) for cuadrante in CUADRANTES}
+    data["consejo_final"] = consejo_matriz(matriz, rol)
+    if sin_clasificar:
+        data["sin_clasificar"] = vinetas(sin_clasificar)
+    return data
+
+
+def priorizar_incremental(tareas, rol, reclasificar=False):
+    """
+    Reusa el cuadrante guardado de las tareas que el usuario ya habia
+    priorizado con el mismo rol: solo las nuevas o editadas van a la IA
+    (por bloques), asi el costo depende del cambio y no del backlog.
+    Con reclasificar se ignora lo guardado y se sobrescribe.
+    """
+    contexto = clave_tarea(rol)
+    hashes = [hash_tarea(tarea) for tarea in tareas]
+    if reclasificar:
+        guardadas = {}
+    else:
+        dias = PRIORIZADOR.get("max_edad_dias")
+        guardadas = clasificaciones_guardadas(contexto, dias * 86400 if dias else None)
+
+    if not guardadas and len(tareas) <= PRIORIZADOR.get("umbral", 40):
+        # Primera lista corta: una sola llamada, y se guarda lo que calce
+        data = priorizar_directo(tareas, rol)
+        if data:
+            cuadrantes = cuadrantes_directos(tareas, data)
+            guardar_clasificaciones(
+                contexto, {h: c for h, c in zip(hashes, cuadrantes) if c}, hashes
+            )
+        return data
+
+    cuadrantes = [guardadas.get(h) for h in hashes]
+    pendientes = [i for i, cuadrante in enumerate(cuadrantes) if cuadrante is None]
+    if pendientes:
+        nuevos = clasificar_bloques([tareas[i] for i in pendientes], rol)
+        for i, cuadrante in zip(pendientes, nuevos):
+            cuadrantes[i] = cuadrante
+    guardar_clasificaciones(
+        contexto, {hashes[i]: cuadrantes[i] for i in pendientes if cuadrantes[i]}, hashes
+    )
+    data = armar_matriz(tareas, cuadrantes, rol)
+    if data:
+        data["reutilizadas"] = len(tareas) - len(pendientes)
+    return data
+
+
+def priorizar_tareas(tareas, rol, reclasificar=False):
+    """Usa IA para clasificar tareas (ya sin duplicados) en la Matriz Eisenhower."""
+    if PRIORIZADOR.get("incremental", True):
+        return priorizar_incremental(tareas, rol, reclasificar)
+    if len(tareas) <= PRIORIZADOR.get("umbral", 40):
+        return priorizar_directo(tareas, rol)
+    # Lista grande: bloques en paralelo (map) y union local (reduce)
+    return armar_matriz(tareas, clasificar_bloques(tareas, rol), rol)
+
+
 def render():
     """Renderiza la practica Priorizador de Tareas."""
     info = PRACTICAS["priorizador_tareas"]
@@ -90,12 +298,28 @@ def render():
             key="priorizador_lista"
         )
 
+        reclasificar = False
+        if PRIORIZADOR.get("incremental", True):
+            reclasificar = st.checkbox(
+                "Reclasificar todo",
+                help="Ignora las prioridades guardadas de tareas anteriores y vuelve a clasificar la lista completa.",
+                key="priorizador_reclasificar"
+            )
+
         if st.button("Priorizar Tareas", use_container_width=True):
-            if lista:
+            tareas, repetidas = normalizar_tareas(lista)
+            max_tareas = PRIORIZADOR.get("max_tareas", 2000)
+            if len(tareas) > max_tareas:
+                st.markdown(f'<div class="custom-warning">La lista tiene {len(tareas)} tareas. Prioriza hasta {max_tareas} a la vez.</div>', unsafe_allow_html=True)
+            elif tareas:
                 rol_final = rol if rol else "Profesional"
+                if repetidas > 0:
+                    st.markdown(f'<div class="custom-info">Se omitieron {repetidas} tareas repetidas.</div>', unsafe_allow_html=True)
                 with st.spinner("Organizando prioridades..."):
-                    res = priorizar_tareas(lista, rol_final)
+                    res = priorizar_tareas(tareas, rol_final, reclasificar)
                     if res and "hacer_ya" in res:
+                        if res.get("reutilizadas"):
+                            st.markdown(f'<div class="custom-info">{res["reutilizadas"]} tareas ya estaban priorizadas; solo se clasificaron las {len(tareas) - res["reutilizadas"]} nuevas o editadas.</div>', unsafe_allow_html=True)
                         resultado = f"""1. HACER YA (Urgente + Importante)
 {res['hacer_ya']}
 
@@ -110,7 +334,15 @@ def render():
 
 CONSEJO ESTRATEGICO:
 {res['consejo_final']}"""
+                        if res.get("sin_clasificar"):
+                            resultado += f"""
+
+SIN CLASIFICAR (revisalas tu)
+{res['sin_clasificar']}"""
                         st.session_state.eisen_resultado = resultado
+                        guardar_resultado(
+                            "priorizador_tareas", {"lista": lista, "rol": rol_final}, resultado, data=res
+                        )
                         registrar_uso("priorizador_tareas")
                     else:
                         st.markdown('<div class="custom-error">No se pudo generar la priorizacion. Intenta de nuevo.</div>', unsafe_allow_html=True)
@@ -170,3 +402,9 @@ CONSEJO ESTRATEGICO:
                     mime="text/plain",
                     use_container_width=True
                 )
+
+    # ==================== HISTORIAL ====================
+    render_historial(
+        "priorizador_tareas", "eisen_resultado", widget_key="edit_eisen",
+        titulo="Priorizaciones anteriores"
+    )
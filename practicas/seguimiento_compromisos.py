@@ -4,47 +4,45 @@ Protocolo Estandar v2.0
 """
 
 import streamlit as st
-import json
 
 from core.config import PRACTICAS
-from core.ai_client import generate_response
+from core.ai_client import esquema_objeto, generate_response_live
 from core.export import copy_button_component, create_pdf_reportlab, render_encabezado
 from core.analytics import registrar_uso
+from core.jsonparse import limpiar_json
+from core.prompts import instruccion_sistema
 
 
-def limpiar_json(texto):
-    """Limpia la respuesta de la IA para obtener JSON valido."""
-    try:
-        texto_limpio = texto.replace("```json", "").replace("```", "").strip()
-        return json.loads(texto_limpio)
-    except:
-        return None
+SISTEMA = instruccion_sistema("seguimiento_compromisos")
+
+ESQUEMA_SEGUIMIENTO = esquema_objeto({
+    "suave": "Texto version amable (recordatorio).",
+    "firme": "Texto version directa (reclamo).",
+    "formal": "Texto version urgente (ultimatum)."
+})
+
+SECCIONES = {
+    "suave": "OPCION 1: SUAVE (Recordatorio)",
+    "firme": "OPCION 2: FIRME (Reclamo)",
+    "formal": "OPCION 3: FORMAL (Ultimatum)"
+}
 
 
 def generar_seguimiento_ai(compromiso, persona, relacion, intentos_previos, urgencia, consecuencias):
     """Genera mensajes de seguimiento en 3 tonos."""
-    prompt = f"""Eres un experto en comunicacion asertiva y seguimiento de compromisos.
-CONTEXTO:
+    prompt = f"""CONTEXTO:
 - Compromiso: {compromiso}
 - Responsable: {persona} ({relacion})
 - Intentos previos: {intentos_previos} | Urgencia: {urgencia}
-- Consecuencias: {consecuencias}
-
-OBJETIVO: Genera 3 versiones del mensaje de seguimiento.
-
-REGLAS DE FORMATO:
-1. NO uses Markdown (ni negritas **, ni cursivas *).
-2. Texto plano limpio, listo para copiar.
-
-Responde EXCLUSIVAMENTE con un JSON valido:
-{{
-    "suave": "Texto version amable (recordatorio)...",
-    "firme": "Texto version directa (reclamo)...",
-    "formal": "Texto version urgente (ultimatum)..."
-}}"""
-    response = generate_response(prompt)
+- Consecuencias: {consecuencias}"""
+    response = generate_response_live(
+        prompt, practice_key="seguimiento_compromisos", response_schema=ESQUEMA_SEGUIMIENTO,
+        system_instruction=SISTEMA, secciones=SECCIONES
+    )
     if response:
-        return limpiar_json(response)
+        data = limpiar_json(response, ESQUEMA_SEGUIMIENTO)
+        if data:
+            return data
     return None
 
 